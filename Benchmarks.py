@@ -0,0 +1,325 @@
+import os
+import sys
+import json
+import time
+import platform
+import argparse
+import tempfile
+import subprocess
+import numpy as np
+from Circuit import *
+from StampPlan import normalize_state
+from util import Solvers
+
+
+# number of components of the generated circuits when no sizes are given
+SIZES = (10, 100, 1000, 10000, 100000)
+
+STAGES = ("construct", "save", "load", "compile", "assemble", "solve")
+
+
+def rc_ladder(size):
+    """
+    a ladder of series resistors and shunt capacitors driven by a voltage source
+    :type size: int
+    :param size: approximate number of components
+    """
+
+    circ = Circuit("Ladder")
+    ground = Node("GND", True)
+    circ.add_node(ground)
+
+    prev = Node("N0")
+    circ.add_node(prev)
+    VoltageSource("V0", ground, prev, 1)
+
+    for i in range(1, max(1, size // 2) + 1):
+        node = Node("N{}".format(i))
+        circ.add_node(node)
+        Resistor("R{}".format(i), prev, node, 1e3)
+        Capacitor("C{}".format(i), ground, node, 1e-9)
+        prev = node
+
+    return circ
+
+
+def resistor_mesh(size):
+    """
+    a square grid of resistors between neighbouring nodes, driven by a current source at one corner and grounded at
+    the opposite one
+    :type size: int
+    :param size: approximate number of components
+    """
+
+    # an n by n grid holds 2 n (n - 1) resistors
+    n = max(2, int(round(np.sqrt(size / 2))) + 1)
+
+    circ = Circuit("Mesh")
+    nodes = [[Node("N{}_{}".format(i, j), i == n - 1 and j == n - 1) for j in range(n)] for i in range(n)]
+    for row in nodes:
+        for node in row:
+            circ.add_node(node)
+
+    for i in range(n):
+        for j in range(n):
+            if j + 1 < n:
+                Resistor("RH{}_{}".format(i, j), nodes[i][j], nodes[i][j + 1], 1e3)
+            if i + 1 < n:
+                Resistor("RV{}_{}".format(i, j), nodes[i][j], nodes[i + 1][j], 1e3)
+
+    CurrentSource("I0", nodes[0][0], nodes[n - 1][n - 1], 1e-3)
+
+    return circ
+
+
+def random_rlc(size, seed=0, span=16):
+    """
+    a random sparse graph of resistors, inductors and capacitors with log-uniform values
+    a random spanning tree of resistors keeps every node connected to ground; like the nets of a real design, the
+    nodes of every component are numbered closely, otherwise the factorization of large graphs fills in completely
+    :type size: int
+    :type span: int
+    :param size: approximate number of components
+    :param seed: seed of the random number generator
+    :param span: largest difference between the numbers of the nodes of a component
+    """
+
+    rng = np.random.default_rng(seed)
+    count = max(2, size // 3)
+
+    circ = Circuit("RandomRLC")
+    nodes = [Node("GND", True)] + [Node("N{}".format(i)) for i in range(1, count)]
+    for node in nodes:
+        circ.add_node(node)
+
+    VoltageSource("V0", nodes[0], nodes[1], 1)
+
+    # every node hangs off a random earlier node
+    parents = [int(rng.integers(max(0, i - span), i)) for i in range(1, count)]
+    for i, parent in enumerate(parents, 1):
+        Resistor("RT{}".format(i), nodes[parent], nodes[i], 10 ** rng.uniform(1, 4))
+
+    kinds = ((Resistor, 1, 4), (Inductor, -6, -3), (Capacitor, -12, -9))
+    for i in range(max(0, size - count)):
+        neg = int(rng.integers(0, count - 1))
+        pos = int(rng.integers(neg + 1, min(count, neg + span + 1)))
+        cls, low, high = kinds[int(rng.integers(0, len(kinds)))]
+        cls("{}{}".format(cls.__name__[0], i), nodes[neg], nodes[pos], 10 ** rng.uniform(low, high))
+
+    return circ
+
+
+def filter_bank(size):
+    """
+    identical RLC band-pass filters driven in parallel by one voltage source, each with a resistive load
+    :type size: int
+    :param size: approximate number of components
+    """
+
+    circ = Circuit("FilterBank")
+    ground = Node("GND", True)
+    source = Node("IN")
+    circ.add_node(ground)
+    circ.add_node(source)
+    VoltageSource("V0", ground, source, 1)
+
+    for i in range(max(1, size // 4)):
+        mid = Node("M{}".format(i))
+        out = Node("O{}".format(i))
+        circ.add_node(mid)
+        circ.add_node(out)
+        Resistor("RS{}".format(i), source, mid, 50)
+        Inductor("L{}".format(i), mid, out, 1e-3)
+        Capacitor("C{}".format(i), ground, out, 1e-9)
+        Resistor("RL{}".format(i), ground, out, 1e3)
+
+    return circ
+
+
+GENERATORS = {
+    "rc_ladder": rc_ladder,
+    "resistor_mesh": resistor_mesh,
+    "random_rlc": random_rlc,
+    "filter_bank": filter_bank
+}
+
+
+def _best(function, repeat):
+    """
+    :return: (the result of the last call, the shortest time of repeat calls to function)
+    """
+
+    best = np.inf
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = function()
+        best = min(best, time.perf_counter() - start)
+
+    return result, best
+
+
+def _commit():
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "HEAD"], cwd=os.path.dirname(os.path.abspath(__file__)), stderr=subprocess.DEVNULL
+        ).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def benchmark(generator, size, repeat=3, points=1, solver="auto", directory=None):
+    """
+    times every stage of building and solving one generated circuit
+    the assembly and the solve are the two halves of Circuit.ac_sweep on the stamp plan of the whole circuit
+    :type generator: str
+    :type size: int
+    :type repeat: int
+    :type points: int
+    :type solver: str
+    :param generator: a key of GENERATORS
+    :param size: approximate number of components of the circuit
+    :param repeat: number of times every stage is run, the shortest time is reported
+    :param points: number of frequencies of the sweep
+    :param solver: "dense", "sparse", "banded" or "auto", see Circuit.ac_sweep
+    :param directory: directory the circuit is saved to, a temporary one if None
+    :return: a dictionary describing the circuit with the time in seconds of every stage
+    """
+
+    if generator not in GENERATORS:
+        raise ValueError("unknown generator {}, expected one of {}".format(generator, tuple(GENERATORS)))
+
+    times = dict()
+    circ, times["construct"] = _best(lambda: GENERATORS[generator](size), repeat)
+
+    with tempfile.TemporaryDirectory(dir=directory) as temporary:
+        path = os.path.join(temporary, "circuit.json")
+        times["save"] = _best(lambda: circ.save(path, overwrite=True, pretty_printing=False), repeat)[1]
+
+        def load():
+            loaded = Circuit()
+            loaded.load(path)
+            return loaded
+        times["load"] = _best(load, repeat)[1]
+
+    def compile_plan():
+        circ.invalidate()
+        circ.check_topology()
+        plan = circ.compile("mna")
+        plan.get_ordering(solver)
+        return plan
+    plan, times["compile"] = _best(compile_plan, repeat)
+
+    state_dict, scalar, points = normalize_state({"frequency": np.logspace(2, 6, points)})
+
+    def assemble():
+        a, b, c = plan.get_params(state_dict, points)
+        return plan.scatter(a, b, c)
+    (data, rhs), times["assemble"] = _best(assemble, repeat)
+
+    times["solve"] = _best(
+        lambda: Solvers.solve(plan.size, plan.rows, plan.cols, data, rhs, solver, plan.get_ordering(solver)), repeat
+    )[1]
+
+    return {
+        "generator": generator,
+        "size": size,
+        "nodes": len(circ.nodes),
+        "components": len(circ.components),
+        "unknowns": plan.size,
+        "nnz": plan.nnz,
+        "points": points,
+        "solver": Solvers.choose_solver(plan.size, solver, plan.get_ordering(solver)),
+        "seconds": times
+    }
+
+
+def run(generators=None, sizes=SIZES, repeat=3, points=1, solver="auto", stream=None):
+    """
+    benchmarks every generator at every size, writing one JSON object per line
+    every line also records the commit and the versions it was measured with, so that files written at
+    different commits can be compared with compare
+    :type generators: list
+    :type sizes: list
+    :param generators: keys of GENERATORS, all of them if None
+    :param sizes: approximate numbers of components of the circuits
+    :param stream: file the lines are written to, sys.stdout if None
+    :return: a list of the records written
+    """
+
+    stream = sys.stdout if stream is None else stream
+    environment = {
+        "commit": _commit(),
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "sparse": Solvers.has_sparse()
+    }
+
+    records = list()
+    for generator in (GENERATORS if generators is None else generators):
+        for size in sizes:
+            record = benchmark(generator, size, repeat, points, solver)
+            record.update(environment)
+            stream.write(json.dumps(record) + "\n")
+            stream.flush()
+            records.append(record)
+
+    return records
+
+
+def compare(baseline, current, threshold=1.25):
+    """
+    finds the stages which got slower between two files written by run
+    :type baseline: str
+    :type current: str
+    :type threshold: float
+    :param baseline: path of the reference results
+    :param current: path of the new results
+    :param threshold: ratio of the times above which a stage counts as slower
+    :return: a list of (generator, size, stage, baseline seconds, current seconds) of the slower stages
+    """
+
+    def read(path):
+        with open(path, "r") as f:
+            records = [json.loads(line) for line in f if line.strip()]
+        return {(record["generator"], record["size"]): record["seconds"] for record in records}
+
+    old = read(baseline)
+    new = read(current)
+
+    slower = list()
+    for key in sorted(set(old) & set(new)):
+        for stage in STAGES:
+            if stage in old[key] and stage in new[key] and new[key][stage] > threshold * old[key][stage]:
+                slower.append(key + (stage, old[key][stage], new[key][stage]))
+
+    return slower
+
+
+def main():
+    parser = argparse.ArgumentParser(description="times the construction, storage and solution of generated circuits")
+    parser.add_argument("--generators", nargs="+", choices=sorted(GENERATORS), default=None)
+    parser.add_argument("--sizes", nargs="+", type=int, default=list(SIZES))
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--points", type=int, default=1, help="number of frequencies of the sweep")
+    parser.add_argument("--solver", choices=Solvers.SOLVERS, default="auto")
+    parser.add_argument("--output", default=None, help="file the JSON lines are written to, stdout if omitted")
+    parser.add_argument("--compare", default=None, help="JSON lines of a previous run to compare the output with")
+    args = parser.parse_args()
+
+    if args.compare is not None and args.output is None:
+        parser.error("--compare requires --output")
+
+    if args.output is None:
+        run(args.generators, args.sizes, args.repeat, args.points, args.solver)
+    else:
+        with open(args.output, "w") as f:
+            run(args.generators, args.sizes, args.repeat, args.points, args.solver, f)
+
+        if args.compare is not None:
+            for generator, size, stage, old, new in compare(args.compare, args.output):
+                print("{} {} {}: {:.4g}s -> {:.4g}s".format(generator, size, stage, old, new))
+
+
+if __name__ == "__main__":
+    main()
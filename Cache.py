@@ -0,0 +1,216 @@
+import os
+import hashlib
+from collections import OrderedDict
+import numpy as np
+from StampPlan import normalize_state
+from SweepResult import SweepResult
+
+
+# prefix of the names of the files written by a ResultCache, other files of its directory are never touched
+FILE_PREFIX = "acsweep-"
+
+
+def _state_fingerprint(state_dict):
+    """
+    :return: a digest of state_dict, equal for equal values regardless of their python or numpy type
+    """
+
+    state_dict = normalize_state(state_dict)[0]
+    digest = hashlib.sha256()
+    for key in sorted(state_dict):
+        value = np.asarray(state_dict[key])
+        digest.update(repr(key).encode())
+        if value.dtype.kind in "biufc":
+            value = value.astype(np.complex128 if value.dtype.kind == "c" else np.float64)
+            digest.update(repr((value.dtype.str, value.shape)).encode())
+            digest.update(np.ascontiguousarray(value).tobytes())
+        else:
+            digest.update(repr(state_dict[key]).encode())
+
+    return digest.hexdigest()
+
+
+class ResultCache(object):
+    """
+    memoizes the results of ac sweeps by content, so that repeated requests for the same circuit at the same
+    parameters are not solved again
+
+    Results are keyed by the fingerprint of the circuit, which covers its topology and component values, together
+    with the state_dict and the formulation. The circuit is fingerprinted again whenever its version changes, so
+    editing a node or any attribute of a component misses the cache. The most recently used max_entries results
+    are kept in memory; with a directory, results are also written to disk as .npz files named after FILE_PREFIX and
+    the key, and the least recently used of them are deleted once they take more than max_bytes.
+
+    The arrays of cached results are shared between every request, so they are read-only.
+    """
+
+    def __init__(self, max_entries=64, directory=None, max_bytes=1 << 30):
+        """
+        :type max_entries: int
+        :type directory: str
+        :type max_bytes: int
+        :param max_entries: number of results kept in memory
+        :param directory: directory holding the results on disk, created if missing, nothing is written if None
+        :param max_bytes: size of the results on disk above which the least recently used ones are deleted
+        """
+
+        if directory is not None and type(directory) is not str:
+            raise TypeError("argument directory is not of type string")
+
+        self.max_entries = max_entries
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+
+        self._entries = OrderedDict()
+        if directory is not None:
+            os.makedirs(directory, exist_ok=True)
+
+    def __len__(self):
+        return len(self._entries)
+
+    def key(self, circuit, state_dict, formulation="mna"):
+        """
+        :return: the key of the results of circuit for state_dict, a hex string
+        """
+
+        digest = hashlib.sha256()
+        for part in ("ac_sweep", formulation, circuit.fingerprint(), _state_fingerprint(state_dict)):
+            digest.update(part.encode())
+            digest.update(b"\0")
+
+        return digest.hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.directory, FILE_PREFIX + key + ".npz")
+
+    @staticmethod
+    def _is_result(name):
+        """
+        :return: whether the file called name holds a result written by a cache, temporary files excluded
+        """
+
+        return name.startswith(FILE_PREFIX) and name.endswith(".npz") and ".tmp." not in name
+
+    def get(self, key):
+        """
+        :type key: str
+        :return: the SweepResult stored under key, or None
+        """
+
+        if key in self._entries:
+            self._entries.move_to_end(key)
+            return self._entries[key]
+
+        if self.directory is None or not os.path.isfile(self._path(key)):
+            return None
+
+        try:
+            with np.load(self._path(key)) as data:
+                solutions = data["solutions"]
+                names = data["names"].tolist()
+            solutions.setflags(write=False)
+            # the modification time orders the files for eviction
+            os.utime(self._path(key))
+        except (OSError, ValueError, KeyError):
+            # an unreadable file, e.g. one being evicted by another process, is a miss
+            return None
+
+        index = dict()
+        for i, name in enumerate(names):
+            index.setdefault(name, i)
+
+        result = SweepResult(solutions, index, names)
+        self._remember(key, result)
+
+        return result
+
+    def put(self, key, result):
+        """
+        stores result under key, in memory and on disk
+        :type key: str
+        :type result: SweepResult
+        :return: the stored result, whose arrays are read-only
+        """
+
+        result.solutions.setflags(write=False)
+        self._remember(key, result)
+
+        if self.directory is not None:
+            # writing under a temporary name makes the file appear at once for other readers of the directory
+            temporary = os.path.join(self.directory, "{}{}.{}.tmp.npz".format(FILE_PREFIX, key, os.getpid()))
+            np.savez(temporary, solutions=result.solutions, names=np.array(result.names, dtype=str))
+            os.replace(temporary, self._path(key))
+            self._evict(self._path(key))
+
+        return result
+
+    def _remember(self, key, result):
+        self._entries[key] = result
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def _evict(self, latest):
+        """
+        deletes the least recently used files of the directory until they fit into max_bytes
+        :param latest: the file just written, which is never deleted
+        """
+
+        files = list()
+        total = 0
+        for entry in os.scandir(self.directory):
+            if self._is_result(entry.name):
+                stat = entry.stat()
+                total += stat.st_size
+                if entry.path != latest:
+                    files.append((stat.st_mtime_ns, stat.st_size, entry.path))
+
+        files.sort()
+        for mtime, size, path in files:
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+
+    def clear(self):
+        """
+        forgets every result, deleting the result files of the directory
+        """
+
+        self._entries = OrderedDict()
+        if self.directory is not None:
+            for entry in os.scandir(self.directory):
+                if self._is_result(entry.name):
+                    try:
+                        os.remove(entry.path)
+                    except FileNotFoundError:
+                        pass
+
+    def ac_sweep(self, circuit, state_dict, solver="auto", formulation="mna", workers=None):
+        """
+        the results of circuit.ac_sweep, taken from the cache when the same circuit was solved for the same
+        state_dict before
+        :type state_dict: dict
+        :type solver: str
+        :type formulation: str
+        :param circuit: the circuit to be solved
+        :param state_dict: the external parameters of the circuit, see Circuit.ac_sweep
+        :param solver: the solver used on a miss, see Circuit.ac_sweep; it is not part of the key
+        :param formulation: "mna" or "nodal", see Circuit.ac_sweep
+        :param workers: see Circuit.ac_sweep
+        :return: a SweepResult with read-only arrays
+        """
+
+        key = self.key(circuit, state_dict, formulation)
+        result = self.get(key)
+        if result is not None:
+            self.hits += 1
+            return result
+
+        self.misses += 1
+        return self.put(key, circuit.ac_sweep(state_dict, solver, formulation, workers))
@@ -1,17 +1,63 @@
 import os
 import json
+import inspect
+import hashlib
 import pprint
 from math import pi
 from abc import abstractmethod
 import numpy as np
 from util.Comparable import Comparable
+from util.GrowableArray import GrowableArray
+from util.ComponentValue import ComponentValue, is_array_backed
+from util import Profiling
+from StampPlan import StampPlan, normalize_state
+from Topology import Topology
+from SweepResult import SweepResult
 
 
 class CircuitError(Exception):
     pass
 
 
+# saved type name -> Component subclass, filled by register_component_type
+COMPONENT_TYPES = dict()
+
+
+def register_component_type(cls):
+    """
+    makes a Component subclass available to Circuit.load and the other netlist readers
+    :type cls: type
+    :param cls: the Component subclass, saved under the name returned by its get_type
+    :return: cls
+    """
+
+    if not isinstance(cls, type) or not issubclass(cls, Component):
+        raise TypeError("argument cls is not a subclass of Component")
+
+    COMPONENT_TYPES[cls.__name__] = cls
+    return cls
+
+
+def get_component_type(name):
+    """
+    :type name: str
+    :param name: the saved type name of a component
+    :return: the registered Component subclass called name
+    """
+
+    if name not in COMPONENT_TYPES:
+        raise CircuitError("unknown component type {}".format(name))
+
+    return COMPONENT_TYPES[name]
+
+
 class Node(Comparable):
+    """
+    a node of a circuit; once added to a circuit, the node is a view onto its row of the circuit's node arrays
+    """
+
+    __slots__ = ("circuit", "_index", "_name", "_ground")
+
     def __init__(self, name, ground=False):
         """
         :type name: str
@@ -26,19 +72,72 @@ class Node(Comparable):
         if type(ground) is not bool:
             raise TypeError("argument ground is not of type bool")
 
-        self.name = name
-        self.ground = ground
-        self.pos_cons = list()
-        self.neg_cons = list()
+        self._name = name
+        self._ground = ground
 
         self.circuit = None
+        self._index = None
+
+    @property
+    def name(self):
+        return self._name if self.circuit is None else self.circuit._node_names[self._index]
+
+    @name.setter
+    def name(self, name):
+        if type(name) is not str:
+            raise TypeError("argument name is not of type string")
+
+        if self.circuit is None:
+            self._name = name
+        else:
+            self.circuit.rename_node(self, name)
+
+    @property
+    def ground(self):
+        return self._ground if self.circuit is None else bool(self.circuit._node_ground.data[self._index])
+
+    @ground.setter
+    def ground(self, ground):
+        if type(ground) is not bool:
+            raise TypeError("argument ground is not of type bool")
+
+        if self.circuit is None:
+            self._ground = ground
+        else:
+            self.circuit._node_ground[self._index] = ground
+            self.circuit.invalidate()
+
+    @property
+    def pos_cons(self):
+        """
+        :return: the components whose positive terminal is connected to the node
+        """
+
+        if self.circuit is None:
+            return list()
+
+        rows = np.flatnonzero(self.circuit._cmp_pos.array == self._index)
+        return [self.circuit.components[i] for i in rows]
+
+    @property
+    def neg_cons(self):
+        """
+        :return: the components whose negative terminal is connected to the node
+        """
+
+        if self.circuit is None:
+            return list()
+
+        rows = np.flatnonzero(self.circuit._cmp_neg.array == self._index)
+        return [self.circuit.components[i] for i in rows]
 
     def add_component(self, cmp, polarity):
         """
-        called by a component on initialization
+        kept for compatibility, the connections of a node are read from the component arrays of its circuit, which
+        are filled in when the component is created
         :type cmp: Component
         :type polarity: bool
-        :param cmp: component instance to be connected
+        :param cmp: component instance connected to the node
         :param polarity: True => Positive, False => Negative
         """
         if not isinstance(cmp, Component):
@@ -46,10 +145,8 @@ class Node(Comparable):
         if type(polarity) is not bool:
             raise TypeError("invalid polarity argument")
 
-        if polarity:
-            self.pos_cons.append(cmp)
-        else:
-            self.neg_cons.append(cmp)
+        if (cmp.n_pos if polarity else cmp.n_neg) is not self:
+            raise CircuitError("component {} is not connected to node {}".format(cmp.name, self.name))
 
 
 class Component(Comparable):
@@ -58,9 +155,26 @@ class Component(Comparable):
 
     All Components will be modelled with the following voltage-current relation:
         AV+BI=C
+
+    Components which set has_admittance have a B which is never zero, allowing the nodal formulation to
+    stamp them as an admittance instead of giving them their own branch current unknown.
+    Components which clear constrains_voltage (A is always zero) do not tie the voltages of their nodes together.
+    Components which set value_name implement evaluate, giving their parameters for arrays of that attribute.
+    Components which set is_source only have their value in C, so changing it leaves the system matrix unchanged.
+
+    A component is a view onto its row of the circuit's component arrays. Subclasses which declare empty
+    __slots__ and store their value in a ComponentValue are array backed and are assembled without touching
+    the component objects; other subclasses keep their attributes in a __dict__ as usual.
     """
 
-    def __init__(self, name, n_neg, n_pos):
+    __slots__ = ("_circuit", "_index")
+
+    has_admittance = False
+    constrains_voltage = True
+    is_source = False
+    value_name = None
+
+    def __init__(self, name, n_neg, n_pos, value=0):
         """
         Creates a component
         :type name: str
@@ -69,6 +183,7 @@ class Component(Comparable):
         :param name: name of the component
         :param n_neg: negative node connection
         :param n_pos: positive node connection
+        :param value: the value stored in the row of the component, a real or complex number
         """
         super(Component, self).__init__()
 
@@ -86,18 +201,38 @@ class Component(Comparable):
         if n_neg.circuit != n_pos.circuit:
             raise CircuitError("nodes {} and {} belong to different circuits".format(n_neg.name, n_pos.name))
 
-        for e in n_neg.circuit.nodes + n_pos.circuit.components:
-            if e.name == name:
-                raise NameError("name {} already exists in the circuit".format(name))
+        if n_neg.circuit.has_name(name):
+            raise NameError("name {} already exists in the circuit".format(name))
 
-        self.name = name
-        self.n_neg = n_neg
-        self.n_pos = n_pos
+        # checked before the row is added, so that an invalid component leaves the circuit unchanged
+        value = Circuit.check_value(name, value)
+
+        n_neg.circuit.register_component(self, name, n_neg, n_pos, value)
 
-        n_neg.add_component(self, False)
-        n_pos.add_component(self, True)
+    @property
+    def name(self):
+        return self._circuit._cmp_names[self._index]
 
-        n_neg.circuit.components.append(self)
+    @name.setter
+    def name(self, name):
+        self._circuit.rename_component(self, name)
+
+    @property
+    def n_neg(self):
+        return self._circuit.nodes[self._circuit._cmp_neg.data[self._index]]
+
+    @property
+    def n_pos(self):
+        return self._circuit.nodes[self._circuit._cmp_pos.data[self._index]]
+
+    def __setattr__(self, key, value):
+        super(Component, self).__setattr__(key, value)
+
+        # every other attribute describes the component, changing it changes the circuit
+        if key not in ("id", "_circuit", "_index"):
+            circuit = getattr(self, "_circuit", None)
+            if circuit is not None:
+                circuit.version += 1
 
     def get_type(self):
         return str(type(self)).split("'")[1].split(".")[-1]
@@ -111,6 +246,95 @@ class Component(Comparable):
         :return: (A, B, C) from equation AV+BI=C
         """
 
+    @classmethod
+    def evaluate(cls, value, state_dict):
+        """
+        calculates A, B and C for an arbitrary value of the attribute named by value_name
+        value may be an array, in which case the parameters are broadcast against it and the state
+        :param value: the value of the component, e.g. a resistance
+        :type state_dict dict
+        :param state_dict a dictionary of all external circuit parameters
+        :return: (A, B, C) from equation AV+BI=C
+        """
+
+        raise NotImplementedError("{} does not support evaluating arbitrary values".format(cls.__name__))
+
+    def get_companion(self, step, method):
+        """
+        calculates the companion model of the component for one step of a transient analysis
+        :type step: float
+        :type method: str
+        :param step: the timestep
+        :param method: "backward_euler" or "trapezoidal"
+        :return: (A, B, C, GV, GI) where AV+BI=C+GV*V'+GI*I' and V', I' are the values of the previous step
+        """
+
+        if type(self).value_name is None:
+            raise NotImplementedError("{} does not support transient analysis".format(self.get_type()))
+
+        return self.companion(getattr(self, type(self).value_name), step, method)
+
+    @classmethod
+    def companion(cls, value, step, method):
+        """
+        calculates the companion model for an arbitrary value of the attribute named by value_name
+        :param value: the value of the component, e.g. a capacitance, may be an array
+        :type step: float
+        :type method: str
+        :param step: the timestep
+        :param method: "backward_euler" or "trapezoidal"
+        :return: (A, B, C, GV, GI) where AV+BI=C+GV*V'+GI*I' and V', I' are the values of the previous step
+        """
+
+        raise NotImplementedError("{} does not support transient analysis".format(cls.__name__))
+
+    def get_laplace(self):
+        """
+        calculates the parameters of the component as polynomials of the complex frequency s
+        :return: (A0, A1, B0, B1, C) where A=A0+sA1 and B=B0+sB1 in AV+BI=C
+        """
+
+        if type(self).value_name is None:
+            raise NotImplementedError("{} does not support the laplace domain".format(self.get_type()))
+
+        return self.laplace(getattr(self, type(self).value_name))
+
+    @classmethod
+    def laplace(cls, value):
+        """
+        calculates the laplace domain parameters for an arbitrary value of the attribute named by value_name
+        :param value: the value of the component, e.g. a capacitance, may be an array
+        :return: (A0, A1, B0, B1, C) where A=A0+sA1 and B=B0+sB1 in AV+BI=C
+        """
+
+        raise NotImplementedError("{} does not support the laplace domain".format(cls.__name__))
+
+    def get_derivatives(self, state_dict):
+        """
+        calculates the derivatives of A, B and C with respect to the value of the component
+        :type state_dict dict
+        :param state_dict a dictionary of all external circuit parameters
+        :return: (dA, dB, dC) from equation AV+BI=C
+        """
+
+        if type(self).value_name is None:
+            raise NotImplementedError("{} does not have a value to differentiate".format(self.get_type()))
+
+        return self.derivatives(getattr(self, type(self).value_name), state_dict)
+
+    @classmethod
+    def derivatives(cls, value, state_dict):
+        """
+        calculates the derivatives of A, B and C with respect to an arbitrary value of the attribute named by
+        value_name
+        :param value: the value of the component, e.g. a resistance, may be an array
+        :type state_dict dict
+        :param state_dict a dictionary of all external circuit parameters
+        :return: (dA, dB, dC) from equation AV+BI=C
+        """
+
+        raise NotImplementedError("{} does not have a value to differentiate".format(cls.__name__))
+
     @abstractmethod
     def get_attributes(self):
         """
@@ -119,12 +343,25 @@ class Component(Comparable):
 
 
 class Circuit(Comparable):
+    """
+    a circuit, stored as a struct of arrays
+
+    Nodes are rows of a name list and a ground flag array; components are rows of a name list and of arrays
+    holding their type code, terminal node rows and value. Node and Component objects are thin views onto
+    these rows, which the analyses read directly.
+
+    The version of a circuit is incremented by every change to its nodes, components or component attributes,
+    so that results derived from the circuit can tell whether they are stale.
+    """
+
     def __init__(self, name=""):
         super(Circuit, self).__init__()
 
         self.name = name
-        self.nodes = list()
-        self.components = list()
+        self.version = 0
+        self._fingerprint = None
+        self._hooks = list()
+        self.clear()
 
     def __str__(self):
         data = self.__serialize()
@@ -143,100 +380,542 @@ class Circuit(Comparable):
         if node.circuit is not None:
             raise CircuitError("node {} already belongs to a circuit".format(node.name))
 
+        self._node_names.append(node._name)
+        self._node_ground.append(node._ground)
         node.circuit = self
+        node._index = len(self.nodes)
+        node._name = node._ground = None
+
         self.nodes.append(node)
+        self._node_index.setdefault(node.name, node)
+        self.invalidate()
 
-    def get_node(self, name):
-        for node in self.nodes:
-            if node.name == name:
-                return node
+    def add_nodes(self, names, ground):
+        """
+        Adds many new nodes at once, e.g. nodes read from disk
+        :type names: list
+        :param names: the names of the nodes
+        :param ground: a bool array, whether each node is directly connected to ground
+        :return: a list of the created nodes
+        """
 
-        raise CircuitError("Circuit {} does not have node {}", self.name, name)
+        ground = np.asarray(ground)
+        if ground.dtype != np.bool_:
+            raise TypeError("argument ground is not an array of bool")
+        if len(names) != len(ground):
+            raise ValueError("{} node names were given for {} ground flags".format(len(names), len(ground)))
+        if any(type(name) is not str for name in names):
+            raise TypeError("argument names is not a list of strings")
+
+        start = len(self.nodes)
+        self._node_names.extend(names)
+        self._node_ground.extend(ground)
+
+        created = list()
+        for i, name in enumerate(names):
+            # the rows are already filled in, so the view only needs its identity and row
+            node = Node.__new__(Node)
+            Comparable.__init__(node)
+            node.circuit = self
+            node._index = start + i
+            node._name = node._ground = None
+            self._node_index.setdefault(name, node)
+            created.append(node)
+
+        self.nodes.extend(created)
+        self.invalidate()
+
+        return created
+
+    def clear(self):
+        """
+        Removes every node and component from the circuit
+        """
 
-    def ac_sweep(self, state_dict):
+        self.nodes = list()
+        self.components = list()
+
+        # name -> object indices, kept in sync by add_node and register_component
+        self._node_index = dict()
+        self._component_index = dict()
+
+        # node rows
+        self._node_names = list()
+        self._node_ground = GrowableArray(np.bool_)
+
+        # component rows; types are numbered per circuit in order of first use
+        self._types = list()
+        self._type_codes = dict()
+        self._cmp_names = list()
+        self._cmp_types = GrowableArray(np.int32)
+        self._cmp_neg = GrowableArray(np.int64)
+        self._cmp_pos = GrowableArray(np.int64)
+        self._cmp_values = GrowableArray(np.float64)
+
+        self.invalidate()
+
+    def _get_type_code(self, cls):
+        if cls not in self._type_codes:
+            self._type_codes[cls] = len(self._types)
+            self._types.append(cls)
+
+        return self._type_codes[cls]
+
+    def register_component(self, cmp, name, n_neg, n_pos, value=0):
         """
-        performs an ac sweep of the circuit based on the parameters given
-        :param state_dict: a collection of all the external parameters needed to simulate the circuit
-        :return: a dictionary of each voltage and current value, indexed by the parameter's name
+        called by a component on initialization, appends its row to the component arrays
+        :type cmp: Component
+        :type name: str
+        :type n_neg: Node
+        :type n_pos: Node
+        :param cmp: component instance to be added
+        :param name: name of the component
+        :param n_neg: negative node connection
+        :param n_pos: positive node connection
+        :param value: value of the component, checked by check_value
         """
 
-        found_ground = False
-        for node in self.nodes:
-            found_ground = found_ground or node.ground
+        if np.iscomplexobj(value) and self._cmp_values.data.dtype.kind != "c":
+            self._cmp_values.astype(np.complex128)
+
+        cmp._circuit = self
+        cmp._index = len(self.components)
+
+        self._cmp_names.append(name)
+        self._cmp_types.append(self._get_type_code(type(cmp)))
+        self._cmp_neg.append(n_neg._index)
+        self._cmp_pos.append(n_pos._index)
+        self._cmp_values.append(value)
+
+        self.components.append(cmp)
+        self._component_index[name] = cmp
+        self.invalidate()
+
+    def rename_node(self, node, name):
+        """
+        called when the name of a node of the circuit is set, keeps the name index in sync
+        :type node: Node
+        :type name: str
+        :param node: a node of the circuit
+        :param name: the new name of the node
+        """
+
+        old = self._node_names[node._index]
+        if name == old:
+            return
+        self._node_names[node._index] = name
+
+        # several nodes may share a name, get_node returns the first of them
+        if self._node_index.get(old) is node:
+            del self._node_index[old]
+            for other in self.nodes:
+                if other._index > node._index and self._node_names[other._index] == old:
+                    self._node_index[old] = other
+                    break
+        if name not in self._node_index or self._node_index[name]._index > node._index:
+            self._node_index[name] = node
+        self.invalidate()
+
+    def rename_component(self, cmp, name):
+        """
+        called when the name of a component of the circuit is set, keeps the name index in sync
+        :type cmp: Component
+        :type name: str
+        :param cmp: a component of the circuit
+        :param name: the new name of the component
+        """
+
+        if type(name) is not str:
+            raise TypeError("name is not of type string")
+
+        old = self._cmp_names[cmp._index]
+        if name == old:
+            return
+        if self.has_name(name):
+            raise NameError("name {} already exists in the circuit".format(name))
+
+        self._cmp_names[cmp._index] = name
+        del self._component_index[old]
+        self._component_index[name] = cmp
+        self.invalidate()
+
+    def get_value(self, index):
+        """
+        :type index: int
+        :param index: the row of a component
+        :return: the value of the component as a float, or a complex if it has an imaginary part
+        """
+
+        value = self._cmp_values.data[index].item()
+        if isinstance(value, complex) and value.imag == 0:
+            return value.real
+
+        return value
+
+    @staticmethod
+    def check_value(name, value):
+        """
+        :type name: str
+        :param name: name of the component, used in the error
+        :param value: a component value
+        :return: value as a 0-d array
+        """
+
+        value = np.asarray(value)
+        if value.ndim != 0 or value.dtype.kind not in "biufc":
+            raise TypeError("value of component {} is not a number".format(name))
+
+        return value
+
+    def set_value(self, index, value):
+        """
+        :type index: int
+        :param index: the row of a component
+        :param value: the new value of the component, a real or complex number
+        """
+
+        value = self.check_value(self._cmp_names[index], value)
+
+        if value.dtype.kind == "c" and self._cmp_values.data.dtype.kind != "c":
+            self._cmp_values.astype(np.complex128)
+
+        self._cmp_values[index] = value
+        self.version += 1
+
+    def get_values(self, rows=None):
+        """
+        :type rows: np.ndarray
+        :param rows: component rows, every component if None
+        :return: a copy of the values of the components
+        """
+
+        values = self._cmp_values.array
+        return values.copy() if rows is None else values[rows]
+
+    def has_name(self, name):
+        """
+        :type name: str
+        :param name: a node or component name
+        :return: whether a node or component of the circuit is already called name
+        """
+
+        return name in self._node_index or name in self._component_index
+
+    def invalidate(self):
+        """
+        discards the compiled stamp plans, called whenever the topology of the circuit changes
+        """
+
+        self._plans = dict()
+        self._topology = None
+        self.version += 1
 
-        if not found_ground:
+    def get_topology(self):
+        """
+        :return: the Topology of the circuit, cached until the topology changes
+        """
+
+        if self._topology is None:
+            self._topology = Topology(self)
+
+        return self._topology
+
+    def check_topology(self):
+        """
+        ensures the circuit can be solved
+        :return: the Topology of the circuit
+        """
+
+        topology = self.get_topology()
+
+        if len(topology.reference) == 0:
             raise CircuitError("All circuits require at least one ground node")
 
-        mrx = np.zeros([
-            len(self.nodes) + len(self.components)
-        ] * 2, dtype=np.complex128)
-        vct = np.empty([
-            len(self.nodes) + len(self.components)
-        ], dtype=np.complex128)
+        if len(topology.floating) != 0:
+            raise CircuitError("nodes {} have no path to ground".format(", ".join(topology.floating)))
 
-        # setting an id for each node and connection
-        # the id will identify the row and column that the corresponding variable and resulting equation is assigned
-        for enum in enumerate(self.nodes + self.components):
-            enum[1].num = enum[0]
+        return topology
 
-        # doing all the appropriate KCLs
-        for node in self.nodes:
-            if node.ground:
-                # the ground node will not have a KCL, but instead a voltage assignment
-                mrx[node.num, node.num] = 1
-                vct[node.num] = 0
+    def compile(self, formulation="mna"):
+        """
+        builds the stamp plan of the circuit, or returns the cached one if the topology has not changed since
+        :type formulation: str
+        :param formulation: "mna" or "nodal", see StampPlan
+        :return: an immutable StampPlan
+        """
 
-            else:
-                # all non-ground nodes will produce a KCL
-                for neg_con in node.neg_cons:
-                    mrx[node.num, neg_con.num] = 1
-
-                for pos_con in node.pos_cons:
-                    mrx[node.num, pos_con.num] = -1
-
-                vct[node.num] = 0
-
-        # doing all the appropriate KVLs
-        for cmp in self.components:
-            # all connections will produce a KVL equation
-            a, b, c = cmp.get_params(state_dict)
-
-            if cmp.n_neg.ground and cmp.n_pos.ground:
-                # both sides of the component are connected to ground => no current
-                mrx[cmp.num, cmp.num] = 1
-                vct[cmp.num] = 0
-
-            # Note: middle two elifs are only an optimization, algorithm would work fine without
-            elif cmp.n_neg.ground:
-                # negative terminal of the component is connected to ground
-                mrx[cmp.num, cmp.n_pos.num] = a
-                mrx[cmp.num, cmp.num] = b
-                vct[cmp.num] = c
-
-            elif cmp.n_pos.ground:
-                # positive terminal of the component is connected to ground
-                mrx[cmp.num, cmp.n_neg.num] = -a
-                mrx[cmp.num, cmp.num] = b
-                vct[cmp.num] = c
+        if formulation not in self._plans:
+            with Profiling.phase(self._hooks, "compile", nodes=len(self.nodes), components=len(self.components)):
+                self._plans[formulation] = StampPlan(self, formulation=formulation)
+
+        return self._plans[formulation]
+
+    def add_hook(self, hook):
+        """
+        registers a callable which receives an event for every phase of the analyses of the circuit, see
+        util.Profiling; without hooks, the analyses are not instrumented
+        :param hook: a callable taking the event dictionary, it may set condition to ask for condition numbers
+        """
 
+        if not callable(hook):
+            raise TypeError("argument hook is not callable")
+
+        self._hooks.append(hook)
+
+    def remove_hook(self, hook):
+        """
+        :param hook: a callable registered by add_hook
+        """
+
+        self._hooks.remove(hook)
+
+    def get_node(self, name):
+        if name not in self._node_index:
+            raise CircuitError("Circuit {} does not have node {}".format(self.name, name))
+
+        return self._node_index[name]
+
+    def get_component(self, name):
+        if name not in self._component_index:
+            raise CircuitError("Circuit {} does not have component {}".format(self.name, name))
+
+        return self._component_index[name]
+
+    def add_components(self, components):
+        """
+        Validates and builds a batch of components; nothing is added if any entry of the batch is invalid
+        :type components: list
+        :param components: component descriptions in the saved circuit format, each a dictionary with the keys
+                           "Type", "Name", "Negative", "Positive" and "Attributes"
+        :return: a list of the created components
+        """
+
+        components = list(components)
+
+        batch = list()
+        names = set()
+        values = list()
+        signatures = dict()
+        for component_info in components:
+            name = component_info["Name"]
+            if type(name) is not str:
+                raise TypeError("name is not of type string")
+            if name in names or self.has_name(name):
+                raise NameError("name {} already exists in the circuit".format(name))
+            names.add(name)
+
+            cls = get_component_type(component_info["Type"])
+            n_neg = self.get_node(component_info["Negative"])
+            n_pos = self.get_node(component_info["Positive"])
+            attributes = component_info.get("Attributes", dict())
+            if type(attributes) is not dict:
+                raise TypeError("attributes of component {} are not a dictionary".format(name))
+
+            if is_array_backed(cls) and set(attributes) == {cls.value_name}:
+                values.append(attributes[cls.value_name])
             else:
-                # neither terminal of the component is connected to ground
-                mrx[cmp.num, cmp.n_pos.num] = a
-                mrx[cmp.num, cmp.n_neg.num] = -a
-                mrx[cmp.num, cmp.num] = b
-                vct[cmp.num] = c
+                if cls not in signatures:
+                    signatures[cls] = inspect.signature(cls)
+                try:
+                    signatures[cls].bind(name, n_neg, n_pos, **attributes)
+                except TypeError:
+                    raise TypeError("attributes {} do not describe a component of type {}".format(
+                        sorted(attributes), cls.__name__
+                    ))
+
+            batch.append((cls, name, n_neg, n_pos, attributes))
+
+        # the values of array backed components are checked at once
+        values = np.asarray(values)
+        if values.ndim != 1 or values.dtype.kind not in "biufc":
+            raise TypeError("component values are not numbers")
+
+        count = len(self.components)
+        try:
+            created = list()
+            run = list()
+            for entry in batch:
+                cls, name, n_neg, n_pos, attributes = entry
+                if is_array_backed(cls) and set(attributes) == {cls.value_name}:
+                    run.append(entry)
+                    continue
+
+                created.extend(self._append_components(run))
+                run = list()
+                created.append(cls(name, n_neg, n_pos, **attributes))
+
+            created.extend(self._append_components(run))
+        except Exception:
+            # the constructor of a component which is not array backed may still reject its attributes
+            self._remove_components(count)
+            raise
+
+        return created
+
+    def _remove_components(self, count):
+        """
+        removes every component after the first count, undoing a partially added batch
+        :type count: int
+        """
 
-        solutions = np.linalg.solve(mrx, vct)
+        for name in self._cmp_names[count:]:
+            del self._component_index[name]
+        del self._cmp_names[count:]
+        for column in (self._cmp_types, self._cmp_neg, self._cmp_pos, self._cmp_values):
+            column.truncate(count)
 
-        results = dict()
+        del self.components[count:]
+        self.invalidate()
 
-        for node in self.nodes:
-            results[node.name] = solutions[node.num]
+    def add_component_arrays(self, types, names, codes, neg, pos, values):
+        """
+        Adds many array backed components at once from the columns of the component arrays, e.g. columns read
+        from disk; nothing is added if any component is invalid
+        :type types: list
+        :type names: list
+        :param types: the array backed Component subclasses referred to by codes
+        :param names: the names of the components
+        :param codes: the index into types of every component
+        :param neg: the row of the negative node of every component
+        :param pos: the row of the positive node of every component
+        :param values: the value of every component
+        :return: a list of the created components
+        """
+
+        codes = np.asarray(codes)
+        neg = np.asarray(neg)
+        pos = np.asarray(pos)
+        values = np.asarray(values)
+
+        for cls in types:
+            if not isinstance(cls, type) or not issubclass(cls, Component) or not is_array_backed(cls):
+                raise TypeError("{} is not an array backed component type".format(cls))
+        if not len(names) == len(codes) == len(neg) == len(pos) == len(values):
+            raise ValueError("component columns differ in length")
+        for column in (codes, neg, pos):
+            if column.dtype.kind not in "iu":
+                raise TypeError("component types and terminals are not integers")
+        if values.dtype.kind not in "biufc":
+            raise TypeError("component values are not numbers")
+        if len(codes) != 0 and (codes.min() < 0 or codes.max() >= len(types)):
+            raise ValueError("component types are out of range")
+        for column in (neg, pos):
+            if len(column) != 0 and (column.min() < 0 or column.max() >= len(self.nodes)):
+                raise CircuitError("component terminals are not nodes of the circuit")
+
+        if any(type(name) is not str for name in names):
+            raise TypeError("name is not of type string")
+        seen = set()
+        for name in names:
+            if name in seen or self.has_name(name):
+                raise NameError("name {} already exists in the circuit".format(name))
+            seen.add(name)
+
+        type_codes = np.array([self._get_type_code(cls) for cls in types], dtype=np.int32)
+        return self._extend_components(types, names, codes, type_codes[codes], neg, pos, values)
+
+    def _append_components(self, batch):
+        """
+        appends a batch of array backed components to the component arrays at once
+        :param batch: a list of (type, name, negative node, positive node, attributes)
+        :return: a list of the created components
+        """
 
-        for cmp in self.components:
-            results[cmp.name] = solutions[cmp.num]
+        if len(batch) == 0:
+            return list()
+
+        values = np.asarray([attributes[cls.value_name] for cls, name, n_neg, n_pos, attributes in batch])
+        if values.dtype.kind not in "biufc":
+            raise TypeError("component values are not numbers")
+
+        types = [entry[0] for entry in batch]
+        return self._extend_components(
+            types,
+            [entry[1] for entry in batch],
+            np.arange(len(batch)),
+            np.array([self._get_type_code(cls) for cls in types], dtype=np.int32),
+            np.array([entry[2]._index for entry in batch], dtype=np.int64),
+            np.array([entry[3]._index for entry in batch], dtype=np.int64),
+            values
+        )
+
+    def _extend_components(self, types, names, codes, type_codes, neg, pos, values):
+        """
+        appends validated rows to the component arrays and creates their views
+        :param codes: index into types of every row
+        :param type_codes: type code of the circuit of every row
+        """
+
+        if values.dtype.kind == "c" and self._cmp_values.data.dtype.kind != "c":
+            self._cmp_values.astype(np.complex128)
+
+        start = len(self.components)
+        self._cmp_names.extend(names)
+        self._cmp_types.extend(type_codes)
+        self._cmp_neg.extend(neg)
+        self._cmp_pos.extend(pos)
+        self._cmp_values.extend(values)
+
+        # the rows are already filled in, so the views only need their identity and row; the slots are set
+        # directly, since Component.__setattr__ would count every view as a change of the circuit
+        set_id = Comparable.id.__set__
+        set_circuit = Component._circuit.__set__
+        set_index = Component._index.__set__
+        first_id = Comparable.ID
+        Comparable.ID += len(names)
+
+        created = list()
+        for i, (code, name) in enumerate(zip(codes.tolist(), names)):
+            cls = types[code]
+            cmp = cls.__new__(cls)
+            set_id(cmp, first_id + i)
+            set_circuit(cmp, self)
+            set_index(cmp, start + i)
+            self._component_index[name] = cmp
+            created.append(cmp)
+
+        self.components.extend(created)
+        self.invalidate()
+
+        return created
+
+    def ac_sweep(self, state_dict, solver="auto", formulation="mna", workers=None):
+        """
+        performs an ac sweep of the circuit based on the parameters given
+        state_dict["frequency"] may either be a scalar or a 1-D array of frequencies; in the latter case every
+        frequency is stamped into a stacked (F, N, N) system which is solved with a single batched solve
+        :type solver: str
+        :type formulation: str
+        :param state_dict: a collection of all the external parameters needed to simulate the circuit
+        :param solver: "dense", "sparse" (requires scipy), "banded" (requires scipy) or "auto" to pick the sparse
+                       solver for large circuits, or the banded solver for large circuits which reorder into a
+                       narrow band, e.g. ladders
+        :param formulation: "mna" for full modified nodal analysis, or "nodal" to stamp resistors, capacitors,
+                            inductors and current sources as admittances, which roughly halves the system size
+        :param workers: number of threads used to solve independent blocks of the circuit concurrently
+        :return: a SweepResult mapping each voltage and current value to the parameter's name;
+                 values are arrays over the frequencies when an array of frequencies was given
+        """
+
+        with Profiling.phase(self._hooks, "topology", nodes=len(self.nodes), components=len(self.components)):
+            topology = self.check_topology()
+
+        state_dict, scalar, points = normalize_state(state_dict)
+
+        if len(topology.blocks) > 1:
+            # independent parts of the circuit are solved as separate, smaller systems
+            solutions = topology.solve(state_dict, points, solver, formulation, workers)
+        else:
+            solutions = self.compile(formulation).solve(state_dict, points, solver)
+
+        with Profiling.phase(self._hooks, "results", size=len(topology.names), points=points):
+            if scalar:
+                solutions = solutions[0]
+            else:
+                # per-name arrays are views over contiguous columns
+                solutions = np.ascontiguousarray(solutions.T)
 
-        return results
+            return SweepResult(solutions, topology.index, topology.names)
 
     def load(self, path, overwrite=False):
         """
@@ -253,16 +932,26 @@ class Circuit(Comparable):
         if not os.path.isfile(path):
             raise IOError("could not find file at provided path")
 
+        with open(path, "r") as f:
+            data = json.load(f)
+
+        self.load_data(data, overwrite)
+
+    def load_data(self, data, overwrite=False):
+        """
+        Builds the circuit described by data, in the format produced by serialize, into self
+        :type data: dict
+        :type overwrite: bool
+        :param data: the circuit description
+        :param overwrite ignore any existing circuit data
+        """
+
         if overwrite:
-            self.nodes = list()
-            self.components = list()
+            self.clear()
         else:
             if len(self.nodes) != 0:
                 raise CircuitError("Cannot overwrite existing circuit without explicit direction")
 
-        with open(path, "r") as f:
-            data = json.load(f)
-
         self.name = data["Name"]
 
         # building the nodes of the circuit
@@ -270,13 +959,7 @@ class Circuit(Comparable):
             self.add_node(Node(node_info["Name"], node_info["Ground"]))
 
         # building the components of the circuit
-        for component_info in data["Components"]:
-            globals()[component_info["Type"]](
-                component_info["Name"],
-                self.get_node(component_info["Negative"]),
-                self.get_node(component_info["Positive"]),
-                **component_info["Attributes"]
-            )
+        self.add_components(data["Components"])
 
     def save(self, path, overwrite=False, pretty_printing=True):
         """
@@ -304,6 +987,46 @@ class Circuit(Comparable):
             else:
                 json.dump(serialized, f)
 
+    def serialize(self):
+        """
+        :return: the JSON compatible description of the circuit written by save
+        """
+
+        return self.__serialize()
+
+    def fingerprint(self):
+        """
+        a digest of the data written by serialize apart from the name of the circuit, i.e. of its topology and
+        component values; it is computed from the arrays of the circuit, only components which are not array
+        backed are asked for their attributes
+        :return: a hex string, cached until the version of the circuit changes
+        """
+
+        if self._fingerprint is not None and self._fingerprint[0] == self.version:
+            return self._fingerprint[1]
+
+        values = self._cmp_values.array
+        if values.dtype.kind == "c" and not np.any(values.imag):
+            values = values.real
+        attributes = [
+            (i, cmp.get_attributes()) for i, cmp in enumerate(self.components) if not is_array_backed(type(cmp))
+        ]
+
+        digest = hashlib.sha256()
+        for part in (
+                self._node_names, self._node_ground.array, [cls.__name__ for cls in self._types], self._cmp_names,
+                self._cmp_types.array, self._cmp_neg.array, self._cmp_pos.array, values, attributes
+        ):
+            if isinstance(part, np.ndarray):
+                digest.update(part.dtype.str.encode())
+                digest.update(np.ascontiguousarray(part).tobytes())
+            else:
+                digest.update(json.dumps(part, sort_keys=True, default=repr).encode())
+            digest.update(b"\0")
+
+        self._fingerprint = (self.version, digest.hexdigest())
+        return self._fingerprint[1]
+
     def __serialize(self):
         """
         :return: a string representation of the circuit
@@ -334,6 +1057,13 @@ class Circuit(Comparable):
 
 
 class Resistor(Component):
+    __slots__ = ()
+
+    has_admittance = True
+    value_name = "resistance"
+
+    resistance = ComponentValue()
+
     def __init__(self, name, n_neg, n_pos, resistance):
         """
         :type name: str
@@ -345,12 +1075,26 @@ class Resistor(Component):
         :param n_pos: positive node connection
         :param resistance: resistance of the resistor
         """
-        super(Resistor, self).__init__(name, n_neg, n_pos)
-
-        self.resistance = resistance
+        super(Resistor, self).__init__(name, n_neg, n_pos, resistance)
 
     def get_params(self, state_dict):
-        return 1, -self.resistance, 0
+        return self.evaluate(self.resistance, state_dict)
+
+    @classmethod
+    def evaluate(cls, value, state_dict):
+        return 1, -np.asarray(value), 0
+
+    @classmethod
+    def companion(cls, value, step, method):
+        return 1, -np.asarray(value), 0, 0, 0
+
+    @classmethod
+    def laplace(cls, value):
+        return 1, 0, -np.asarray(value), 0, 0
+
+    @classmethod
+    def derivatives(cls, value, state_dict):
+        return 0, -1, 0
 
     def get_attributes(self):
         return {
@@ -359,6 +1103,13 @@ class Resistor(Component):
 
 
 class Capacitor(Component):
+    __slots__ = ()
+
+    has_admittance = True
+    value_name = "capacitance"
+
+    capacitance = ComponentValue()
+
     def __init__(self, name, n_neg, n_pos, capacitance):
         """
         :type name: str
@@ -370,15 +1121,50 @@ class Capacitor(Component):
         :param n_pos: positive node connection
         :param capacitance: capacitance of the capacitor
         """
-        super(Capacitor, self).__init__(name, n_neg, n_pos)
-
-        self.capacitance = capacitance
+        super(Capacitor, self).__init__(name, n_neg, n_pos, capacitance)
 
     def get_params(self, state_dict):
+        return self.evaluate(self.capacitance, state_dict)
+
+    @classmethod
+    def evaluate(cls, value, state_dict):
         if "frequency" not in state_dict:
             raise KeyError("frequency not provided")
 
-        return 1, -1j / (2 * pi * state_dict["frequency"] * self.capacitance), 0
+        # V = I / (jwC), the phasor form of the I = C dV/dt solved by companion
+        return 1, 1j / cls._get_susceptance(value, state_dict), 0
+
+    @classmethod
+    def companion(cls, value, step, method):
+        # I = C dV/dt
+        if method == "backward_euler":
+            return np.asarray(value) / step, -1, 0, np.asarray(value) / step, 0
+
+        return 2 * np.asarray(value) / step, -1, 0, 2 * np.asarray(value) / step, 1
+
+    @classmethod
+    def laplace(cls, value):
+        # the row of evaluate is scaled by sC to keep it polynomial in s
+        return 0, np.asarray(value), -1, 0, 0
+
+    @classmethod
+    def derivatives(cls, value, state_dict):
+        if "frequency" not in state_dict:
+            raise KeyError("frequency not provided")
+
+        return 0, -1j / (cls._get_susceptance(value, state_dict) * np.asarray(value)), 0
+
+    @staticmethod
+    def _get_susceptance(value, state_dict):
+        """
+        :return: wC, checked to be non-zero since the impedance of a capacitor is infinite at zero frequency
+        """
+
+        susceptance = 2 * pi * np.asarray(state_dict["frequency"]) * value
+        if np.any(susceptance == 0):
+            raise ZeroDivisionError("the impedance of a capacitor is infinite at zero frequency or capacitance")
+
+        return susceptance
 
     def get_attributes(self):
         return {
@@ -387,6 +1173,13 @@ class Capacitor(Component):
 
 
 class Inductor(Component):
+    __slots__ = ()
+
+    has_admittance = True
+    value_name = "inductance"
+
+    inductance = ComponentValue()
+
     def __init__(self, name, n_neg, n_pos, inductance):
         """
         :type name: str
@@ -398,15 +1191,36 @@ class Inductor(Component):
         :param n_pos: positive node connection
         :param inductance: inductance of the inductor
         """
-        super(Inductor, self).__init__(name, n_neg, n_pos)
-
-        self.inductance = inductance
+        super(Inductor, self).__init__(name, n_neg, n_pos, inductance)
 
     def get_params(self, state_dict):
+        return self.evaluate(self.inductance, state_dict)
+
+    @classmethod
+    def evaluate(cls, value, state_dict):
+        if "frequency" not in state_dict:
+            raise KeyError("frequency not provided")
+
+        return 1, -2j * pi * np.asarray(state_dict["frequency"]) * value, 0
+
+    @classmethod
+    def companion(cls, value, step, method):
+        # V = L dI/dt
+        if method == "backward_euler":
+            return 1, -np.asarray(value) / step, 0, 0, -np.asarray(value) / step
+
+        return 1, -2 * np.asarray(value) / step, 0, -1, -2 * np.asarray(value) / step
+
+    @classmethod
+    def laplace(cls, value):
+        return 1, 0, 0, -np.asarray(value), 0
+
+    @classmethod
+    def derivatives(cls, value, state_dict):
         if "frequency" not in state_dict:
             raise KeyError("frequency not provided")
 
-        return 1, -2j * pi * state_dict["frequency"] * self.inductance, 0
+        return 0, -2j * pi * np.asarray(state_dict["frequency"]), 0
 
     def get_attributes(self):
         return {
@@ -415,6 +1229,13 @@ class Inductor(Component):
 
 
 class VoltageSource(Component):
+    __slots__ = ()
+
+    is_source = True
+    value_name = "voltage"
+
+    voltage = ComponentValue()
+
     def __init__(self, name, n_neg, n_pos, voltage):
         """
         :type name: str
@@ -426,12 +1247,26 @@ class VoltageSource(Component):
         :param n_pos: positive node connection
         :param voltage: voltage across the source
         """
-        super(VoltageSource, self).__init__(name, n_neg, n_pos)
-
-        self.voltage = voltage
+        super(VoltageSource, self).__init__(name, n_neg, n_pos, voltage)
 
     def get_params(self, state_dict):
-        return 1, 0, self.voltage
+        return self.evaluate(self.voltage, state_dict)
+
+    @classmethod
+    def evaluate(cls, value, state_dict):
+        return 1, 0, value
+
+    @classmethod
+    def companion(cls, value, step, method):
+        return 1, 0, value, 0, 0
+
+    @classmethod
+    def laplace(cls, value):
+        return 1, 0, 0, 0, value
+
+    @classmethod
+    def derivatives(cls, value, state_dict):
+        return 0, 0, 1
 
     def get_attributes(self):
         return {
@@ -440,6 +1275,15 @@ class VoltageSource(Component):
 
 
 class CurrentSource(Component):
+    __slots__ = ()
+
+    has_admittance = True
+    constrains_voltage = False
+    is_source = True
+    value_name = "current"
+
+    current = ComponentValue()
+
     def __init__(self, name, n_neg, n_pos, current):
         """
         :type name: str
@@ -451,12 +1295,26 @@ class CurrentSource(Component):
         :param n_pos: positive node connection
         :param current: current through the source
         """
-        super(CurrentSource, self).__init__(name, n_neg, n_pos)
-
-        self.current = current
+        super(CurrentSource, self).__init__(name, n_neg, n_pos, current)
 
     def get_params(self, state_dict):
-        return 0, 1, self.current
+        return self.evaluate(self.current, state_dict)
+
+    @classmethod
+    def evaluate(cls, value, state_dict):
+        return 0, 1, value
+
+    @classmethod
+    def companion(cls, value, step, method):
+        return 0, 1, value, 0, 0
+
+    @classmethod
+    def laplace(cls, value):
+        return 0, 0, 1, 0, value
+
+    @classmethod
+    def derivatives(cls, value, state_dict):
+        return 0, 0, 1
 
     def get_attributes(self):
         return {
@@ -464,8 +1322,38 @@ class CurrentSource(Component):
         }
 
 
+register_component_type(Resistor)
+register_component_type(Capacitor)
+register_component_type(Inductor)
+register_component_type(VoltageSource)
+register_component_type(CurrentSource)
+
 Resistor.get_params.__doc__ = Component.get_params.__doc__
 Capacitor.get_params.__doc__ = Component.get_params.__doc__
 Inductor.get_params.__doc__ = Component.get_params.__doc__
 VoltageSource.get_params.__doc__ = Component.get_params.__doc__
 CurrentSource.get_params.__doc__ = Component.get_params.__doc__
+
+Resistor.evaluate.__func__.__doc__ = Component.evaluate.__doc__
+Capacitor.evaluate.__func__.__doc__ = Component.evaluate.__doc__
+Inductor.evaluate.__func__.__doc__ = Component.evaluate.__doc__
+VoltageSource.evaluate.__func__.__doc__ = Component.evaluate.__doc__
+CurrentSource.evaluate.__func__.__doc__ = Component.evaluate.__doc__
+
+Resistor.companion.__func__.__doc__ = Component.companion.__doc__
+Capacitor.companion.__func__.__doc__ = Component.companion.__doc__
+Inductor.companion.__func__.__doc__ = Component.companion.__doc__
+VoltageSource.companion.__func__.__doc__ = Component.companion.__doc__
+CurrentSource.companion.__func__.__doc__ = Component.companion.__doc__
+
+Resistor.laplace.__func__.__doc__ = Component.laplace.__doc__
+Capacitor.laplace.__func__.__doc__ = Component.laplace.__doc__
+Inductor.laplace.__func__.__doc__ = Component.laplace.__doc__
+VoltageSource.laplace.__func__.__doc__ = Component.laplace.__doc__
+CurrentSource.laplace.__func__.__doc__ = Component.laplace.__doc__
+
+Resistor.derivatives.__func__.__doc__ = Component.derivatives.__doc__
+Capacitor.derivatives.__func__.__doc__ = Component.derivatives.__doc__
+Inductor.derivatives.__func__.__doc__ = Component.derivatives.__doc__
+VoltageSource.derivatives.__func__.__doc__ = Component.derivatives.__doc__
+CurrentSource.derivatives.__func__.__doc__ = Component.derivatives.__doc__
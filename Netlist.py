@@ -0,0 +1,241 @@
+import os
+import json
+import numpy as np
+from Circuit import CircuitError, Node, get_component_type
+from util.ComponentValue import is_array_backed
+
+
+# bytes read from disk at a time by the streaming JSON reader
+READ_SIZE = 1 << 16
+
+# the files of a circuit saved by save_binary
+HEADER = "header.json"
+COLUMNS = ("node_names", "node_ground", "cmp_names", "cmp_types", "cmp_neg", "cmp_pos", "cmp_values")
+
+
+def save_binary(circuit, path, overwrite=False):
+    """
+    Saves the circuit to the directory path in a columnar format
+    every column of the node and component arrays of the circuit is written to its own .npy file, which load_binary
+    memory maps; header.json holds the name of the circuit, the names of the component types and the attributes of
+    the components which are not array backed
+    :type circuit: Circuit
+    :type path: str
+    :type overwrite: bool
+    :param circuit: the circuit to be saved
+    :param path: the directory to which the circuit will be saved
+    :param overwrite: do not check if the directory already exists
+    """
+
+    if type(path) is not str:
+        raise TypeError("argument path is not of type string")
+
+    if not overwrite:
+        if os.path.exists(path):
+            raise FileExistsError("file {} already exists".format(path))
+
+    os.makedirs(path, exist_ok=True)
+
+    types = circuit._cmp_types.array
+    backed = np.array([is_array_backed(cls) for cls in circuit._types], dtype=bool)
+    rows = np.flatnonzero(~backed[types]) if len(types) != 0 else list()
+
+    columns = {
+        "node_names": np.array(circuit._node_names, dtype=str),
+        "node_ground": circuit._node_ground.array,
+        "cmp_names": np.array(circuit._cmp_names, dtype=str),
+        "cmp_types": types,
+        "cmp_neg": circuit._cmp_neg.array,
+        "cmp_pos": circuit._cmp_pos.array,
+        "cmp_values": circuit._cmp_values.array
+    }
+    for name in COLUMNS:
+        np.save(os.path.join(path, name + ".npy"), columns[name])
+
+    header = {
+        "Name": circuit.name,
+        "Types": [cls.__name__ for cls in circuit._types],
+        "Attributes": {str(row): circuit.components[row].get_attributes() for row in rows}
+    }
+
+    # the header is written last, so that an interrupted save cannot be loaded
+    with open(os.path.join(path, HEADER), "w") as f:
+        json.dump(header, f)
+
+
+def load_binary(circuit, path, overwrite=False):
+    """
+    Loads a circuit saved by save_binary into circuit
+    the columns are memory mapped and appended to the arrays of the circuit without building a description of every
+    component; only components which are not array backed are built one by one
+    :type circuit: Circuit
+    :type path: str
+    :type overwrite: bool
+    :param circuit: the circuit to be loaded into
+    :param path: the directory from which the circuit will be loaded
+    :param overwrite: ignore any existing circuit data
+    """
+
+    if type(path) is not str:
+        raise TypeError("argument path is not of type string")
+
+    if not os.path.isfile(os.path.join(path, HEADER)):
+        raise IOError("could not find file at provided path")
+
+    if overwrite:
+        circuit.clear()
+    else:
+        if len(circuit.nodes) != 0:
+            raise CircuitError("Cannot overwrite existing circuit without explicit direction")
+
+    with open(os.path.join(path, HEADER), "r") as f:
+        header = json.load(f)
+    columns = {name: np.load(os.path.join(path, name + ".npy"), mmap_mode="r") for name in COLUMNS}
+
+    circuit.name = header["Name"]
+    circuit.add_nodes(columns["node_names"].tolist(), columns["node_ground"])
+
+    types = [get_component_type(name) for name in header["Types"]]
+    backed = np.array([is_array_backed(cls) for cls in types], dtype=bool)
+    # codes of the array backed types among themselves
+    backed_types = [cls for cls in types if is_array_backed(cls)]
+    backed_codes = np.cumsum(backed) - 1
+
+    names = columns["cmp_names"].tolist()
+    codes = np.asarray(columns["cmp_types"])
+    neg = columns["cmp_neg"]
+    pos = columns["cmp_pos"]
+    values = columns["cmp_values"]
+    attributes = header["Attributes"]
+
+    # runs of array backed components are appended at once, the others are built from their attributes
+    start = 0
+    for row in sorted(int(row) for row in attributes) + [len(names)]:
+        if row > start:
+            run = slice(start, row)
+            if not backed[codes[run]].all():
+                raise CircuitError("components without attributes are not array backed")
+            circuit.add_component_arrays(
+                backed_types, names[run], backed_codes[codes[run]], neg[run], pos[run], values[run]
+            )
+        if row < len(names):
+            cls = types[codes[row]]
+            cls(names[row], circuit.nodes[int(neg[row])], circuit.nodes[int(pos[row])], **attributes[str(row)])
+        start = row + 1
+
+
+def _iter_json(f):
+    """
+    incrementally decodes a circuit saved by Circuit.save
+    :return: a generator of (key, value) where key is "Name", "Node" or "Component"
+    """
+
+    decoder = json.JSONDecoder()
+    buf = ""
+    pos = 0
+    eof = False
+
+    def fill():
+        nonlocal buf, pos, eof
+        chunk = f.read(READ_SIZE)
+        eof = len(chunk) == 0
+        buf = buf[pos:] + chunk
+        pos = 0
+
+    def skip(chars=" \t\r\n"):
+        nonlocal pos
+        while True:
+            while pos < len(buf) and buf[pos] in chars:
+                pos += 1
+            if pos < len(buf) or eof:
+                return
+            fill()
+
+    def expect(char):
+        nonlocal pos
+        skip()
+        if pos >= len(buf) or buf[pos] != char:
+            raise ValueError("malformed circuit file, expected {}".format(char))
+        pos += 1
+
+    def peek():
+        skip()
+        return buf[pos] if pos < len(buf) else ""
+
+    def decode():
+        nonlocal pos
+        skip()
+        while True:
+            try:
+                value, end = decoder.raw_decode(buf, pos)
+                # a value ending the buffer might continue in the next chunk
+                if end < len(buf) or eof:
+                    pos = end
+                    return value
+            except json.JSONDecodeError:
+                if eof:
+                    raise
+            fill()
+
+    fill()
+    expect("{")
+    while peek() != "}":
+        key = decode()
+        expect(":")
+        if key in ("Nodes", "Components"):
+            expect("[")
+            while peek() != "]":
+                yield key[:-1], decode()
+                if peek() == ",":
+                    expect(",")
+            expect("]")
+        else:
+            yield key, decode()
+        if peek() == ",":
+            expect(",")
+
+
+def stream_load(circuit, path, overwrite=False, batch_size=10000):
+    """
+    Loads a circuit saved by Circuit.save without reading the whole file into memory
+    components are added through Circuit.add_components in batches of batch_size
+    :type circuit: Circuit
+    :type path: str
+    :type overwrite: bool
+    :type batch_size: int
+    :param circuit: the circuit to be loaded into
+    :param path: the location from which the circuit will be loaded
+    :param overwrite: ignore any existing circuit data
+    :param batch_size: number of components validated and built at once
+    """
+
+    if type(path) is not str:
+        raise TypeError("argument path is not of type string")
+
+    if not os.path.isfile(path):
+        raise IOError("could not find file at provided path")
+
+    if overwrite:
+        circuit.clear()
+    else:
+        if len(circuit.nodes) != 0:
+            raise CircuitError("Cannot overwrite existing circuit without explicit direction")
+
+    batch = list()
+    components_started = False
+    with open(path, "r") as f:
+        for key, value in _iter_json(f):
+            if key == "Name":
+                circuit.name = value
+            elif key == "Node":
+                if components_started:
+                    raise CircuitError("nodes must be listed before the components using them")
+                circuit.add_node(Node(value["Name"], value["Ground"]))
+            elif key == "Component":
+                components_started = True
+                batch.append(value)
+                if len(batch) >= batch_size:
+                    circuit.add_components(batch)
+                    batch = list()
+
+    circuit.add_components(batch)
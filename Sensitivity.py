@@ -0,0 +1,64 @@
+import numpy as np
+from StampPlan import normalize_state
+from util import Factorization
+from SweepResult import SweepResult
+
+
+def sensitivities(circuit, state_dict, outputs, solver="auto"):
+    """
+    the derivatives of outputs with respect to the value of every component, from the adjoint system
+    every frequency is factorized once; the solution x comes from M x = r and one multipliers vector per output
+    from the transposed system M^T l = e_output, solved with the same factorization. A component only appears in
+    its own row of the mna system, so
+
+        d(output)/d(value) = l[row] * (dC - dA (Vp - Vn) - dB I)
+
+    which costs O(1) per component once x and l are known
+    :type state_dict: dict
+    :type outputs: list
+    :type solver: str
+    :param circuit: the circuit to be analysed
+    :param state_dict: the external parameters of the circuit, the frequency may be an array of F frequencies
+    :param outputs: names of the nodes and components whose sensitivities are computed
+    :param solver: "dense", "sparse", "banded" or "auto", see Circuit.ac_sweep
+    :return: a dictionary mapping each output to a SweepResult keyed by component name, holding the derivative of
+             the output with respect to the value of every active component which has a value, as an array over
+             the frequencies or a scalar for a scalar frequency
+    """
+
+    circuit.check_topology()
+    plan = circuit.compile("mna")
+    state_dict, scalar, points = normalize_state(state_dict)
+    outputs = list(outputs)
+
+    a, b, c = plan.get_params(state_dict, points)
+    data, rhs = plan.scatter(a, b, c)
+    d_a, d_b, d_c, supported = plan.get_derivatives(state_dict, points)
+
+    # every unknown of the mna formulation is a result, so result positions double as rows of the system
+    selected = np.zeros([plan.size, len(outputs)])
+    selected[[plan.index[name] for name in outputs], np.arange(len(outputs))] = 1
+
+    solutions = np.empty([points, plan.size + 1], dtype=np.complex128)
+    solutions[:, -1] = 0
+    multipliers = np.empty([points, plan.size, len(outputs)], dtype=np.complex128)
+    ordering = plan.get_ordering(solver)
+    for i in range(points):
+        factorization = Factorization.factorize(plan.size, plan.rows, plan.cols, data[i], solver, ordering)
+        solutions[i, :-1] = factorization.solve(rhs[i])
+        multipliers[i] = factorization.solve(selected, trans=True)
+
+    voltage = solutions[:, plan.terminal_pos] - solutions[:, plan.terminal_neg]
+    current = solutions[:, plan.active_index]
+    residual = d_c - d_a * voltage - d_b * current
+
+    # (O, M, F) derivatives of every output
+    results = np.moveaxis(multipliers[:, plan.active_index] * residual[:, :, np.newaxis], [0, 1, 2], [2, 1, 0])
+    results = results[:, supported]
+    if scalar:
+        results = results[..., 0]
+
+    names = [name for name, keep in zip(plan.active_names, supported.tolist()) if keep]
+    index = {name: i for i, name in enumerate(names)}
+
+    return {name: SweepResult(results[i], index, names) for i, name in enumerate(outputs)}
@@ -0,0 +1,377 @@
+import json
+import asyncio
+import hashlib
+import argparse
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+from Circuit import Circuit, CircuitError, get_component_type
+from util import Solvers
+from util.ComponentValue import is_array_backed
+import Sweep
+
+
+# longest request line accepted by the server, in bytes
+MAX_LINE_BYTES = 1 << 26
+
+# errors of malformed requests, which are answered instead of closing the connection
+REQUEST_ERRORS = (AttributeError, KeyError, TypeError, ValueError, CircuitError)
+
+# errors of jobs which cannot be solved, which are answered with the message of the error
+SOLVE_ERRORS = (np.linalg.LinAlgError, CircuitError, KeyError, TypeError, ValueError, NameError, ZeroDivisionError)
+
+
+def topology_key(data):
+    """
+    :type data: dict
+    :param data: a circuit in the format written by Circuit.save
+    :return: a digest of the nodes of data and of the names, types and terminals of its components, which is
+             shared by circuits differing only in their component values
+    """
+
+    nodes = [(node["Name"], node["Ground"]) for node in data["Nodes"]]
+    components = [(cmp["Name"], cmp["Type"], cmp["Negative"], cmp["Positive"]) for cmp in data["Components"]]
+
+    return hashlib.sha256(json.dumps([nodes, components]).encode()).hexdigest()
+
+
+class Job(object):
+    """
+    one ac sweep submitted to a JobServer
+    """
+
+    __slots__ = ("id", "data", "frequency", "outputs", "key", "values", "future")
+
+    def __init__(self, request, future):
+        """
+        :type request: dict
+        :param request: a dictionary holding the circuit under "Circuit" in the format written by Circuit.save, the
+                        frequencies under "Frequency" and optionally the names of the results to return under
+                        "Outputs" and an identifier echoed in the response under "Id"
+        :param future: the future receiving the response
+        """
+
+        if not isinstance(request, dict):
+            raise TypeError("request is not a JSON object")
+
+        self.id = request.get("Id")
+        self.data = request["Circuit"]
+        self.frequency = np.atleast_1d(np.asarray(request["Frequency"], dtype=np.float64))
+        if self.frequency.ndim != 1:
+            raise ValueError("frequency must be a scalar or a 1-D array")
+        self.outputs = request.get("Outputs")
+        self.future = future
+
+        # jobs can only share a solve when every component is described by its value alone
+        self.key = topology_key(self.data)
+        self.values = np.empty(len(self.data["Components"]))
+        for i, cmp in enumerate(self.data["Components"]):
+            cls = get_component_type(cmp["Type"])
+            attributes = cmp.get("Attributes", dict())
+            if not (is_array_backed(cls) and set(attributes) == {cls.value_name}):
+                self.key = None
+                self.values = None
+                break
+            self.values[i] = attributes[cls.value_name]
+
+
+class JobServer(object):
+    """
+    a local service solving the ac sweeps of many clients in one process
+
+    Requests are read as one JSON object per line from a unix socket or a TCP connection, see Job, and the
+    responses are written back as one JSON object per line in the order the jobs finish. Jobs wait in a bounded
+    queue, so that clients are slowed down instead of the server running out of memory. The worker takes every
+    queued job at once; jobs whose circuits share a topology are solved together, as one stacked system per
+    frequency of every job with the values of that job, against a stamp plan which is compiled once per topology
+    and kept for later jobs.
+    """
+
+    def __init__(self, max_queue=1024, max_batch=256, max_topologies=64, solver="auto"):
+        """
+        :type max_queue: int
+        :type max_batch: int
+        :type max_topologies: int
+        :type solver: str
+        :param max_queue: number of jobs waiting before submitting blocks
+        :param max_batch: number of jobs taken from the queue at once
+        :param max_topologies: number of compiled topologies kept, the least recently used are dropped
+        :param solver: "dense", "sparse", "banded" or "auto", see Circuit.ac_sweep
+        """
+
+        self.max_queue = max_queue
+        self.max_batch = max_batch
+        self.max_topologies = max_topologies
+        self.solver = solver
+
+        self.jobs = 0
+        self.batches = 0
+
+        self._queue = None
+        self._worker = None
+        self._executor = None
+        self._templates = OrderedDict()
+
+    async def start(self):
+        """
+        starts the worker solving the queued jobs, called by the serve methods
+        """
+
+        if self._worker is None:
+            self._queue = asyncio.Queue(self.max_queue)
+            self._executor = ThreadPoolExecutor(1)
+            self._worker = asyncio.ensure_future(self._work())
+
+    async def close(self):
+        """
+        stops the worker, jobs still waiting are cancelled
+        """
+
+        if self._worker is None:
+            return
+
+        self._worker.cancel()
+        try:
+            await self._worker
+        except asyncio.CancelledError:
+            pass
+        while not self._queue.empty():
+            self._queue.get_nowait().future.cancel()
+        self._executor.shutdown()
+        self._worker = None
+
+    async def serve_unix(self, path):
+        """
+        :type path: str
+        :param path: path of the unix socket
+        :return: the asyncio server accepting connections
+        """
+
+        await self.start()
+        return await asyncio.start_unix_server(self._handle, path, limit=MAX_LINE_BYTES)
+
+    async def serve_tcp(self, host="127.0.0.1", port=0):
+        """
+        :type host: str
+        :type port: int
+        :param host: address listened on, only the local machine by default
+        :param port: port listened on, any free port if 0
+        :return: the asyncio server accepting connections
+        """
+
+        await self.start()
+        return await asyncio.start_server(self._handle, host, port, limit=MAX_LINE_BYTES)
+
+    async def _enqueue(self, request):
+        """
+        :return: the queued Job, waiting for room in the queue if it is full
+        """
+
+        job = Job(request, asyncio.get_running_loop().create_future())
+        await self._queue.put(job)
+
+        return job
+
+    async def submit(self, request):
+        """
+        solves a job within the process of the server
+        :type request: dict
+        :param request: the job, see Job
+        :return: the response, see _respond
+        """
+
+        await self.start()
+        try:
+            job = await self._enqueue(request)
+        except REQUEST_ERRORS as e:
+            return {"Id": request.get("Id") if isinstance(request, dict) else None, "Error": str(e)}
+
+        return await job.future
+
+    async def _handle(self, reader, writer):
+        lock = asyncio.Lock()
+        pending = set()
+
+        async def send(response):
+            async with lock:
+                writer.write((json.dumps(response) + "\n").encode())
+                await writer.drain()
+
+        async def answer(job):
+            await send(await job.future)
+
+        while True:
+            line = await reader.readline()
+            if not line:
+                break
+            if not line.strip():
+                continue
+
+            request = None
+            try:
+                request = json.loads(line)
+                # reading stops while the queue is full
+                job = await self._enqueue(request)
+            except REQUEST_ERRORS as e:
+                await send({"Id": request.get("Id") if isinstance(request, dict) else None, "Error": str(e)})
+                continue
+
+            task = asyncio.ensure_future(answer(job))
+            pending.add(task)
+            task.add_done_callback(pending.discard)
+
+        if pending:
+            await asyncio.gather(*pending)
+        writer.close()
+
+    async def _work(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            jobs = [await self._queue.get()]
+            while len(jobs) < self.max_batch and not self._queue.empty():
+                jobs.append(self._queue.get_nowait())
+
+            try:
+                responses = await loop.run_in_executor(self._executor, self._solve_jobs, jobs)
+            except Exception as e:
+                # the worker has to outlive any error, otherwise every later job waits forever
+                responses = [{"Id": job.id, "Error": "{}: {}".format(type(e).__name__, e)} for job in jobs]
+
+            for job, response in zip(jobs, responses):
+                if not job.future.done():
+                    job.future.set_result(response)
+
+    def _get_template(self, job):
+        """
+        :return: the (circuit, plan) compiled for the topology of job
+        """
+
+        if job.key in self._templates:
+            self._templates.move_to_end(job.key)
+            return self._templates[job.key]
+
+        circuit = Circuit()
+        circuit.load_data(job.data)
+        circuit.check_topology()
+        self._templates[job.key] = (circuit, circuit.compile("mna"))
+        while len(self._templates) > self.max_topologies:
+            self._templates.popitem(last=False)
+
+        return self._templates[job.key]
+
+    def _solve_jobs(self, jobs):
+        """
+        :return: the response of every job, in order
+        """
+
+        self.jobs += len(jobs)
+        groups = OrderedDict()
+        for i, job in enumerate(jobs):
+            groups.setdefault(job.key if job.key is not None else i, list()).append(i)
+
+        responses = [None] * len(jobs)
+        for key, members in groups.items():
+            group = [jobs[i] for i in members]
+            solved = None
+            if group[0].key is not None:
+                # even a lone job is solved against the compiled template of its topology
+                try:
+                    solved = self._solve_group(group)
+                except SOLVE_ERRORS:
+                    # the failing jobs are found by solving them one at a time
+                    pass
+
+            if solved is None:
+                solved = [self._solve_job(job) for job in group]
+            for i, response in zip(members, solved):
+                responses[i] = response
+
+        return responses
+
+    def _solve_group(self, jobs):
+        """
+        solves jobs sharing a topology as one stack of systems, one per frequency of every job
+        """
+
+        circuit, plan = self._get_template(jobs[0])
+        frequency = np.concatenate([job.frequency for job in jobs])
+        owner = np.repeat(np.arange(len(jobs)), [len(job.frequency) for job in jobs])
+        values = np.stack([job.values for job in jobs])[:, plan.active]
+
+        solutions = np.empty([len(frequency), len(plan.names)], dtype=np.complex128)
+        ordering = plan.get_ordering(self.solver)
+        chunk = Sweep._get_chunks(plan, len(frequency), 1, self.solver, None)[0]
+        for start in range(0, len(frequency), chunk):
+            systems = slice(start, start + chunk)
+            points = len(frequency[systems])
+            a, b, c = plan.get_params({"frequency": frequency[systems]}, points, values[owner[systems]])
+            data, rhs = plan.scatter(a, b, c)
+            solved = Solvers.solve(plan.size, plan.rows, plan.cols, data, rhs, self.solver, ordering)
+            solutions[systems] = plan.expand(solved, a, b, c)
+        self.batches += 1
+
+        bounds = np.cumsum([len(job.frequency) for job in jobs])[:-1]
+        return [
+            self._respond(job, plan.names, plan.index, block)
+            for job, block in zip(jobs, np.split(solutions, bounds))
+        ]
+
+    def _solve_job(self, job):
+        """
+        solves a single job on its own circuit, for jobs which cannot share a template or failed in a group
+        """
+
+        try:
+            circuit = Circuit()
+            circuit.load_data(job.data)
+            results = circuit.ac_sweep({"frequency": job.frequency}, self.solver)
+            self.batches += 1
+            return self._respond(job, results.names, results.index, results.solutions.T)
+        except SOLVE_ERRORS as e:
+            return {"Id": job.id, "Error": str(e)}
+
+    @staticmethod
+    def _respond(job, names, index, solutions):
+        """
+        :param solutions: (F, len(names)) results of job
+        :return: a dictionary holding the real and imaginary parts of every requested result, keyed by name
+        """
+
+        outputs = names if job.outputs is None else job.outputs
+        missing = [name for name in outputs if name not in index]
+        if len(missing) != 0:
+            return {"Id": job.id, "Error": "unknown outputs {}".format(", ".join(missing))}
+
+        return {
+            "Id": job.id,
+            "Results": {
+                name: {"Real": solutions[:, index[name]].real.tolist(), "Imag": solutions[:, index[name]].imag.tolist()}
+                for name in outputs
+            }
+        }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="serves ac sweeps of circuits to local clients")
+    parser.add_argument("--unix", default=None, help="path of the unix socket to listen on")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--max-queue", type=int, default=1024)
+    parser.add_argument("--solver", choices=Solvers.SOLVERS, default="auto")
+    args = parser.parse_args()
+
+    async def serve():
+        server = JobServer(max_queue=args.max_queue, solver=args.solver)
+        if args.unix is not None:
+            listener = await server.serve_unix(args.unix)
+        else:
+            listener = await server.serve_tcp(args.host, args.port)
+
+        async with listener:
+            await listener.serve_forever()
+
+    asyncio.run(serve())
+
+
+if __name__ == "__main__":
+    main()
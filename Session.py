@@ -0,0 +1,146 @@
+import numpy as np
+from StampPlan import normalize_state
+from util import Factorization
+from Circuit import CircuitError
+from SweepResult import SweepResult
+
+
+class Session(object):
+    """
+    solves a circuit repeatedly while its component values are edited, e.g. in a tuning loop
+
+    The system of the first solve is factorized and kept. Later solves assemble the system again, which is cheap,
+    and treat the rows which changed since the factorization as a low-rank update M = M0 + E D, solved with the
+    Sherman-Morrison-Woodbury identity
+
+        M^-1 b = y - Z (I + D Z)^-1 D y,    y = M0^-1 b,  Z = M0^-1 E
+
+    In the mna formulation a component value only appears in the row of its component, so every edited component
+    adds one to the rank of the update. Once more than max_updates rows have changed, the current system is
+    factorized from scratch. Topology changes are detected through the compiled plan of the circuit.
+    """
+
+    def __init__(self, circuit, state_dict, solver="auto", formulation="mna", max_updates=16):
+        """
+        :type state_dict: dict
+        :type solver: str
+        :type formulation: str
+        :type max_updates: int
+        :param circuit: the circuit to be solved
+        :param state_dict: the external parameters of the circuit, the frequency may be an array of frequencies
+        :param solver: "dense", "sparse", "banded" or "auto", see Circuit.ac_sweep
+        :param formulation: "mna" or "nodal", see Circuit.ac_sweep
+        :param max_updates: the largest rank of the update before the system is factorized again
+        """
+
+        self.circuit = circuit
+        self.state_dict, self.scalar, self.points = normalize_state(state_dict)
+        self.solver = solver
+        self.formulation = formulation
+        self.max_updates = max_updates
+
+        self.plan = None
+        self.data = None
+        self.factorizations = None
+        self.rank = 0
+        self.refactorizations = 0
+
+        # M0^-1 e_row of every row which has been updated since the factorization, over every point
+        self._columns = dict()
+
+    def factorize(self):
+        """
+        factorizes the current system of the circuit, discarding any pending update
+        """
+
+        self.circuit.check_topology()
+        self.plan = self.circuit.compile(self.formulation)
+        a, b, c = self.plan.get_params(self.state_dict, self.points)
+        self.data = self.plan.scatter(a, b, c)[0]
+        self.factorizations = [
+            Factorization.factorize(
+                self.plan.size, self.plan.rows, self.plan.cols, data, self.solver, self.plan.get_ordering(self.solver)
+            )
+            for data in self.data
+        ]
+        self._columns = dict()
+        self.rank = 0
+        self.refactorizations += 1
+
+    def update(self, name, value):
+        """
+        changes the value of a component, equivalent to setting the attribute named by its value_name
+        :type name: str
+        :param name: name of the component
+        :param value: the new value
+        """
+
+        cmp = self.circuit.get_component(name)
+        if type(cmp).value_name is None:
+            raise CircuitError("component {} does not have a value to update".format(name))
+
+        setattr(cmp, type(cmp).value_name, value)
+
+    def _get_columns(self, rows):
+        """
+        :return: (F, N, k) array of M0^-1 e_row for each of rows
+        """
+
+        missing = [row for row in rows.tolist() if row not in self._columns]
+        if len(missing) != 0:
+            unit = np.zeros([self.plan.size, len(missing)], dtype=self.data.dtype)
+            unit[missing, np.arange(len(missing))] = 1
+            solved = np.stack([factorization.solve(unit) for factorization in self.factorizations])
+            for i, row in enumerate(missing):
+                self._columns[row] = solved[:, :, i]
+
+        return np.stack([self._columns[row] for row in rows.tolist()], axis=-1)
+
+    def _solve(self, data, rhs):
+        plan = self.plan
+        changed = np.flatnonzero(np.any(data != self.data, axis=0))
+        rows = np.unique(plan.rows[changed])
+        if len(rows) > self.max_updates:
+            self.factorize()
+            changed = rows = np.zeros(0, dtype=np.int64)
+
+        solutions = np.stack([factorization.solve(b) for factorization, b in zip(self.factorizations, rhs)])
+        self.rank = len(rows)
+        if len(rows) == 0:
+            return solutions
+
+        # the changed rows of M - M0 as a dense (k, N) block D of every point
+        update = np.zeros([self.points, len(rows), plan.size], dtype=data.dtype)
+        update[:, np.searchsorted(rows, plan.rows[changed]), plan.cols[changed]] = \
+            data[:, changed] - self.data[:, changed]
+
+        columns = self._get_columns(rows)
+        capacitance = np.eye(len(rows)) + update @ columns
+        try:
+            correction = np.linalg.solve(capacitance, (update @ solutions[..., np.newaxis]))
+        except np.linalg.LinAlgError:
+            # the update cancels the factorized system, only a new factorization can tell if M is singular
+            self.factorize()
+            return np.stack([factorization.solve(b) for factorization, b in zip(self.factorizations, rhs)])
+
+        return solutions - (columns @ correction)[..., 0]
+
+    def solve(self):
+        """
+        solves the circuit with its current component values
+        :return: a SweepResult like the one of Circuit.ac_sweep
+        """
+
+        if self.plan is None or self.circuit.compile(self.formulation) is not self.plan:
+            self.factorize()
+
+        a, b, c = self.plan.get_params(self.state_dict, self.points)
+        data, rhs = self.plan.scatter(a, b, c)
+        solutions = self.plan.expand(self._solve(data, rhs), a, b, c)
+
+        if self.scalar:
+            solutions = solutions[0]
+        else:
+            solutions = np.ascontiguousarray(solutions.T)
+
+        return SweepResult(solutions, self.plan.index, self.plan.names)
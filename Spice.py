@@ -0,0 +1,267 @@
+import os
+import re
+import cmath
+import math
+from Circuit import CircuitError, Node
+
+
+# SPICE card letter -> saved component type
+CARD_TYPES = {
+    "R": "Resistor",
+    "C": "Capacitor",
+    "L": "Inductor",
+    "V": "VoltageSource",
+    "I": "CurrentSource"
+}
+TYPE_CARDS = {name: card for card, name in CARD_TYPES.items()}
+
+ATTRIBUTES = {
+    "Resistor": "resistance",
+    "Capacitor": "capacitance",
+    "Inductor": "inductance",
+    "VoltageSource": "voltage",
+    "CurrentSource": "current"
+}
+
+SUFFIXES = {
+    "t": 1e12,
+    "g": 1e9,
+    "meg": 1e6,
+    "k": 1e3,
+    "mil": 25.4e-6,
+    "m": 1e-3,
+    "u": 1e-6,
+    "n": 1e-9,
+    "p": 1e-12,
+    "f": 1e-15
+}
+
+GROUND = "0"
+
+_number = re.compile(r"([+-]?(?:\d+\.?\d*|\.\d+)(?:e[+-]?\d+)?)(meg|mil|[tgkmunpf])?", re.IGNORECASE)
+
+
+def parse_value(token):
+    """
+    parses a SPICE number with an optional engineering suffix, any trailing unit is ignored, e.g. 10uF
+    :type token: str
+    :param token: the number to be parsed
+    :return: the value as a float
+    """
+
+    match = _number.match(token)
+    if match is None:
+        raise ValueError("{} is not a SPICE number".format(token))
+
+    value = float(match.group(1))
+    if match.group(2) is not None:
+        value *= SUFFIXES[match.group(2).lower()]
+
+    return value
+
+
+def _is_value(token):
+    return _number.match(token) is not None
+
+
+def _source_value(tokens):
+    """
+    :return: the AC magnitude and phase of a source if given, its DC value otherwise
+    """
+
+    dc = 0
+    ac = None
+    i = 0
+    while i < len(tokens):
+        keyword = tokens[i].upper()
+        if keyword == "DC" and i + 1 < len(tokens):
+            dc = parse_value(tokens[i + 1])
+            i += 2
+        elif keyword == "AC":
+            magnitude = parse_value(tokens[i + 1]) if i + 1 < len(tokens) and _is_value(tokens[i + 1]) else 1
+            phase = parse_value(tokens[i + 2]) if i + 2 < len(tokens) and _is_value(tokens[i + 2]) else 0
+            ac = magnitude if phase == 0 else cmath.rect(magnitude, math.radians(phase))
+            i += 3 if phase != 0 else 2
+        elif i == 0 and _is_value(tokens[i]):
+            dc = parse_value(tokens[i])
+            i += 1
+        else:
+            # transient specifications such as SIN(...) do not affect an ac analysis
+            i += 1
+
+    return dc if ac is None else ac
+
+
+def _tokenize(line):
+    """
+    :return: the tokens of a line, parentheses and commas of argument lists such as SIN(0, 1, 1k) separate tokens
+    """
+
+    return line.replace("(", " ").replace(")", " ").replace(",", " ").split()
+
+
+def _cards(text):
+    """
+    splits a deck into cards in a single pass, joining continuation lines and dropping comments
+    :return: a generator of (line number, tokens)
+    """
+
+    card = None
+    number = 0
+    for number, line in enumerate(text.splitlines(), 1):
+        if number == 1:
+            # the first line of a deck is always its title
+            continue
+
+        line = line.split(";", 1)[0].strip()
+        if len(line) == 0 or line[0] == "*":
+            continue
+
+        if line[0] == "+":
+            if card is None:
+                raise CircuitError("continuation without a card on line {}".format(number))
+            card[1].extend(_tokenize(line[1:]))
+            continue
+
+        if card is not None:
+            yield card
+        card = (number, _tokenize(line))
+
+    if card is not None:
+        yield card
+
+
+def parse_spice(circuit, text):
+    """
+    builds the circuit described by a SPICE deck into circuit
+    R, C, L, V and I cards are supported, node 0 is ground; dot commands other than .end are ignored
+    :type text: str
+    :param circuit: the circuit to be built into
+    :param text: the contents of the deck
+    """
+
+    title = text.split("\n", 1)[0].strip()
+
+    node_names = dict()
+    components = list()
+    for number, tokens in _cards(text):
+        card = tokens[0][0].upper()
+        if card == ".":
+            if tokens[0].lower() == ".end":
+                break
+            if tokens[0].lower() == ".subckt":
+                raise CircuitError("subcircuits are not supported, line {}".format(number))
+            continue
+
+        if card not in CARD_TYPES:
+            raise CircuitError("unsupported SPICE card {} on line {}".format(tokens[0], number))
+        if len(tokens) < 4 and card not in "VI":
+            raise CircuitError("card {} on line {} needs two nodes and a value".format(tokens[0], number))
+        if len(tokens) < 3:
+            raise CircuitError("card {} on line {} needs two nodes".format(tokens[0], number))
+
+        component_type = CARD_TYPES[card]
+        if card in "VI":
+            value = _source_value(tokens[3:])
+        else:
+            value = parse_value(tokens[3])
+
+        node_names.setdefault(tokens[1], None)
+        node_names.setdefault(tokens[2], None)
+        components.append({
+            "Type": component_type,
+            "Name": tokens[0],
+            "Negative": tokens[2],
+            "Positive": tokens[1],
+            "Attributes": {ATTRIBUTES[component_type]: value}
+        })
+
+    circuit.name = title
+    for name in node_names:
+        circuit.add_node(Node(name, name == GROUND))
+
+    circuit.add_components(components)
+
+
+def load_spice(circuit, path, overwrite=False):
+    """
+    Loads the SPICE deck found at path into circuit
+    :type path: str
+    :type overwrite: bool
+    :param circuit: the circuit to be loaded into
+    :param path: the location of the .cir deck
+    :param overwrite: ignore any existing circuit data
+    """
+
+    if type(path) is not str:
+        raise TypeError("argument path is not of type string")
+
+    if not os.path.isfile(path):
+        raise IOError("could not find file at provided path")
+
+    if overwrite:
+        circuit.clear()
+    else:
+        if len(circuit.nodes) != 0:
+            raise CircuitError("Cannot overwrite existing circuit without explicit direction")
+
+    with open(path, "r") as f:
+        parse_spice(circuit, f.read())
+
+
+def _format_value(value):
+    if isinstance(value, complex):
+        return "{!r} {!r}".format(abs(value), math.degrees(cmath.phase(value)))
+
+    return repr(float(value))
+
+
+def format_spice(circuit):
+    """
+    :param circuit: the circuit to be written
+    :return: the circuit as a SPICE deck; every ground node is written as node 0 and component names which do
+             not start with their card letter are prefixed with it
+    """
+
+    lines = [circuit.name if circuit.name else "*"]
+
+    def node_name(node):
+        return GROUND if node.ground else node.name
+
+    for cmp in circuit.components:
+        component_type = cmp.get_type()
+        if component_type not in TYPE_CARDS:
+            raise CircuitError("component {} of type {} has no SPICE card".format(cmp.name, component_type))
+
+        card = TYPE_CARDS[component_type]
+        name = cmp.name if cmp.name[:1].upper() == card else card + cmp.name
+        value = _format_value(getattr(cmp, ATTRIBUTES[component_type]))
+        if card in "VI":
+            value = "AC " + value
+
+        lines.append("{} {} {} {}".format(name, node_name(cmp.n_pos), node_name(cmp.n_neg), value))
+
+    lines.append(".end")
+
+    return "\n".join(lines) + "\n"
+
+
+def save_spice(circuit, path, overwrite=False):
+    """
+    Saves the circuit to path as a SPICE deck
+    :type path: str
+    :type overwrite: bool
+    :param circuit: the circuit to be saved
+    :param path: the location to which the deck will be saved
+    :param overwrite: do not check if the file already exists
+    """
+
+    if type(path) is not str:
+        raise TypeError("argument path is not of type string")
+
+    if not overwrite:
+        if os.path.isfile(path):
+            raise FileExistsError("file {} already exists".format(path))
+
+    with open(path, "w") as f:
+        f.write(format_spice(circuit))
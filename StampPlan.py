@@ -0,0 +1,465 @@
+import numpy as np
+from util import Solvers, Profiling
+from util.ComponentValue import is_array_backed
+
+
+FORMULATIONS = ("mna", "nodal")
+
+
+def normalize_state(state_dict):
+    """
+    copies state_dict, converting the frequency to a float scalar or 1-D array
+    :type state_dict: dict
+    :param state_dict: a dictionary of all external circuit parameters
+    :return: (state_dict, scalar, points) where points is the number of stacked systems to solve
+    """
+
+    state_dict = dict(state_dict)
+    scalar = True
+    if "frequency" in state_dict:
+        frequency = np.asarray(state_dict["frequency"], dtype=np.float64)
+        if frequency.ndim > 1:
+            raise ValueError("frequency must be a scalar or a 1-D array")
+        scalar = frequency.ndim == 0
+        state_dict["frequency"] = frequency if scalar else frequency.copy()
+
+    return state_dict, scalar, 1 if scalar else len(state_dict["frequency"])
+
+
+def _frozen(array, dtype):
+    array = np.asarray(array, dtype=dtype)
+    array.setflags(write=False)
+    return array
+
+
+class StampPlan(object):
+    """
+    an immutable description of where every entry of a circuit's linear system lives
+
+    Results are numbered nodes first, then components, in circuit order. The matrix pattern is stored once in
+    coalesced CSC order; every solve only evaluates the component parameters and scatters them into a fresh
+    value buffer through precomputed slot indices. The plan is built from the component arrays of the circuit
+    and evaluates array backed component types with one vectorized call per type.
+
+    Two formulations are supported:
+        "mna"   - one unknown per node and per component, every component contributes its AV+BI=C row
+        "nodal" - ground nodes are eliminated and components with an admittance are stamped as Y=-A/B, J=C/B
+                  between their nodes; only the remaining components keep a branch current unknown. The
+                  currents of admittance components are recovered from the node voltages after the solve.
+    """
+
+    def __init__(self, circuit, nodes=None, components=None, formulation="mna"):
+        """
+        :type nodes: np.ndarray
+        :type components: np.ndarray
+        :type formulation: str
+        :param circuit: the circuit whose arrays are planned
+        :param nodes: rows of the nodes to be included, in circuit order, every node if None
+        :param components: rows of the components to be included, in circuit order, every component if None
+        :param formulation: either "mna" or "nodal"
+        """
+
+        if formulation not in FORMULATIONS:
+            raise ValueError("unknown formulation {}, expected one of {}".format(formulation, FORMULATIONS))
+
+        self.formulation = formulation
+        self.circuit = circuit
+        nodes = np.arange(len(circuit.nodes)) if nodes is None else np.asarray(nodes, dtype=np.int64)
+        cmps = np.arange(len(circuit.components)) if components is None else np.asarray(components, dtype=np.int64)
+        self.nodes = _frozen(nodes, np.int64)
+        self.components = _frozen(cmps, np.int64)
+
+        self.names = tuple([circuit._node_names[i] for i in nodes.tolist()] +
+                           [circuit._cmp_names[i] for i in cmps.tolist()])
+        self.index = dict()
+        for i, name in enumerate(self.names):
+            self.index.setdefault(name, i)
+
+        ground = circuit._node_ground.array
+        neg = circuit._cmp_neg.array[cmps]
+        pos = circuit._cmp_pos.array[cmps]
+        neg_ground = ground[neg]
+        pos_ground = ground[pos]
+        self.grounded = bool(np.any(ground[nodes]))
+        has_admittance = np.array([cls.has_admittance for cls in circuit._types], dtype=bool)
+        has_admittance = has_admittance[circuit._cmp_types.array[cmps]]
+
+        # position of every node of the circuit in the results, nodes outside of the plan map past the end
+        node_num = np.full(len(circuit.nodes), len(self.names), dtype=np.int64)
+        node_num[nodes] = np.arange(len(nodes))
+        cmp_num = np.arange(len(cmps)) + len(nodes)
+
+        # components whose parameters are evaluated; components with both terminals grounded carry no current
+        active = ~(neg_ground & pos_ground)
+        self.active = _frozen(cmps[active], np.int64)
+        self.active_names = tuple(circuit._cmp_names[i] for i in self.active.tolist())
+        owner = np.cumsum(active) - 1
+
+        # unknown of every node and component, -1 for those eliminated by the formulation
+        node_var = np.full(len(circuit.nodes), -1, dtype=np.int64)
+        if formulation == "mna":
+            node_unknowns = np.arange(len(nodes))
+            cmp_unknowns = np.arange(len(cmps))
+            admittances = np.zeros(0, dtype=np.int64)
+        else:
+            node_unknowns = np.flatnonzero(~ground[nodes])
+            cmp_unknowns = np.flatnonzero(active & ~has_admittance)
+            admittances = np.flatnonzero(active & has_admittance)
+        node_var[nodes[node_unknowns]] = np.arange(len(node_unknowns))
+        cmp_var = np.full(len(cmps), -1, dtype=np.int64)
+        cmp_var[cmp_unknowns] = np.arange(len(cmp_unknowns)) + len(node_unknowns)
+        self.size = len(node_unknowns) + len(cmp_unknowns)
+
+        # raw (row, column) entries; value-dependent entries are scaled by the parameter of their owner
+        stamps = list()
+        rhs_terms = list()
+
+        def stamp(row, col, param=None, sign=1, cmps=None, value=1):
+            if len(row) == 0:
+                return
+            stamps.append((row, col, param, sign, owner[cmps] if param is not None else value))
+
+        def rhs(row, param, sign, cmps):
+            if len(row) != 0:
+                rhs_terms.append((row, param, sign, owner[cmps]))
+
+        # KCL rows, or a voltage assignment for ground nodes
+        if formulation == "mna":
+            rows = node_var[nodes[ground[nodes]]]
+            stamp(rows, rows)
+
+        kcl = cmp_var >= 0
+        at_neg = kcl & ~neg_ground & (node_var[neg] >= 0)
+        stamp(node_var[neg[at_neg]], cmp_var[at_neg])
+        at_pos = kcl & ~pos_ground & (node_var[pos] >= 0)
+        stamp(node_var[pos[at_pos]], cmp_var[at_pos], value=-1)
+
+        # KVL rows; the ground node voltage is known to be zero, so it is left out of the KVL
+        # both sides of a dropped component are connected to ground => no current
+        dropped = kcl & ~active
+        stamp(cmp_var[dropped], cmp_var[dropped])
+
+        kvl = kcl & active
+        at_pos = kvl & ~pos_ground
+        stamp(cmp_var[at_pos], node_var[pos[at_pos]], "a", 1, at_pos)
+        at_neg = kvl & ~neg_ground
+        stamp(cmp_var[at_neg], node_var[neg[at_neg]], "a", -1, at_neg)
+        stamp(cmp_var[kvl], cmp_var[kvl], "b", 1, kvl)
+        rhs(cmp_var[kvl], "c", 1, kvl)
+
+        # admittance stamps of I = J + Y(Vp - Vn), with the same KCL signs as the branch currents above
+        at_pos = admittances[~pos_ground[admittances]]
+        at_neg = admittances[~neg_ground[admittances]]
+        both = admittances[~(pos_ground | neg_ground)[admittances]]
+        stamp(node_var[pos[at_pos]], node_var[pos[at_pos]], "y", -1, at_pos)
+        rhs(node_var[pos[at_pos]], "j", 1, at_pos)
+        stamp(node_var[neg[at_neg]], node_var[neg[at_neg]], "y", -1, at_neg)
+        rhs(node_var[neg[at_neg]], "j", -1, at_neg)
+        stamp(node_var[pos[both]], node_var[neg[both]], "y", 1, both)
+        stamp(node_var[neg[both]], node_var[pos[both]], "y", 1, both)
+
+        empty = np.zeros(0, dtype=np.int64)
+        rows = np.concatenate([empty] + [entry[0] for entry in stamps])
+        cols = np.concatenate([empty] + [entry[1] for entry in stamps])
+
+        keys, slots = np.unique(cols * self.size + rows, return_inverse=True)
+        slots = slots.reshape(-1)
+        self.rows = _frozen(keys % max(self.size, 1), np.int64)
+        self.cols = _frozen(keys // max(self.size, 1), np.int64)
+
+        static_data = np.zeros(len(keys), dtype=np.float64)
+        terms = list()
+        start = 0
+        for row, col, param, sign, data in stamps:
+            positions = slots[start:start + len(row)]
+            start += len(row)
+            if param is None:
+                np.add.at(static_data, positions, data)
+            else:
+                terms.append((positions, param, sign, data))
+        self.static = _frozen(static_data, np.float64)
+
+        # grouping value-dependent entries by (parameter, sign) so that each group is one scatter
+        self.terms = self._group(terms)
+        self.rhs_terms = self._group(rhs_terms)
+
+        # mapping from the unknowns back to the results
+        self.result_index = _frozen(np.concatenate([node_unknowns, cmp_num[cmp_unknowns]]), np.int64)
+        self.admittances = _frozen(owner[admittances], np.int64)
+        self.admittance_index = _frozen(cmp_num[admittances], np.int64)
+        # ground nodes outside of the plan map onto an extra column of zeros
+        self.admittance_pos = _frozen(node_num[pos[admittances]], np.int64)
+        self.admittance_neg = _frozen(node_num[neg[admittances]], np.int64)
+
+        # terminals and result position of every active component, used to read back branch voltages
+        self.terminal_pos = _frozen(node_num[pos[active]], np.int64)
+        self.terminal_neg = _frozen(node_num[neg[active]], np.int64)
+        self.active_index = _frozen(cmp_num[active], np.int64)
+
+        # active components evaluated together, one group per component type
+        codes = circuit._cmp_types.array[self.active]
+        self.groups = tuple(
+            (circuit._types[code], _frozen(np.flatnonzero(codes == code), np.int64)) for code in np.unique(codes)
+        )
+
+        self._ordering = None
+
+    @staticmethod
+    def _group(entries):
+        groups = dict()
+        for positions, param, sign, owners in entries:
+            group = groups.setdefault((param, sign), (list(), list()))
+            group[0].append(positions)
+            group[1].append(owners)
+
+        return tuple(
+            (param, sign, _frozen(np.concatenate(positions), np.int64), _frozen(np.concatenate(owners), np.int64))
+            for (param, sign), (positions, owners) in sorted(groups.items())
+        )
+
+    @property
+    def nnz(self):
+        return len(self.rows)
+
+    def get_ordering(self, solver=None):
+        """
+        the reverse Cuthill-McKee ordering of the unknowns, used by the banded solver; chain-like circuits such as
+        ladders are numbered in circuit order, which scatters their entries, but have a small bandwidth once reordered
+        :type solver: str
+        :param solver: the solver the ordering is meant for, see Solvers.wants_ordering; the ordering is neither
+                       computed nor returned when that solver cannot use it
+        :return: (order, lower, upper), see Solvers.reverse_cuthill_mckee, or None without scipy
+        """
+
+        if solver is not None and not Solvers.wants_ordering(self.size, solver):
+            return None
+
+        if self._ordering is None and Solvers.has_sparse():
+            self._ordering = Solvers.reverse_cuthill_mckee(self.size, self.rows, self.cols)
+
+        return self._ordering
+
+    def get_params(self, state_dict, points, values=None):
+        """
+        evaluates the parameters of every active component
+        array backed component types are evaluated from the value array of the circuit with a single call
+        :type state_dict: dict
+        :type points: int
+        :param state_dict: a dictionary of all external circuit parameters
+        :param points: number of stacked systems described by state_dict
+        :param values: (F, M) values of the active components in every system, used instead of the values of the
+                       circuit for array backed component types
+        :return: (A, B, C), each an (F, M) array over the F systems and M active components
+        """
+
+        params = np.empty([3, points, len(self.active)], dtype=np.complex128)
+
+        # the frequency runs down the first axis, the components along the second
+        columns = dict(state_dict)
+        if "frequency" in columns and np.ndim(columns["frequency"]) == 1:
+            columns["frequency"] = columns["frequency"][:, np.newaxis]
+
+        for cls, group in self.groups:
+            rows = self.active[group]
+            if is_array_backed(cls):
+                given = self.circuit.get_values(rows)[np.newaxis] if values is None else values[:, group]
+                evaluated = cls.evaluate(given, columns)
+                for param, value in zip(params, evaluated):
+                    param[:, group] = value
+            else:
+                for i, row in zip(group.tolist(), rows.tolist()):
+                    params[0, :, i], params[1, :, i], params[2, :, i] = \
+                        self.circuit.components[row].get_params(state_dict)
+
+        return params[0], params[1], params[2]
+
+    def get_derivatives(self, state_dict, points):
+        """
+        evaluates the derivatives of the parameters of every active component with respect to its value
+        :type state_dict: dict
+        :type points: int
+        :param state_dict: a dictionary of all external circuit parameters
+        :param points: number of stacked systems described by state_dict
+        :return: (dA, dB, dC, supported) where dA, dB and dC are (F, M) arrays and supported is an (M,) mask of the
+                 components which have a value to differentiate
+        """
+
+        params = np.zeros([3, points, len(self.active)], dtype=np.complex128)
+        supported = np.zeros(len(self.active), dtype=bool)
+
+        columns = dict(state_dict)
+        if "frequency" in columns and np.ndim(columns["frequency"]) == 1:
+            columns["frequency"] = columns["frequency"][:, np.newaxis]
+
+        for cls, group in self.groups:
+            rows = self.active[group]
+            try:
+                if is_array_backed(cls):
+                    evaluated = cls.derivatives(self.circuit.get_values(rows)[np.newaxis], columns)
+                    for param, value in zip(params, evaluated):
+                        param[:, group] = value
+                else:
+                    for i, row in zip(group.tolist(), rows.tolist()):
+                        params[0, :, i], params[1, :, i], params[2, :, i] = \
+                            self.circuit.components[row].get_derivatives(state_dict)
+            except NotImplementedError:
+                continue
+            supported[group] = True
+
+        return params[0], params[1], params[2], supported
+
+    def get_companions(self, step, method):
+        """
+        evaluates the companion models of every active component for a transient analysis
+        :type step: float
+        :type method: str
+        :param step: the timestep
+        :param method: "backward_euler" or "trapezoidal"
+        :return: (A, B, C, GV, GI), each an (M,) array; the right hand side of a step is C + GV*V + GI*I, where V
+                 and I are the branch voltage and current of the component at the previous step
+        """
+
+        params = np.empty([5, len(self.active)], dtype=np.float64)
+        for cls, group in self.groups:
+            rows = self.active[group]
+            if is_array_backed(cls):
+                values = self.circuit.get_values(rows)
+                if np.iscomplexobj(values) and np.any(values.imag != 0):
+                    name = self.circuit._cmp_names[rows[np.argmax(values.imag != 0)]]
+                    raise ValueError("component {} has a complex value, which has no transient meaning".format(name))
+
+                for param, value in zip(params, cls.companion(values.real, step, method)):
+                    param[group] = value
+            else:
+                for i, row in zip(group.tolist(), rows.tolist()):
+                    params[:, i] = self.circuit.components[row].get_companion(step, method)
+
+        return tuple(params)
+
+    def get_laplace(self):
+        """
+        evaluates the parameters of every active component as polynomials of the complex frequency s
+        :return: (A0, A1, B0, B1, C), each an (M,) array, where A=A0+sA1 and B=B0+sB1
+        """
+
+        params = np.empty([5, len(self.active)], dtype=np.complex128)
+        for cls, group in self.groups:
+            rows = self.active[group]
+            if is_array_backed(cls):
+                for param, value in zip(params, cls.laplace(self.circuit.get_values(rows))):
+                    param[group] = value
+            else:
+                for i, row in zip(group.tolist(), rows.tolist()):
+                    params[:, i] = self.circuit.components[row].get_laplace()
+
+        return tuple(params)
+
+    def get_admittances(self, a, b, c):
+        """
+        converts the parameters of the admittance components into Y=-A/B and J=C/B
+        :return: (Y, J), each an (F, M) array which is zero for components without an admittance stamp
+        """
+
+        y = np.zeros(a.shape, dtype=np.result_type(a, b, c))
+        j = np.zeros(a.shape, dtype=np.result_type(a, b, c))
+        if len(self.admittances) == 0:
+            return y, j
+
+        b_adm = b[:, self.admittances]
+        singular = np.any(b_adm == 0, axis=0)
+        if np.any(singular):
+            name = self.active_names[self.admittances[np.argmax(singular)]]
+            raise ZeroDivisionError(
+                "component {} has no finite admittance, use the mna formulation".format(name)
+            )
+
+        y[:, self.admittances] = -a[:, self.admittances] / b_adm
+        j[:, self.admittances] = c[:, self.admittances] / b_adm
+
+        return y, j
+
+    def _get_param_dict(self, a, b, c):
+        params = {"a": a, "b": b, "c": c}
+        if self.formulation == "nodal":
+            params["y"], params["j"] = self.get_admittances(a, b, c)
+
+        return params
+
+    def _scatter_matrix(self, params):
+        points = params["a"].shape[0]
+        data = np.empty([points, self.nnz], dtype=np.result_type(*params.values()))
+        data[:] = self.static
+        for param, sign, slots, owners in self.terms:
+            np.add.at(data, (slice(None), slots), sign * params[param][:, owners])
+
+        return data
+
+    def _scatter_rhs(self, params):
+        points = params["a"].shape[0]
+        rhs = np.zeros([points, self.size], dtype=np.result_type(*params.values()))
+        for param, sign, positions, owners in self.rhs_terms:
+            np.add.at(rhs, (slice(None), positions), sign * params[param][:, owners])
+
+        return rhs
+
+    def scatter(self, a, b, c):
+        """
+        scatters component parameters into the matrix pattern
+        :param a: (F, M) array of A parameters
+        :param b: (F, M) array of B parameters
+        :param c: (F, M) array of C parameters
+        :return: (data, rhs) where data holds the (F, nnz) matrix values and rhs the (F, N) right hand sides
+        """
+
+        params = self._get_param_dict(a, b, c)
+
+        return self._scatter_matrix(params), self._scatter_rhs(params)
+
+    def scatter_rhs(self, a, b, c):
+        """
+        scatters component parameters into the right hand side only, for systems whose matrix is already known
+        :return: (F, N) array of right hand sides
+        """
+
+        return self._scatter_rhs(self._get_param_dict(a, b, c))
+
+    def expand(self, solutions, a, b, c):
+        """
+        maps solutions of the system back onto every node and component
+        :param solutions: (F, N) array of solutions of the system
+        :return: (F, len(names)) array ordered like names
+        """
+
+        results = np.zeros([solutions.shape[0], len(self.names) + 1], dtype=np.result_type(solutions, a, b, c))
+        results[:, self.result_index] = solutions
+
+        if len(self.admittances) != 0:
+            y, j = self.get_admittances(a, b, c)
+            voltage = results[:, self.admittance_pos] - results[:, self.admittance_neg]
+            results[:, self.admittance_index] = j[:, self.admittances] + y[:, self.admittances] * voltage
+
+        return results[:, :-1]
+
+    def solve(self, state_dict, points, solver="auto"):
+        """
+        assembles and solves the system for every point described by state_dict
+        :return: (F, len(names)) array of results ordered like names
+        """
+
+        hooks = self.circuit._hooks
+
+        with Profiling.phase(hooks, "params", components=len(self.active), points=points):
+            a, b, c = self.get_params(state_dict, points)
+        with Profiling.phase(hooks, "assemble", size=self.size, nnz=self.nnz, points=points):
+            data, rhs = self.scatter(a, b, c)
+        with Profiling.phase(hooks, "solve", size=self.size, nnz=self.nnz, systems=points) as phase:
+            ordering = self.get_ordering(solver)
+            phase.set(bandwidth=ordering[1] + ordering[2] + 1 if ordering is not None else self.size)
+            solutions = Solvers.solve(self.size, self.rows, self.cols, data, rhs, solver, ordering)
+        if hooks and Profiling.wants_condition(hooks):
+            with Profiling.phase(hooks, "condition", systems=points) as phase:
+                phase.set(condition=float(np.max(Profiling.estimate_condition(self.size, self.rows, self.cols, data))))
+        with Profiling.phase(hooks, "expand", size=len(self.names), points=points):
+            solutions = self.expand(solutions, a, b, c)
+
+        return solutions
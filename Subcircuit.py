@@ -0,0 +1,457 @@
+from collections import OrderedDict
+import numpy as np
+from StampPlan import normalize_state
+from Topology import Topology
+from util import Factorization, Solvers
+from Circuit import Circuit, Node, CircuitError
+from SweepResult import SweepResult
+
+
+class Subcircuit(object):
+    """
+    a circuit definition which is instantiated many times inside of other circuits
+
+    The ground nodes of the definition form its reference terminal and the ports are the other nodes it connects
+    through. With the port voltages v imposed, the mna system of the definition splits into port rows p and
+    internal unknowns i, and the currents flowing into the ports are
+
+        I = S v + J,    S = M_pp - M_pi M_ii^-1 M_ip,    J = M_pi M_ii^-1 r_i - r_p
+
+    so every instance is stamped as the admittance S between its ports and the current sources J. The reduction
+    is computed once per frequency and cached until the version of the definition changes, however many times it
+    is instantiated; the most recently used max_reductions frequencies are kept. The internal unknowns
+    x_i = M_ii^-1 (r_i - M_ip v) are kept in that form to recover the inside of an instance on request.
+    """
+
+    def __init__(self, definition, ports, max_reductions=4096):
+        """
+        :type definition: Circuit
+        :type ports: list
+        :type max_reductions: int
+        :param definition: the circuit to be instantiated, it must have at least one ground node
+        :param ports: names of the non-ground nodes of definition connected to the instantiating circuit, in order
+        :param max_reductions: number of frequencies whose reductions are cached
+        """
+
+        if not isinstance(definition, Circuit):
+            raise TypeError("argument definition is not of type Circuit")
+
+        ports = list(ports)
+        if len(set(ports)) != len(ports):
+            raise CircuitError("ports of a subcircuit must be unique")
+        for name in ports:
+            if definition.get_node(name).ground:
+                raise CircuitError("port {} is a ground node, ground is the reference of a subcircuit".format(name))
+        if not any(node.ground for node in definition.nodes):
+            raise CircuitError("All circuits require at least one ground node")
+
+        self.definition = definition
+        self.ports = tuple(ports)
+        self.max_reductions = max_reductions
+        self.reductions = 0
+
+        self._plan = None
+        self._version = None
+        self._cache = OrderedDict()
+
+    def __repr__(self):
+        return "Subcircuit({}, ports {})".format(self.definition.name, self.ports)
+
+    def _get_plan(self):
+        """
+        :return: the mna plan of the definition, discarding the cached reductions if the definition changed
+        """
+
+        plan = self.definition.compile("mna")
+        if plan is self._plan and self.definition.version == self._version:
+            return plan
+
+        self._plan = plan
+        self._version = self.definition.version
+        self._cache = OrderedDict()
+
+        # positions of the ports within the unknowns and of every unknown within its part of the system
+        self._port_rows = np.array([plan.index[name] for name in self.ports], dtype=np.int64)
+        is_port = np.zeros(plan.size, dtype=bool)
+        is_port[self._port_rows] = True
+        self._internal_rows = np.flatnonzero(~is_port)
+        self._local = np.empty(plan.size, dtype=np.int64)
+        self._local[self._port_rows] = np.arange(len(self._port_rows))
+        self._local[self._internal_rows] = np.arange(len(self._internal_rows))
+
+        row_port = is_port[plan.rows]
+        col_port = is_port[plan.cols]
+        self._blocks = (row_port & col_port, row_port & ~col_port, ~row_port & col_port, ~row_port & ~col_port)
+
+        return plan
+
+    def _reduce(self, plan, state_dict, solver):
+        """
+        :return: (S, J, Z, w) of a single point, with Z = M_ii^-1 M_ip and w = M_ii^-1 r_i
+        """
+
+        a, b, c = plan.get_params(state_dict, 1)
+        data, rhs = plan.scatter(a, b, c)
+        data = data[0]
+        rhs = rhs[0]
+
+        ports = len(self._port_rows)
+        internal = len(self._internal_rows)
+        local = self._local
+
+        def dense(block, shape):
+            mrx = np.zeros(shape, dtype=data.dtype)
+            mrx[local[plan.rows[block]], local[plan.cols[block]]] = data[block]
+            return mrx
+
+        pp, pi, ip, ii = self._blocks
+        m_pp = dense(pp, (ports, ports))
+        m_pi = dense(pi, (ports, internal))
+        m_ip = dense(ip, (internal, ports))
+
+        # the local numbering preserves the order of the unknowns, so the internal block stays in CSC order
+        factorization = Factorization.factorize(
+            internal, local[plan.rows[ii]], local[plan.cols[ii]], data[ii], solver
+        )
+        z = factorization.solve(m_ip)
+        w = factorization.solve(rhs[self._internal_rows])
+        self.reductions += 1
+
+        return m_pp - m_pi @ z, m_pi @ w - rhs[self._port_rows], z, w
+
+    def _get_reductions(self, state_dict, points, solver="auto"):
+        """
+        :param state_dict: a state_dict normalized by normalize_state
+        :return: the plan of the definition and a list of the (S, J, Z, w) of every point
+        """
+
+        plan = self._get_plan()
+
+        if "frequency" in state_dict:
+            frequencies = np.atleast_1d(state_dict["frequency"]).tolist()
+        else:
+            frequencies = [None] * points
+
+        reductions = list()
+        for frequency in frequencies:
+            if frequency in self._cache:
+                self._cache.move_to_end(frequency)
+            else:
+                point = dict(state_dict)
+                if frequency is not None:
+                    point["frequency"] = np.float64(frequency)
+                self._cache[frequency] = self._reduce(plan, point, solver)
+                while len(self._cache) > self.max_reductions:
+                    self._cache.popitem(last=False)
+            reductions.append(self._cache[frequency])
+
+        return plan, reductions
+
+    def reduce(self, state_dict, solver="auto"):
+        """
+        reduces the definition to its ports
+        the reductions are cached by frequency, other entries of state_dict must not change between calls
+        :type state_dict: dict
+        :type solver: str
+        :param state_dict: the external parameters of the circuit, the frequency may be an array of F frequencies
+        :param solver: "dense", "sparse", "banded" or "auto", used to factorize the internal part of the definition
+        :return: (S, J), the (F, P, P) port admittance and (F, P) currents flowing into the ports when they are
+                 grounded, without the leading axis for a scalar frequency
+        """
+
+        state_dict, scalar, points = normalize_state(state_dict)
+        plan, reductions = self._get_reductions(state_dict, points, solver)
+
+        admittance = np.stack([reduction[0] for reduction in reductions])
+        current = np.stack([reduction[1] for reduction in reductions])
+        if scalar:
+            return admittance[0], current[0]
+
+        return admittance, current
+
+    def recover(self, state_dict, voltages, solver="auto"):
+        """
+        solves the inside of the definition for imposed port voltages
+        :type state_dict: dict
+        :param state_dict: the external parameters of the circuit, as given to reduce
+        :param voltages: (F, P) voltages of the ports relative to the reference
+        :return: (F, len(names)) array of results ordered like the names of the definition, relative to the reference
+        """
+
+        state_dict, scalar, points = normalize_state(state_dict)
+        plan, reductions = self._get_reductions(state_dict, points, solver)
+
+        voltages = np.asarray(voltages).reshape(points, len(self.ports))
+        solutions = np.empty([points, plan.size], dtype=np.complex128)
+        solutions[:, self._port_rows] = voltages
+        for n, (admittance, current, z, w) in enumerate(reductions):
+            solutions[n, self._internal_rows] = w - z @ voltages[n]
+
+        results = np.zeros([points, len(plan.names)], dtype=np.complex128)
+        results[:, plan.result_index] = solutions
+
+        return results
+
+
+class Instance(object):
+    """
+    a subcircuit placed in a circuit, its ports and reference connected to nodes of the circuit
+    """
+
+    __slots__ = ("name", "subcircuit", "nodes", "reference")
+
+    def __init__(self, name, subcircuit, nodes, reference):
+        """
+        :type name: str
+        :type subcircuit: Subcircuit
+        :type nodes: tuple
+        :type reference: Node
+        """
+
+        self.name = name
+        self.subcircuit = subcircuit
+        self.nodes = nodes
+        self.reference = reference
+
+    def __repr__(self):
+        return "Instance({}, {})".format(self.name, self.subcircuit)
+
+    @property
+    def terminals(self):
+        """
+        :return: the nodes connected to the ports, followed by the node connected to the reference
+        """
+
+        return self.nodes + (self.reference,)
+
+
+class HierarchyResult(SweepResult):
+    """
+    the results of a Hierarchy, holding the nodes and components of its circuit
+    the inside of an instance is only solved when it is requested through internal
+    """
+
+    def __init__(self, solutions, index, names, hierarchy, state_dict, solver):
+        super(HierarchyResult, self).__init__(solutions, index, names)
+        self.hierarchy = hierarchy
+        self.state_dict = state_dict
+        self.solver = solver
+        self._internal = dict()
+
+    def internal(self, name):
+        """
+        :type name: str
+        :param name: name of an instance
+        :return: a SweepResult of the nodes and components of the definition inside of the instance, recovered from
+                 its port voltages on first request
+        """
+
+        if name in self._internal:
+            return self._internal[name]
+
+        instance = self.hierarchy.get_instance(name)
+        subcircuit = instance.subcircuit
+        state_dict, scalar, points = normalize_state(self.state_dict)
+
+        terminals = np.array([self.index[node.name] for node in instance.terminals], dtype=np.int64)
+        voltages = np.asarray(self.solutions[terminals]).reshape(len(terminals), points).T
+        reference = voltages[:, -1:]
+        solutions = subcircuit.recover(state_dict, voltages[:, :-1] - reference, self.solver)
+
+        # the node voltages of the definition are relative to its reference
+        plan = subcircuit.definition.compile("mna")
+        solutions[:, :len(plan.nodes)] += reference
+        if scalar:
+            solutions = solutions[0]
+        else:
+            solutions = np.ascontiguousarray(solutions.T)
+
+        self._internal[name] = SweepResult(solutions, plan.index, plan.names)
+        return self._internal[name]
+
+
+class Hierarchy(object):
+    """
+    a circuit together with instances of subcircuits
+
+    The circuit is solved with every instance stamped as the reduced admittance of its subcircuit, so the size of
+    the system only depends on the nodes and components of the circuit itself. The reduction of a subcircuit is
+    shared by all of its instances.
+    """
+
+    def __init__(self, circuit):
+        """
+        :type circuit: Circuit
+        :param circuit: the circuit in which the subcircuits are instantiated
+        """
+
+        if not isinstance(circuit, Circuit):
+            raise TypeError("argument circuit is not of type Circuit")
+
+        self.circuit = circuit
+        self.instances = list()
+        self._instance_index = dict()
+        self._topology = None
+        self._base = None
+
+    def instantiate(self, name, subcircuit, nodes, reference):
+        """
+        places an instance of subcircuit in the circuit
+        :type name: str
+        :type subcircuit: Subcircuit
+        :type nodes: list
+        :type reference: Node
+        :param name: name of the instance, unique among the instances and the names of the circuit
+        :param subcircuit: the subcircuit to be instantiated
+        :param nodes: the nodes of the circuit connected to each port of subcircuit, in the order of its ports
+        :param reference: the node of the circuit connected to the ground of the definition
+        :return: the new Instance
+        """
+
+        if type(name) is not str:
+            raise TypeError("name is not of type string")
+        if not isinstance(subcircuit, Subcircuit):
+            raise TypeError("argument subcircuit is not of type Subcircuit")
+        if name in self._instance_index or self.circuit.has_name(name):
+            raise NameError("name {} already exists in the circuit".format(name))
+
+        nodes = tuple(nodes)
+        if len(nodes) != len(subcircuit.ports):
+            raise CircuitError("subcircuit {} has {} ports, {} nodes were given".format(
+                subcircuit.definition.name, len(subcircuit.ports), len(nodes)
+            ))
+        for node in nodes + (reference,):
+            if not isinstance(node, Node):
+                raise TypeError("instance connection is not to a node")
+            if node.circuit is not self.circuit:
+                raise CircuitError("node {} does not belong to the circuit".format(node.name))
+
+        instance = Instance(name, subcircuit, nodes, reference)
+        self.instances.append(instance)
+        self._instance_index[name] = instance
+        self._topology = None
+
+        return instance
+
+    def get_instance(self, name):
+        if name not in self._instance_index:
+            raise CircuitError("Circuit {} does not have instance {}".format(self.circuit.name, name))
+
+        return self._instance_index[name]
+
+    def get_topology(self):
+        """
+        :return: the Topology of the circuit, with the terminals of every instance linked together
+        """
+
+        base = self.circuit.get_topology()
+        if self._topology is None or self._base is not base:
+            links = [
+                (instance.reference._index, node._index) for instance in self.instances for node in instance.nodes
+            ]
+            self._topology = Topology(self.circuit, links)
+            self._base = base
+
+        return self._topology
+
+    def check_topology(self):
+        """
+        ensures the circuit can be solved, see Circuit.check_topology
+        :return: the Topology of the circuit
+        """
+
+        topology = self.get_topology()
+
+        if len(topology.reference) == 0:
+            raise CircuitError("All circuits require at least one ground node")
+
+        if len(topology.floating) != 0:
+            raise CircuitError("nodes {} have no path to ground".format(", ".join(topology.floating)))
+
+        return topology
+
+    def _stamp_instances(self, plan, state_dict, points, solver):
+        """
+        :return: (rows, cols, vals, rhs_rows, rhs_vals) of the instances, with (F, K) vals and rhs_vals
+        """
+
+        ground = self.circuit._node_ground.array
+        empty = np.zeros(0, dtype=np.int64)
+        rows, cols, rhs_rows = [empty], [empty], [empty]
+        vals, rhs_vals = [np.zeros([points, 0])], [np.zeros([points, 0])]
+
+        subcircuits = dict()
+        for instance in self.instances:
+            subcircuits.setdefault(id(instance.subcircuit), (instance.subcircuit, list()))[1].append(instance)
+
+        for subcircuit, instances in subcircuits.values():
+            reductions = subcircuit._get_reductions(state_dict, points, solver)[1]
+            admittance = np.stack([reduction[0] for reduction in reductions])
+            current = np.stack([reduction[1] for reduction in reductions])
+
+            # the reference takes the currents of the ports back, I_ref = -sum(I) and v_k = V_k - V_ref
+            ports = len(subcircuit.ports)
+            full = np.zeros([points, ports + 1, ports + 1], dtype=admittance.dtype)
+            full[:, :ports, :ports] = admittance
+            full[:, :ports, ports] = -admittance.sum(axis=2)
+            full[:, ports, :ports] = -admittance.sum(axis=1)
+            full[:, ports, ports] = admittance.sum(axis=(1, 2))
+            sources = np.concatenate([current, -current.sum(axis=1, keepdims=True)], axis=1)
+
+            # (K, P + 1) terminal rows of every instance, the rows of ground nodes assign their voltage instead
+            terminals = np.array([
+                [plan.index[node.name] for node in instance.terminals] for instance in instances
+            ], dtype=np.int64)
+            kcl = ~ground[terminals]
+
+            row = np.broadcast_to(terminals[:, :, np.newaxis], (len(instances), ports + 1, ports + 1))
+            col = np.broadcast_to(terminals[:, np.newaxis, :], row.shape)
+            keep = np.broadcast_to(kcl[:, :, np.newaxis], row.shape)
+            rows.append(row[keep])
+            cols.append(col[keep])
+            vals.append(np.broadcast_to(full[:, np.newaxis], (points,) + row.shape)[:, keep])
+
+            # I = S v + J enters the KCL rows, which sum to zero, so J moves to the right hand side
+            rhs_rows.append(terminals[kcl])
+            rhs_vals.append(-np.broadcast_to(sources[:, np.newaxis], (points,) + terminals.shape)[:, kcl])
+
+        return (
+            np.concatenate(rows), np.concatenate(cols), np.concatenate(vals, axis=1),
+            np.concatenate(rhs_rows), np.concatenate(rhs_vals, axis=1)
+        )
+
+    def ac_sweep(self, state_dict, solver="auto"):
+        """
+        performs an ac sweep of the circuit and its instances, see Circuit.ac_sweep
+        :type state_dict: dict
+        :type solver: str
+        :param state_dict: the external parameters of the circuit, the frequency may be an array of frequencies
+        :param solver: "dense", "sparse", "banded" or "auto", used for the circuit and the reduction of the subcircuits
+        :return: a HierarchyResult of the nodes and components of the circuit
+        """
+
+        self.check_topology()
+        normalized, scalar, points = normalize_state(state_dict)
+
+        plan = self.circuit.compile("mna")
+        a, b, c = plan.get_params(normalized, points)
+        data, rhs = plan.scatter(a, b, c)
+
+        rows, cols, vals, rhs_rows, rhs_vals = self._stamp_instances(plan, normalized, points, solver)
+
+        # the entries of the instances are merged into the pattern of the plan, in CSC order
+        keys, slots = np.unique(
+            np.concatenate([plan.cols, cols]) * plan.size + np.concatenate([plan.rows, rows]), return_inverse=True
+        )
+        merged = np.zeros([points, len(keys)], dtype=np.complex128)
+        np.add.at(merged, (slice(None), slots.reshape(-1)), np.concatenate([data, vals], axis=1))
+        np.add.at(rhs, (slice(None), rhs_rows), rhs_vals)
+
+        solutions = Solvers.solve(plan.size, keys % plan.size, keys // plan.size, merged, rhs, solver)
+        solutions = plan.expand(solutions, a, b, c)
+        if scalar:
+            solutions = solutions[0]
+        else:
+            solutions = np.ascontiguousarray(solutions.T)
+
+        return HierarchyResult(solutions, plan.index, plan.names, self, state_dict, solver)
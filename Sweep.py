@@ -0,0 +1,590 @@
+import os
+import json
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+import numpy as np
+from StampPlan import normalize_state
+from util import Solvers, Files
+from Circuit import Circuit, CircuitError
+from SweepResult import SweepResult
+
+
+# upper bound on the bytes of dense matrices assembled at once when chunk_size is not given
+DENSE_CHUNK_BYTES = 1 << 28
+SPARSE_CHUNK_SYSTEMS = 1024
+
+
+class Normal(object):
+    def __init__(self, mean, std):
+        """
+        :type mean: float
+        :type std: float
+        :param mean: mean of the distribution
+        :param std: standard deviation of the distribution
+        """
+
+        self.mean = mean
+        self.std = std
+
+    def sample(self, rng, size):
+        return rng.normal(self.mean, self.std, size)
+
+
+class Uniform(object):
+    def __init__(self, low, high):
+        """
+        :type low: float
+        :type high: float
+        :param low: lower bound of the distribution
+        :param high: upper bound of the distribution
+        """
+
+        self.low = low
+        self.high = high
+
+    @classmethod
+    def tolerance(cls, nominal, fraction):
+        """
+        :return: a uniform distribution over nominal * (1 +- fraction)
+        """
+
+        return cls(nominal * (1 - fraction), nominal * (1 + fraction))
+
+    def sample(self, rng, size):
+        return rng.uniform(self.low, self.high, size)
+
+
+def sample_values(distributions, samples, seed=None):
+    """
+    draws component values from distributions
+    :type distributions: dict
+    :type samples: int
+    :param distributions: objects with a sample(rng, size) method, keyed by component name
+    :param samples: number of values drawn for every component
+    :param seed: seed of the random number generator
+    :return: a dictionary of value arrays keyed by component name
+    """
+
+    rng = np.random.default_rng(seed)
+
+    return {name: np.asarray(dist.sample(rng, samples)) for name, dist in distributions.items()}
+
+
+def _get_chunks(plan, samples, points, solver, chunk_size):
+    """
+    :return: (sample chunk, point chunk), the numbers of samples and of points solved at once; every sample adds one
+             system per point, so the points are split as well when they alone exceed chunk_size systems
+    """
+
+    if chunk_size is None:
+        if Solvers.choose_solver(plan.size, solver) == "dense":
+            chunk_size = DENSE_CHUNK_BYTES // (16 * max(plan.size, 1) ** 2)
+        else:
+            chunk_size = SPARSE_CHUNK_SYSTEMS
+
+    point_chunk = max(1, min(points, chunk_size))
+
+    return max(1, min(samples, chunk_size // point_chunk)), point_chunk
+
+
+def _select_points(state_dict, points):
+    """
+    :param points: a slice of the frequencies of state_dict, or None for a scalar frequency
+    :return: (state_dict restricted to points, number of points)
+    """
+
+    if points is None:
+        return state_dict, 1
+
+    state_dict = dict(state_dict)
+    state_dict["frequency"] = state_dict["frequency"][points]
+
+    return state_dict, len(state_dict["frequency"])
+
+
+def _get_overrides(circuit, plan, values):
+    """
+    :return: (samples, overrides) where overrides lists (owner, type, values) of the swept active components
+    """
+
+    owner = {name: i for i, name in enumerate(plan.active_names)}
+    overrides = list()
+    samples = None
+    for name, value in values.items():
+        cmp = circuit.get_component(name)
+        value = np.asarray(value)
+        if value.ndim != 1:
+            raise ValueError("values of {} are not a 1-D array".format(name))
+        if samples is None:
+            samples = len(value)
+        elif len(value) != samples:
+            raise ValueError("values of {} do not have {} samples".format(name, samples))
+        if type(cmp).value_name is None:
+            raise CircuitError("component {} does not have a value to sweep".format(name))
+        if name in owner:
+            overrides.append((owner[name], type(cmp), value))
+
+    return 1 if samples is None else samples, overrides
+
+
+def _solve_chunk(plan, overrides, state_dict, samples, points, columns, solver, base=None):
+    """
+    solves the samples in the slice samples for the points described by state_dict
+    :return: (samples, points, columns) array of results
+    """
+
+    if base is None:
+        base = plan.get_params(state_dict, points)
+
+    count = samples.stop - samples.start
+    params = [np.repeat(param[np.newaxis], count, axis=0) for param in base]
+
+    for i, cls, value in overrides:
+        evaluated = cls.evaluate(value[samples, np.newaxis], state_dict)
+        for param, new in zip(params, evaluated):
+            param[:, :, i] = new
+
+    a, b, c = [param.reshape([-1, len(plan.active)]) for param in params]
+    data, rhs = plan.scatter(a, b, c)
+    solutions = Solvers.solve(plan.size, plan.rows, plan.cols, data, rhs, solver, plan.get_ordering(solver))
+
+    return plan.expand(solutions, a, b, c)[:, columns].reshape([count, points, -1])
+
+
+def _split(count, parts):
+    bounds = np.linspace(0, count, min(parts, count) + 1).astype(int)
+
+    return [slice(start, stop) for start, stop in zip(bounds[:-1], bounds[1:])]
+
+
+# state of a sweep worker process, set once per worker by _init_worker
+_worker = dict()
+
+
+def _init_worker(data, values, state_dict, columns, solver, formulation, memory_name, shape):
+    circuit = Circuit()
+    circuit.load_data(data)
+    plan = circuit.compile(formulation)
+
+    _worker["plan"] = plan
+    _worker["overrides"] = _get_overrides(circuit, plan, values)[1]
+    _worker["state_dict"] = state_dict
+    _worker["columns"] = columns
+    _worker["solver"] = solver
+    _worker["memory"] = shared_memory.SharedMemory(name=memory_name)
+    _worker["results"] = np.ndarray(shape, dtype=np.complex128, buffer=_worker["memory"].buf)
+
+
+def _run_task(samples, frequencies):
+    state_dict, points = _select_points(_worker["state_dict"], frequencies)
+
+    _worker["results"][:, samples, frequencies if frequencies is not None else slice(None)] = np.moveaxis(
+        _solve_chunk(
+            _worker["plan"], _worker["overrides"], state_dict, samples, points, _worker["columns"], _worker["solver"]
+        ), -1, 0
+    )
+
+
+def _parallel_sweep(circuit, values, state_dict, scalar, samples, points, columns, chunks, solver, formulation,
+                    workers):
+    # samples are split into chunks, frequencies as well when they exceed a chunk or when there are too few sample
+    # chunks to feed every worker
+    sample_chunks = _split(samples, -(-samples // chunks[0]))
+    frequency_chunks = [None] if scalar else _split(
+        points, max(-(-points // chunks[1]), -(-workers // len(sample_chunks)))
+    )
+
+    shape = (len(columns), samples, points)
+    memory = shared_memory.SharedMemory(create=True, size=max(1, int(np.prod(shape)) * 16))
+    try:
+        with ProcessPoolExecutor(workers, initializer=_init_worker, initargs=(
+            circuit.serialize(), values, state_dict, columns, solver, formulation, memory.name, shape
+        )) as executor:
+            futures = [
+                executor.submit(_run_task, sample_chunk, frequency_chunk)
+                for sample_chunk in sample_chunks for frequency_chunk in frequency_chunks
+            ]
+            for future in futures:
+                future.result()
+
+        return np.ndarray(shape, dtype=np.complex128, buffer=memory.buf).copy()
+    finally:
+        memory.close()
+        memory.unlink()
+
+
+def parameter_sweep(circuit, values, state_dict=None, outputs=None, chunk_size=None, solver="auto",
+                    formulation="mna", workers=None):
+    """
+    solves the circuit for many sets of component values at once
+    every sample is stamped for every frequency of state_dict and the resulting systems are solved in stacked
+    batches of at most chunk_size systems, so memory stays bounded however many samples and frequencies there are
+    :type circuit: Circuit
+    :type values: dict
+    :type state_dict: dict
+    :type outputs: list
+    :type chunk_size: int
+    :type workers: int
+    :param circuit: the circuit to be simulated
+    :param values: arrays of S values keyed by component name, e.g. {"R0": resistances}; every other component
+                   keeps its current value. An empty dictionary sweeps the frequencies only, with S = 1
+    :param state_dict: the external parameters of the circuit, the frequency may be an array of F frequencies
+    :param outputs: names of the nodes and components kept in the results, defaults to all of them
+    :param chunk_size: maximum number of systems solved at once, chosen from the system size when None
+    :param solver: "dense", "sparse", "banded" or "auto", see Circuit.ac_sweep
+    :param formulation: "mna" or "nodal", see Circuit.ac_sweep
+    :param workers: number of worker processes; the circuit is sent to each worker once and the results are
+                    written straight into shared memory. The sweep runs in this process if None
+    :return: a SweepResult of (S, F) arrays, or (S,) arrays for a scalar frequency, keyed by name
+    """
+
+    circuit.check_topology()
+    plan = circuit.compile(formulation)
+    state_dict, scalar, points = normalize_state(state_dict if state_dict is not None else dict())
+    samples, overrides = _get_overrides(circuit, plan, values)
+
+    if outputs is None:
+        outputs = plan.names
+    columns = np.array([plan.index[name] for name in outputs], dtype=np.int64)
+
+    chunks = _get_chunks(plan, samples, points, solver, chunk_size)
+
+    if workers is not None and workers > 1:
+        values = {name: np.asarray(value) for name, value in values.items()}
+        results = _parallel_sweep(
+            circuit, values, state_dict, scalar, samples, points, columns, chunks, solver, formulation, workers
+        )
+    else:
+        results = np.empty([len(columns), samples, points], dtype=np.complex128)
+        for start in range(0, points, chunks[1]):
+            frequencies = None if scalar else slice(start, start + chunks[1])
+            chunk_state, chunk_points = _select_points(state_dict, frequencies)
+            # parameters of the components which are not swept, shared by every sample of the frequency chunk
+            chunk_base = plan.get_params(chunk_state, chunk_points)
+
+            for first in range(0, samples, chunks[0]):
+                stop = min(first + chunks[0], samples)
+                results[:, first:stop, start:start + chunk_points] = np.moveaxis(_solve_chunk(
+                    plan, overrides, chunk_state, slice(first, stop), chunk_points, columns, solver, chunk_base
+                ), -1, 0)
+
+    if scalar:
+        results = results[:, :, 0]
+
+    return SweepResult(results, {name: i for i, name in enumerate(outputs)}, outputs)
+
+
+def _broadcast_frequency(state_dict):
+    # the frequency runs down the first axis of evaluated parameters, the configurations along the second
+    state_dict = dict(state_dict)
+    if "frequency" in state_dict and np.ndim(state_dict["frequency"]) == 1:
+        state_dict["frequency"] = state_dict["frequency"][:, np.newaxis]
+
+    return state_dict
+
+
+def source_sweep(circuit, values, state_dict=None, outputs=None, solver="auto", formulation="mna"):
+    """
+    solves the circuit for many configurations of its sources at once
+    only the right hand side of the system depends on the sources, so every frequency is factorized once and all
+    of the configurations are solved against that factorization in a single call
+    :type circuit: Circuit
+    :type values: dict
+    :type state_dict: dict
+    :type outputs: list
+    :param circuit: the circuit to be simulated
+    :param values: arrays of K values keyed by source name, e.g. {"V1": voltages, "I1": currents}; every other
+                   component keeps its current value
+    :param state_dict: the external parameters of the circuit, the frequency may be an array of F frequencies
+    :param outputs: names of the nodes and components kept in the results, defaults to all of them
+    :param solver: "dense", "sparse", "banded" or "auto", see Circuit.ac_sweep
+    :param formulation: "mna" or "nodal", see Circuit.ac_sweep
+    :return: a SweepResult of (K, F) arrays, or (K,) arrays for a scalar frequency, keyed by name
+    """
+
+    circuit.check_topology()
+    plan = circuit.compile(formulation)
+    state_dict, scalar, points = normalize_state(state_dict if state_dict is not None else dict())
+    configurations, overrides = _get_overrides(circuit, plan, values)
+
+    for name in values:
+        if not type(circuit.get_component(name)).is_source:
+            raise CircuitError("component {} is not a source, its value changes the system matrix".format(name))
+
+    if outputs is None:
+        outputs = plan.names
+    columns = np.array([plan.index[name] for name in outputs], dtype=np.int64)
+
+    a, b, c = plan.get_params(state_dict, points)
+    data = plan.scatter(a, b, c)[0]
+
+    # (F, K, M) parameters of every configuration at every frequency
+    shape = [points, configurations, len(plan.active)]
+    a = np.broadcast_to(a[:, np.newaxis], shape).reshape([-1, len(plan.active)])
+    b = np.broadcast_to(b[:, np.newaxis], shape).reshape([-1, len(plan.active)])
+    c = np.repeat(c[:, np.newaxis], configurations, axis=1)
+    for i, cls, value in overrides:
+        c[:, :, i] = cls.evaluate(value[np.newaxis], _broadcast_frequency(state_dict))[2]
+    c = c.reshape([-1, len(plan.active)])
+
+    rhs = plan.scatter_rhs(a, b, c).reshape([points, configurations, plan.size])
+    solutions = Solvers.solve(
+        plan.size, plan.rows, plan.cols, data, np.swapaxes(rhs, 1, 2), solver, plan.get_ordering(solver)
+    )
+    solutions = np.swapaxes(solutions, 1, 2).reshape([-1, plan.size])
+
+    results = plan.expand(solutions, a, b, c)[:, columns].reshape([points, configurations, -1])
+    results = np.moveaxis(results, [0, 1, 2], [2, 1, 0])
+    if scalar:
+        results = results[:, :, 0]
+
+    return SweepResult(np.ascontiguousarray(results), {name: i for i, name in enumerate(outputs)}, outputs)
+
+
+def transfer_functions(circuit, state_dict=None, sources=None, outputs=None, solver="auto", formulation="mna"):
+    """
+    the response of every output to a unit excitation of each source, with every other source set to zero
+    :type circuit: Circuit
+    :type state_dict: dict
+    :type sources: list
+    :type outputs: list
+    :param circuit: the circuit to be simulated
+    :param state_dict: the external parameters of the circuit, the frequency may be an array of F frequencies
+    :param sources: names of the excited sources, defaults to every source of the circuit in circuit order
+    :param outputs: names of the nodes and components kept in the results, defaults to all of them
+    :param solver: "dense", "sparse", "banded" or "auto", see Circuit.ac_sweep
+    :param formulation: "mna" or "nodal", see Circuit.ac_sweep
+    :return: (sources, transfer) where transfer is a SweepResult of (S, F) arrays, or (S,) arrays for a scalar
+             frequency, whose row i is the response to a unit value of sources[i]
+    """
+
+    every_source = [cmp.name for cmp in circuit.components if cmp.is_source]
+    if sources is None:
+        sources = every_source
+    sources = list(sources)
+
+    excitation = np.eye(len(sources))
+    values = {name: np.zeros(len(sources)) for name in every_source}
+    for i, name in enumerate(sources):
+        values[name] = excitation[i]
+
+    return sources, source_sweep(circuit, values, state_dict, outputs, solver, formulation)
+
+
+def _interpolation_error(low, middle, high, floor):
+    """
+    :return: the relative error of interpolating middle between low and high, the largest over every signal
+    """
+
+    scale = np.maximum(np.maximum(np.abs(low), np.abs(high)), np.maximum(np.abs(middle), floor))
+
+    return np.max(np.abs(middle - (low + high) / 2) / scale, axis=0)
+
+
+def adaptive_sweep(circuit, start, stop, state_dict=None, outputs=None, tolerance=1e-2, points=17, max_points=1000,
+                   solver="auto", formulation="mna"):
+    """
+    solves the circuit on a frequency grid which is refined only where the results change quickly
+    the sweep starts from points log-spaced frequencies; every round solves the geometric midpoints of the
+    intervals still to be checked in a single ac_sweep, and bisects further the intervals whose midpoint differs
+    from the interpolation of its neighbours by more than tolerance, relative to the local magnitude
+    :type circuit: Circuit
+    :type start: float
+    :type stop: float
+    :type state_dict: dict
+    :type outputs: list
+    :type tolerance: float
+    :type points: int
+    :type max_points: int
+    :param circuit: the circuit to be simulated
+    :param start: the lowest frequency
+    :param stop: the highest frequency
+    :param state_dict: the external parameters of the circuit other than the frequency
+    :param outputs: names of the nodes and components whose error drives the refinement, defaults to all of them
+    :param tolerance: the largest relative interpolation error accepted
+    :param points: number of frequencies of the initial grid, which must be fine enough not to skip a resonance
+                   entirely
+    :param max_points: the largest number of frequencies solved; the worst intervals are refined first
+    :param solver: "dense", "sparse", "banded" or "auto", see Circuit.ac_sweep
+    :param formulation: "mna" or "nodal", see Circuit.ac_sweep
+    :return: (frequencies, results) where frequencies is the sorted irregular grid and results a SweepResult of
+             arrays over it, keyed by name
+    """
+
+    if not 0 < start < stop:
+        raise ValueError("frequencies must satisfy 0 < start < stop")
+    if points < 2:
+        raise ValueError("the initial grid needs at least two points")
+
+    state_dict = dict(state_dict) if state_dict is not None else dict()
+
+    def solve(frequencies):
+        state_dict["frequency"] = frequencies
+        return circuit.ac_sweep(state_dict, solver, formulation)
+
+    frequency = np.logspace(np.log10(start), np.log10(stop), points)
+    result = solve(frequency)
+    solutions = [result.solutions]
+    values = {f: i for i, f in enumerate(frequency.tolist())}
+    rows = np.arange(len(result.names)) if outputs is None else result.rows(outputs)
+    floor = np.finfo(float).tiny
+
+    # intervals still to be checked, with the error of the interval they were split from
+    candidates = list(zip(frequency[:-1].tolist(), frequency[1:].tolist(), [np.inf] * (points - 1)))
+    solved = points
+    while len(candidates) != 0 and solved < max_points:
+        candidates.sort(key=lambda candidate: -candidate[2])
+        candidates = candidates[:max_points - solved]
+
+        low = np.array([candidate[0] for candidate in candidates])
+        high = np.array([candidate[1] for candidate in candidates])
+        middle = np.sqrt(low * high)
+        block = solve(middle).solutions
+        solutions.append(block)
+        for f in middle.tolist():
+            values[f] = solved
+            solved += 1
+
+        every = np.concatenate(solutions, axis=1)[rows]
+        floor = max(floor, 1e-12 * np.max(np.abs(every)))
+        error = _interpolation_error(
+            every[:, [values[f] for f in low.tolist()]], block[rows], every[:, [values[f] for f in high.tolist()]], floor
+        )
+
+        candidates = list()
+        for lo, mid, hi, err in zip(low.tolist(), middle.tolist(), high.tolist(), error.tolist()):
+            # intervals at the resolution of a float are not split further
+            if err > tolerance and mid != lo and mid != hi:
+                candidates.append((lo, mid, err))
+                candidates.append((mid, hi, err))
+
+    frequency = np.array(sorted(values))
+    solutions = np.concatenate(solutions, axis=1)[:, [values[f] for f in frequency.tolist()]]
+
+    return frequency, SweepResult(solutions, result.index, result.names)
+
+
+def iter_sweep(circuit, state_dict, outputs=None, chunk_size=None, solver="auto", formulation="mna"):
+    """
+    solves an array of frequencies in chunks, yielding each block of results as soon as it is solved
+    :type circuit: Circuit
+    :type state_dict: dict
+    :type outputs: list
+    :type chunk_size: int
+    :param circuit: the circuit to be simulated
+    :param state_dict: the external parameters of the circuit, with a 1-D array of frequencies
+    :param outputs: names of the nodes and components kept in the results, defaults to all of them
+    :param chunk_size: maximum number of frequencies solved at once, chosen from the system size when None
+    :param solver: "dense", "sparse", "banded" or "auto", see Circuit.ac_sweep
+    :param formulation: "mna" or "nodal", see Circuit.ac_sweep
+    :return: a generator of (frequencies, block) where block is a (chunk, len(outputs)) array
+    """
+
+    circuit.check_topology()
+    plan = circuit.compile(formulation)
+    state_dict, scalar, points = normalize_state(state_dict)
+    if scalar:
+        raise ValueError("streaming sweeps require an array of frequencies")
+
+    if outputs is None:
+        outputs = plan.names
+    columns = np.array([plan.index[name] for name in outputs], dtype=np.int64)
+
+    frequency = state_dict["frequency"]
+    chunk = _get_chunks(plan, points, 1, solver, chunk_size)[0]
+    for start in range(0, points, chunk):
+        state_dict["frequency"] = frequency[start:start + chunk]
+        block = plan.solve(state_dict, len(state_dict["frequency"]), solver)
+        yield state_dict["frequency"], block[:, columns]
+
+
+def write_sweep(circuit, path, state_dict, outputs=None, chunk_size=None, solver="auto", formulation="mna"):
+    """
+    streams a frequency sweep into a memory-mapped .npy file without holding all of the results in memory
+    the results are stored as a (len(outputs), F) array so that every signal is contiguous on disk; the sidecar
+    <name>.json maps signal names to rows and <name>.frequency.npy holds the frequencies
+    :type circuit: Circuit
+    :type path: str
+    :param circuit: the circuit to be simulated
+    :param path: the .npy file the results are written to
+    :param state_dict: the external parameters of the circuit, with a 1-D array of frequencies
+    :param outputs: names of the nodes and components written, defaults to all of them
+    :param chunk_size: maximum number of frequencies solved at once, chosen from the system size when None
+    :param solver: "dense", "sparse", "banded" or "auto", see Circuit.ac_sweep
+    :param formulation: "mna" or "nodal", see Circuit.ac_sweep
+    """
+
+    if type(path) is not str:
+        raise TypeError("argument path is not of type string")
+
+    if outputs is None:
+        outputs = circuit.compile(formulation).names
+    outputs = list(outputs)
+    frequency = np.asarray(state_dict["frequency"], dtype=np.float64)
+    if frequency.ndim != 1:
+        raise ValueError("streaming sweeps require a 1-D array of frequencies")
+
+    files = (path, Files.sidecar_path(path, ".frequency.npy"), Files.sidecar_path(path))
+    results = np.lib.format.open_memmap(path, mode="w+", dtype=np.complex128, shape=(len(outputs), len(frequency)))
+    try:
+        start = 0
+        for frequencies, block in iter_sweep(circuit, state_dict, outputs, chunk_size, solver, formulation):
+            results[:, start:start + len(frequencies)] = block.T
+            start += len(frequencies)
+        results.flush()
+        del results
+
+        np.save(files[1], frequency)
+        with open(files[2], "w") as f:
+            json.dump({
+                "Columns": {name: i for i, name in enumerate(outputs)},
+                "Frequency": os.path.basename(files[1])
+            }, f, indent=4)
+    except Exception:
+        # a partially written sweep would be loaded as if it were complete
+        results = None
+        for name in files:
+            if os.path.exists(name):
+                os.remove(name)
+        raise
+
+
+def load_sweep(path, names=None):
+    """
+    opens a sweep written by write_sweep without reading it into memory
+    :type path: str
+    :type names: list
+    :param path: the .npy file the results were written to
+    :param names: the signals to return, defaults to all of them
+    :return: (frequencies, signals) where signals maps each name to a read-only memory-mapped array
+    """
+
+    with open(Files.sidecar_path(path), "r") as f:
+        sidecar = json.load(f)
+
+    results = np.load(path, mmap_mode="r")
+    frequency = np.load(os.path.join(os.path.dirname(path), sidecar["Frequency"]), mmap_mode="r")
+    if names is None:
+        names = list(sidecar["Columns"])
+
+    return frequency, {name: results[sidecar["Columns"][name]] for name in names}
+
+
+def monte_carlo(circuit, distributions, samples, state_dict=None, seed=None, **kwargs):
+    """
+    draws component values from distributions and solves the circuit for every draw
+    :type circuit: Circuit
+    :type distributions: dict
+    :type samples: int
+    :param circuit: the circuit to be simulated
+    :param distributions: objects with a sample(rng, size) method such as Normal or Uniform, keyed by component name
+    :param samples: number of draws
+    :param state_dict: the external parameters of the circuit, the frequency may be an array of frequencies
+    :param seed: seed of the random number generator
+    :param kwargs: passed on to parameter_sweep
+    :return: (values, results), the drawn values and the results of parameter_sweep
+    """
+
+    values = sample_values(distributions, samples, seed)
+
+    return values, parameter_sweep(circuit, values, state_dict, **kwargs)
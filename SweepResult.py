@@ -0,0 +1,98 @@
+from collections.abc import Mapping
+import numpy as np
+
+
+class SweepResult(Mapping):
+    """
+    the results of an analysis, backed by a single array with one row per node or component
+
+    Indexing with a name returns a view of that row; indexing with a list of names returns a view as well when
+    the names are evenly spaced in the array and a copy otherwise. The name->row index is shared with the
+    compiled circuit, so creating a result does not build any per-name structure.
+    """
+
+    def __init__(self, solutions, index, names=None):
+        """
+        :type solutions: np.ndarray
+        :type index: dict
+        :type names: tuple
+        :param solutions: array whose first axis runs over the nodes and components, any further axes run over
+                          the points of the analysis, e.g. frequencies
+        :param index: mapping from each name to its row of solutions
+        :param names: the names in row order, derived from index if not given
+        """
+
+        self.solutions = solutions
+        self.index = index
+        self.names = tuple(names) if names is not None else tuple(sorted(index, key=index.get))
+
+    def __repr__(self):
+        return "SweepResult({} signals, shape {})".format(len(self.names), self.solutions.shape[1:])
+
+    def __len__(self):
+        return len(self.names)
+
+    def __iter__(self):
+        return iter(self.names)
+
+    def __contains__(self, name):
+        return name in self.index
+
+    def __getitem__(self, key):
+        if isinstance(key, str):
+            return self.solutions[self.index[key]]
+
+        return self.solutions[self.rows(key)]
+
+    def rows(self, names):
+        """
+        :type names: list
+        :param names: node and component names
+        :return: a slice over the rows of names if they are evenly spaced, an index array otherwise
+        """
+
+        rows = np.array([self.index[name] for name in names], dtype=np.int64)
+        if len(rows) == 0:
+            return slice(0, 0)
+
+        step = rows[1] - rows[0] if len(rows) > 1 else 1
+        if step > 0 and np.all(np.diff(rows) == step):
+            return slice(rows[0], rows[-1] + 1, step)
+
+        return rows
+
+    def _select(self, key):
+        return self.solutions if key is None else self[key]
+
+    def magnitude(self, key=None):
+        """
+        :param key: a name, a list of names, or None for every signal
+        :return: the magnitude of the selected signals
+        """
+
+        return np.abs(self._select(key))
+
+    def phase(self, key=None, degrees=False):
+        """
+        :param key: a name, a list of names, or None for every signal
+        :param degrees: return the phase in degrees instead of radians
+        :return: the phase of the selected signals
+        """
+
+        return np.angle(self._select(key), deg=degrees)
+
+    def db(self, key=None):
+        """
+        :param key: a name, a list of names, or None for every signal
+        :return: the magnitude of the selected signals in decibels
+        """
+
+        with np.errstate(divide="ignore"):
+            return 20 * np.log10(np.abs(self._select(key)))
+
+    def to_dict(self):
+        """
+        :return: a dictionary of each voltage and current value, indexed by name, as ac_sweep used to return
+        """
+
+        return {name: self.solutions[row] for row, name in enumerate(self.names)}
@@ -0,0 +1,131 @@
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+from util.UnionFind import UnionFind
+from StampPlan import StampPlan
+
+
+def _split_rows(block, count):
+    """
+    :param block: the block of every row, -1 for rows in no block
+    :return: a list of count arrays holding the rows of every block, in order
+    """
+
+    rows = np.flatnonzero(block >= 0)
+    rows = rows[np.argsort(block[rows], kind="stable")]
+    bounds = np.cumsum(np.bincount(block[rows], minlength=count))[:-1]
+
+    return np.split(rows, bounds) if count != 0 else list()
+
+
+class Topology(object):
+    """
+    the connectivity of a circuit, computed once per topology with a union-find pass over its terminal arrays
+
+    All ground nodes are merged into a single reference. Components with both terminals grounded carry no
+    current and are dropped. Nodes without a path to the reference through components which constrain their
+    voltage, or through links, are reported as floating. The remaining non-ground nodes are split into blocks
+    which share no component or link; since the reference voltage is known, every block is an independent
+    system. Blocks are given as (node rows, component rows) arrays of the circuit.
+    """
+
+    def __init__(self, circuit, links=None):
+        """
+        :type links: list
+        :param circuit: the circuit whose node and component arrays are analysed
+        :param links: (node row, node row) pairs whose voltages are tied together by elements which are not
+                      components of the circuit, e.g. subcircuit instances
+        """
+
+        self.circuit = circuit
+        self.names = tuple(circuit._node_names + circuit._cmp_names)
+        self.index = dict()
+        for i, name in enumerate(self.names):
+            self.index.setdefault(name, i)
+
+        count = len(circuit.nodes)
+        reference = count
+        ground = circuit._node_ground.array
+        neg = circuit._cmp_neg.array
+        pos = circuit._cmp_pos.array
+        constrains = np.array([cls.constrains_voltage for cls in circuit._types], dtype=bool)
+        constrains = constrains[circuit._cmp_types.array]
+
+        # terminals of every component, with the ground nodes merged into the reference
+        neg_terminal = np.where(ground[neg], reference, neg)
+        pos_terminal = np.where(ground[pos], reference, pos)
+        links = np.asarray(links if links is not None else list(), dtype=np.int64).reshape(-1, 2)
+        links = np.where(ground[links], reference, links)
+        dropped = ground[neg] & ground[pos]
+
+        self.reference = tuple(circuit.nodes[i] for i in np.flatnonzero(ground))
+        self.dropped = tuple(circuit.components[i] for i in np.flatnonzero(dropped))
+
+        # nodes connected to the reference through voltage constraining components
+        grounded = UnionFind(count + 1)
+        for a, b in zip(neg_terminal[constrains].tolist(), pos_terminal[constrains].tolist()):
+            grounded.union(a, b)
+        for a, b in links.tolist():
+            grounded.union(a, b)
+        # nodes sharing a component or a link, ignoring the reference
+        coupled = UnionFind(count + 1)
+        internal = (neg_terminal != reference) & (pos_terminal != reference)
+        for a, b in zip(neg_terminal[internal].tolist(), pos_terminal[internal].tolist()):
+            coupled.union(a, b)
+        for a, b in links[np.all(links != reference, axis=1)].tolist():
+            coupled.union(a, b)
+
+        root = grounded.find(reference)
+        self.floating = tuple(
+            circuit._node_names[i] for i in np.flatnonzero(~ground).tolist() if grounded.find(i) != root
+        )
+
+        # blocks are numbered in order of their first node
+        node_block = np.full(count, -1, dtype=np.int64)
+        numbers = dict()
+        for i in np.flatnonzero(~ground).tolist():
+            node_block[i] = numbers.setdefault(coupled.find(i), len(numbers))
+        cmp_block = np.where(dropped, -1, node_block[np.where(ground[neg], pos, neg)])
+
+        self.blocks = tuple(zip(_split_rows(node_block, len(numbers)), _split_rows(cmp_block, len(numbers))))
+
+        # position of the results of every block within the results of the circuit
+        self.block_index = tuple(np.concatenate([nodes, cmps + count]) for nodes, cmps in self.blocks)
+
+        self._plans = dict()
+
+    def get_plans(self, formulation="mna"):
+        """
+        :type formulation: str
+        :param formulation: "mna" or "nodal", see StampPlan
+        :return: one StampPlan per block, built on first use
+        """
+
+        if formulation not in self._plans:
+            self._plans[formulation] = tuple(
+                StampPlan(self.circuit, nodes, cmps, formulation) for nodes, cmps in self.blocks
+            )
+
+        return self._plans[formulation]
+
+    def solve(self, state_dict, points, solver="auto", formulation="mna", workers=None):
+        """
+        solves every block as a separate system
+        :type workers: int
+        :param workers: number of threads solving blocks concurrently, blocks are solved in turn if None
+        :return: (F, len(names)) array of results ordered like names
+        """
+
+        plans = self.get_plans(formulation)
+        results = np.zeros([points, len(self.names)], dtype=np.complex128)
+
+        def solve_block(i):
+            results[:, self.block_index[i]] = plans[i].solve(state_dict, points, solver)
+
+        if workers is None or workers <= 1:
+            for i in range(len(plans)):
+                solve_block(i)
+        else:
+            with ThreadPoolExecutor(workers) as executor:
+                list(executor.map(solve_block, range(len(plans))))
+
+        return results
@@ -0,0 +1,124 @@
+from math import pi
+import numpy as np
+from Circuit import CircuitError
+from SweepResult import SweepResult
+
+
+class TransferFunction(object):
+    """
+    the transfer functions from a set of sources to a set of outputs in pole/residue form
+
+        H(s) = D + sum_i R_i / (s - p_i)
+
+    Every pair shares the poles of the circuit, so evaluating a frequency costs O(poles) per pair and needs no
+    linear solve. Poles are given in rad/s.
+    """
+
+    def __init__(self, sources, outputs, poles, residues, direct):
+        """
+        :type sources: list
+        :type outputs: list
+        :param sources: names of the excited sources
+        :param outputs: names of the nodes and components observed
+        :param poles: (P,) array of poles
+        :param residues: (O, S, P) array of residues of every output and source
+        :param direct: (O, S) array of direct terms of every output and source
+        """
+
+        self.sources = tuple(sources)
+        self.outputs = tuple(outputs)
+        self.index = {name: i for i, name in enumerate(self.outputs)}
+        self.poles = poles
+        self.residues = residues
+        self.direct = direct
+
+    def __repr__(self):
+        return "TransferFunction({} sources, {} outputs, {} poles)".format(
+            len(self.sources), len(self.outputs), len(self.poles)
+        )
+
+    def evaluate(self, frequency):
+        """
+        :param frequency: a frequency or 1-D array of frequencies, in Hz
+        :return: a SweepResult of (S, F) arrays, or (S,) arrays for a scalar frequency, keyed by output, whose row
+                 i is the response to a unit value of sources[i]
+        """
+
+        frequency = np.asarray(frequency, dtype=np.float64)
+        s = 2j * pi * np.atleast_1d(frequency)
+
+        terms = 1 / (s[:, np.newaxis] - self.poles[np.newaxis])
+        results = self.direct[..., np.newaxis] + self.residues @ terms.T
+        if frequency.ndim == 0:
+            results = results[..., 0]
+
+        return SweepResult(results, self.index, self.outputs)
+
+
+def transfer_function(circuit, sources=None, outputs=None, shift=None, tolerance=1e-12):
+    """
+    extracts the transfer functions of an RLC circuit from its sources to its outputs
+    the mna system is split into G + sC, taken from the laplace parameters of the components, and the
+    poles and residues follow from one eigendecomposition of (G + s0 C)^-1 C around the shift s0
+    :type circuit: Circuit
+    :type sources: list
+    :type outputs: list
+    :type shift: float
+    :type tolerance: float
+    :param circuit: the circuit to be analysed
+    :param sources: names of the excited sources, defaults to every source of the circuit in circuit order; each
+                    source is excited with a unit value while every other source is zero
+    :param outputs: names of the nodes and components observed, defaults to all of them
+    :param shift: the expansion point s0 in rad/s, which must not be a pole; chosen from the scale of G and C if None
+    :param tolerance: eigenvalues smaller than tolerance relative to the largest one are poles at infinity and
+                      are folded into the direct term
+    :return: a TransferFunction
+    """
+
+    circuit.check_topology()
+    plan = circuit.compile("mna")
+    a0, a1, b0, b1, c = plan.get_laplace()
+
+    if sources is None:
+        sources = [cmp.name for cmp in circuit.components if cmp.is_source]
+    sources = list(sources)
+    if outputs is None:
+        outputs = plan.names
+    outputs = list(outputs)
+
+    owner = {name: i for i, name in enumerate(plan.active_names)}
+    excitation = np.zeros([len(sources), len(plan.active)])
+    for i, name in enumerate(sources):
+        if not circuit.get_component(name).is_source:
+            raise CircuitError("component {} is not a source".format(name))
+        if name in owner:
+            excitation[i, owner[name]] = 1
+
+    # G holds the static stamps and the frequency independent parameters, C the parameters proportional to s
+    zero = np.zeros([1, len(plan.active)])
+    g = np.zeros([plan.size, plan.size], dtype=np.complex128)
+    g[plan.rows, plan.cols] = plan.scatter(a0[np.newaxis], b0[np.newaxis], zero)[0][0]
+    cap = np.zeros([plan.size, plan.size], dtype=np.complex128)
+    cap[plan.rows, plan.cols] = plan.scatter(a1[np.newaxis], b1[np.newaxis], zero)[0][0] - plan.static
+
+    rhs = plan.scatter_rhs(
+        np.broadcast_to(a0, excitation.shape), np.broadcast_to(b0, excitation.shape), excitation
+    ).T
+
+    if shift is None:
+        scale = np.linalg.norm(cap, 1)
+        shift = np.linalg.norm(g, 1) / scale if scale != 0 else 1
+
+    # G + sC = K (I + (s - s0) K^-1 C) with K = G + s0 C, and K^-1 C = V diag(lambda) V^-1
+    k = g + shift * cap
+    eigenvalues, vectors = np.linalg.eig(np.linalg.solve(k, cap))
+    weights = np.linalg.solve(vectors, np.linalg.solve(k, rhs))
+    observed = vectors[[plan.index[name] for name in outputs]]
+
+    # (1 + (s - s0) lambda)^-1 = (1 / lambda) / (s - (s0 - 1 / lambda))
+    finite = np.abs(eigenvalues) > tolerance * max(np.max(np.abs(eigenvalues), initial=0), np.finfo(float).tiny)
+    poles = shift - 1 / eigenvalues[finite]
+    residues = observed[:, np.newaxis, finite] * (weights[finite].T / eigenvalues[finite])[np.newaxis]
+    direct = observed[:, ~finite] @ weights[~finite]
+
+    return TransferFunction(sources, outputs, poles, residues, direct)
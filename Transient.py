@@ -0,0 +1,204 @@
+import json
+import numpy as np
+from util import Factorization, Files
+from Circuit import CircuitError
+from SweepResult import SweepResult
+
+
+METHODS = ("backward_euler", "trapezoidal")
+
+# number of timesteps held in memory at once by the streaming analyses
+TRANSIENT_CHUNK_STEPS = 4096
+
+
+def _get_waveforms(circuit, plan, waveforms):
+    """
+    :return: a list of (owner, type, waveform) of the active components driven by a waveform
+    """
+
+    owner = {name: i for i, name in enumerate(plan.active_names)}
+    overrides = list()
+    for name, waveform in waveforms.items():
+        cmp = circuit.get_component(name)
+        cls = type(cmp)
+        if cls.value_name is None:
+            raise CircuitError("component {} does not have a value to drive".format(name))
+
+        # a waveform may only move the right hand side, the factorized matrix stays fixed
+        if not cls.is_source:
+            raise CircuitError("component {} can not be driven by a waveform, it is part of the matrix".format(name))
+
+        if name in owner:
+            overrides.append((owner[name], cls, waveform))
+
+    return overrides
+
+
+def _sample_waveform(waveform, time, start):
+    """
+    :param waveform: a function of an array of times, or an array holding the value at every step
+    :return: the values of waveform at the steps time[0], time[1]..., time[0] being step number start
+    """
+
+    if callable(waveform):
+        return np.broadcast_to(np.asarray(waveform(time), dtype=np.float64), time.shape)
+
+    return np.asarray(waveform[start:start + len(time)], dtype=np.float64)
+
+
+def iter_transient(circuit, step, stop, method="trapezoidal", waveforms=None, outputs=None, chunk_size=None,
+                   solver="auto", formulation="mna"):
+    """
+    simulates the circuit in the time domain with a fixed timestep, yielding blocks of results as they are solved
+    capacitors and inductors are replaced by their companion models; since the timestep is fixed, the system matrix
+    is factorized once and every step only assembles a right hand side and solves the factorized system
+    the circuit starts from rest: the first row of the results is time 0, with every voltage and current zero, and
+    the sources switch on right after it, so sources without a waveform give a step response
+    :type circuit: Circuit
+    :type step: float
+    :type stop: float
+    :type method: str
+    :type waveforms: dict
+    :type outputs: list
+    :type chunk_size: int
+    :param circuit: the circuit to be simulated
+    :param step: the timestep
+    :param stop: the time at which the simulation ends, rounded to a whole number of steps
+    :param method: "trapezoidal" or "backward_euler", the latter damps the ringing of stiff circuits
+    :param waveforms: values of sources over time keyed by component name, either a function of an array of times
+                      or an array holding the value at every step; other components keep their value
+    :param outputs: names of the nodes and components kept in the results, defaults to all of them
+    :param chunk_size: number of steps yielded at once, TRANSIENT_CHUNK_STEPS if None
+    :param solver: "dense", "sparse", "banded" or "auto", see Circuit.ac_sweep
+    :param formulation: "mna" or "nodal", see Circuit.ac_sweep
+    :return: a generator of (times, block) where block is a (chunk, len(outputs)) array
+    """
+
+    if method not in METHODS:
+        raise ValueError("unknown method {}, expected one of {}".format(method, METHODS))
+    if step <= 0:
+        raise ValueError("step must be positive")
+
+    circuit.check_topology()
+    plan = circuit.compile(formulation)
+    steps = int(round(stop / step))
+    chunk = TRANSIENT_CHUNK_STEPS if chunk_size is None else max(1, chunk_size)
+
+    if outputs is None:
+        outputs = plan.names
+    columns = np.array([plan.index[name] for name in outputs], dtype=np.int64)
+
+    a, b, c, gv, gi = plan.get_companions(step, method)
+    overrides = _get_waveforms(circuit, plan, waveforms if waveforms is not None else dict())
+    a = a[np.newaxis]
+    b = b[np.newaxis]
+
+    data = plan.scatter(a, b, c[np.newaxis])[0][0]
+    factorization = Factorization.factorize(plan.size, plan.rows, plan.cols, data, solver, plan.get_ordering(solver))
+
+    # results of the previous step, with an extra zero column for ground nodes outside of the plan
+    previous = np.zeros(len(plan.names) + 1)
+    for start in range(0, steps + 1, chunk):
+        time = np.arange(start, min(start + chunk, steps + 1)) * step
+        block = np.empty([len(time), len(columns)])
+
+        # the constant part of the right hand side of every step of the block
+        constant = np.repeat(c[np.newaxis], len(time), axis=0)
+        for i, cls, waveform in overrides:
+            constant[:, i] = cls.companion(_sample_waveform(waveform, time, start), step, method)[2]
+
+        for n in range(len(time)):
+            if start + n != 0:
+                voltage = previous[plan.terminal_pos] - previous[plan.terminal_neg]
+                current = previous[plan.active_index]
+                rhs_c = (constant[n] + gv * voltage + gi * current)[np.newaxis]
+
+                solution = factorization.solve(plan.scatter_rhs(a, b, rhs_c)[0])
+                previous[:-1] = plan.expand(solution[np.newaxis], a, b, rhs_c)[0]
+
+            block[n] = previous[columns]
+
+        yield time, block
+
+
+def transient(circuit, step, stop, method="trapezoidal", waveforms=None, outputs=None, solver="auto",
+              formulation="mna"):
+    """
+    simulates the circuit in the time domain with a fixed timestep, see iter_transient
+    :return: (times, results) where results is a SweepResult of arrays over the times, keyed by name
+    """
+
+    if outputs is None:
+        outputs = circuit.compile(formulation).names
+    outputs = list(outputs)
+    steps = int(round(stop / step))
+
+    times = np.empty(steps + 1)
+    results = np.empty([len(outputs), steps + 1])
+    start = 0
+    for time, block in iter_transient(circuit, step, stop, method, waveforms, outputs, None, solver, formulation):
+        times[start:start + len(time)] = time
+        results[:, start:start + len(time)] = block.T
+        start += len(time)
+
+    return times, SweepResult(results, {name: i for i, name in enumerate(outputs)}, outputs)
+
+
+def write_transient(circuit, path, step, stop, method="trapezoidal", waveforms=None, outputs=None, chunk_size=None,
+                    solver="auto", formulation="mna"):
+    """
+    streams a transient analysis into a memory-mapped .npy file, holding at most chunk_size steps in memory
+    the results are stored as a (len(outputs), steps + 1) array so that every waveform is contiguous on disk; the
+    sidecar <name>.json maps signal names to rows and records the timestep
+    :type circuit: Circuit
+    :type path: str
+    :param circuit: the circuit to be simulated
+    :param path: the .npy file the results are written to
+    :return: the number of steps written, including time 0
+    """
+
+    if type(path) is not str:
+        raise TypeError("argument path is not of type string")
+
+    if outputs is None:
+        outputs = circuit.compile(formulation).names
+    outputs = list(outputs)
+    steps = int(round(stop / step))
+
+    results = np.lib.format.open_memmap(path, mode="w+", dtype=np.float64, shape=(len(outputs), steps + 1))
+    start = 0
+    for time, block in iter_transient(
+            circuit, step, stop, method, waveforms, outputs, chunk_size, solver, formulation
+    ):
+        results[:, start:start + len(time)] = block.T
+        start += len(time)
+    results.flush()
+    del results
+
+    with open(Files.sidecar_path(path), "w") as f:
+        json.dump({
+            "Columns": {name: i for i, name in enumerate(outputs)},
+            "Step": step
+        }, f, indent=4)
+
+    return steps + 1
+
+
+def load_transient(path, names=None):
+    """
+    opens a transient analysis written by write_transient without reading it into memory
+    :type path: str
+    :type names: list
+    :param path: the .npy file the results were written to
+    :param names: the signals to return, defaults to all of them
+    :return: (times, signals) where signals maps each name to a read-only memory-mapped array
+    """
+
+    with open(Files.sidecar_path(path), "r") as f:
+        sidecar = json.load(f)
+
+    results = np.load(path, mmap_mode="r")
+    if names is None:
+        names = list(sidecar["Columns"])
+
+    return np.arange(results.shape[1]) * sidecar["Step"], {name: results[sidecar["Columns"][name]] for name in names}
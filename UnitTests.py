@@ -1,8 +1,26 @@
 import unittest
+import unittest.mock
 from math import pi
 from typing import Any
 
+import io
+import asyncio
+import os
+import json
+import tempfile
 from Circuit import *
+import Sweep
+import Netlist
+import Spice
+import Transient
+import TransferFunction
+from Session import Session
+import Sensitivity
+from Subcircuit import Subcircuit, Hierarchy
+from util import Factorization, Profiling, Solvers
+from Cache import ResultCache
+import Benchmarks
+import Server
 
 
 def create_tmp_file():
@@ -175,11 +193,11 @@ class ACAnalysis(unittest.TestCase):
         self.assertEqual(0, results["N0"], "Voltage at N0 is wrong")
         self.assertEqual(5, results["N1"], "Voltage at N1 is wrong")
         self.assertAlmostEqualComplex(
-            0.01j*pi, complex(results["V0"]),
+            -0.01j*pi, complex(results["V0"]),
             6, "Current through the voltage source is wrong"
         )
         self.assertAlmostEqualComplex(
-            -0.01j*pi, complex(results["C0"]),
+            0.01j*pi, complex(results["C0"]),
             6, "Current through the capacitor is wrong"
         )
 
@@ -196,5 +214,1528 @@ class ACAnalysis(unittest.TestCase):
         self.assertEqual(5e-3, results["R0"], "Current through the resistor is wrong")
 
 
+class FrequencySweep(unittest.TestCase):
+    def test_matches_scalar_sweep(self):
+        circ, n0, n1 = two_node_circuit()
+        n2 = Node("N2")
+        circ.add_node(n2)
+
+        VoltageSource("V0", n0, n1, 5)
+        Resistor("R0", n1, n2, 1e3)
+        Capacitor("C0", n0, n2, 1e-6)
+        Inductor("L0", n0, n2, 1e-3)
+
+        frequencies = np.logspace(1, 6, 25)
+        results = circ.ac_sweep({"frequency": frequencies})
+
+        for i, frequency in enumerate(frequencies):
+            expected = circ.ac_sweep({"frequency": frequency})
+            for name, value in expected.items():
+                self.assertAlmostEqual(0, abs(results[name][i] - value), 9, name)
+
+    def test_result_shape(self):
+        circ, n0, n1 = two_node_circuit()
+
+        VoltageSource("V0", n0, n1, 5)
+        Resistor("R0", n0, n1, 1e3)
+        results = circ.ac_sweep({"frequency": [1e2, 1e3, 1e4]})
+
+        self.assertEqual((3,), results["R0"].shape)
+        self.assertTrue(np.allclose(5e-3, results["R0"]))
+
+
+def rc_ladder(sections):
+    circ = Circuit("Ladder")
+    ground = Node("GND", True)
+    circ.add_node(ground)
+
+    prev = Node("N0")
+    circ.add_node(prev)
+    VoltageSource("V0", ground, prev, 1)
+
+    for i in range(1, sections + 1):
+        node = Node("N{}".format(i))
+        circ.add_node(node)
+        Resistor("R{}".format(i), prev, node, 1e3)
+        Capacitor("C{}".format(i), ground, node, 1e-9)
+        prev = node
+
+    return circ
+
+
+def rc_step_circuit():
+    circ, n0, n1 = two_node_circuit()
+    n2 = Node("N2")
+    circ.add_node(n2)
+    VoltageSource("V1", n0, n1, 1)
+    Resistor("R1", n1, n2, 1e3)
+    Capacitor("C1", n0, n2, 1e-6)
+
+    return circ
+
+
+class SparseSolver(unittest.TestCase):
+    def test_matches_dense(self):
+        circ = rc_ladder(20)
+        frequencies = np.logspace(2, 6, 7)
+
+        dense = circ.ac_sweep({"frequency": frequencies}, solver="dense")
+        sparse = circ.ac_sweep({"frequency": frequencies}, solver="sparse")
+
+        for name in dense:
+            self.assertTrue(np.allclose(dense[name], sparse[name]), name)
+
+    def test_auto_selection(self):
+        self.assertEqual("dense", Solvers.choose_solver(10))
+        self.assertEqual("sparse", Solvers.choose_solver(Solvers.SPARSE_THRESHOLD + 1))
+
+    def test_unknown_solver(self):
+        circ, n0, n1 = two_node_circuit()
+        Resistor("R0", n0, n1, 1e3)
+
+        self.assertRaises(ValueError, circ.ac_sweep, {"frequency": 1e3}, "cholesky")
+
+
+class BandedSolver(unittest.TestCase):
+    def test_ordering(self):
+        plan = rc_ladder(300).compile()
+        order, lower, upper = plan.get_ordering()
+
+        # circuit order numbers every node before every component, spreading the ladder across the matrix
+        self.assertLess(300, np.max(np.abs(plan.rows - plan.cols)))
+        self.assertEqual(list(range(plan.size)), sorted(order.tolist()))
+        self.assertLessEqual(max(lower, upper), 4)
+        self.assertEqual("banded", Solvers.choose_solver(plan.size, "auto", plan.get_ordering()))
+        self.assertEqual("sparse", Solvers.choose_solver(plan.size, "auto"))
+
+    def test_lazy_ordering(self):
+        circ = rc_ladder(300)
+        for solver in ("dense", "sparse"):
+            circ.ac_sweep({"frequency": 1e3}, solver)
+            self.assertIsNone(circ.compile()._ordering)
+            self.assertIsNone(circ.compile().get_ordering(solver))
+
+        circ.ac_sweep({"frequency": 1e3}, "auto")
+        self.assertIsNotNone(circ.compile()._ordering)
+        self.assertIsNone(rc_ladder(3).compile().get_ordering("auto"))
+
+    def test_empty_system(self):
+        circ = Circuit()
+        n0 = Node("N0", True)
+        n1 = Node("N1", True)
+        circ.add_node(n0)
+        circ.add_node(n1)
+        Resistor("R0", n0, n1, 1e3)
+
+        results = circ.ac_sweep({"frequency": 1e3}, "banded", formulation="nodal")
+        self.assertEqual(0, results["N0"])
+        self.assertEqual(0, results["R0"])
+        self.assertEqual(0, len(circ.compile("nodal").get_ordering("banded")[0]))
+
+    def test_matches_dense(self):
+        circ = rc_ladder(20)
+        Inductor("L0", circ.get_node("N3"), circ.get_node("N17"), 1e-3)
+        frequencies = np.logspace(2, 6, 7)
+
+        for formulation in ("mna", "nodal"):
+            dense = circ.ac_sweep({"frequency": frequencies}, solver="dense", formulation=formulation)
+            banded = circ.ac_sweep({"frequency": frequencies}, solver="banded", formulation=formulation)
+
+            for name in dense:
+                self.assertTrue(np.allclose(dense[name], banded[name]), name)
+
+    def test_factorization(self):
+        plan = rc_ladder(10).compile()
+        a, b, c = plan.get_params({"frequency": 1e3}, 1)
+        data, rhs = plan.scatter(a, b, c)
+        mrx = np.zeros([plan.size, plan.size], dtype=data.dtype)
+        mrx[plan.rows, plan.cols] = data[0]
+
+        factorization = Factorization.factorize(plan.size, plan.rows, plan.cols, data[0], "banded")
+        self.assertTrue(np.allclose(np.linalg.solve(mrx, rhs[0]), factorization.solve(rhs[0])))
+        self.assertTrue(np.allclose(np.linalg.solve(mrx.T, rhs[0]), factorization.solve(rhs[0], trans=True)))
+
+        times, dense = Transient.transient(rc_step_circuit(), 1e-4, 5e-3, solver="dense")
+        times, banded = Transient.transient(rc_step_circuit(), 1e-4, 5e-3, solver="banded")
+        self.assertTrue(np.allclose(dense["N2"], banded["N2"]))
+
+
+class CompiledPlan(unittest.TestCase):
+    def test_plan_is_reused(self):
+        circ, n0, n1 = two_node_circuit()
+        Resistor("R0", n0, n1, 1e3)
+
+        plan = circ.compile()
+        circ.ac_sweep({"frequency": 1e3})
+
+        self.assertIs(plan, circ.compile())
+        self.assertFalse(plan.rows.flags.writeable)
+
+    def test_plan_is_invalidated(self):
+        circ, n0, n1 = two_node_circuit()
+        VoltageSource("V0", n0, n1, 5)
+        plan = circ.compile()
+
+        n2 = Node("N2")
+        circ.add_node(n2)
+        self.assertIsNot(plan, circ.compile())
+
+        plan = circ.compile()
+        Resistor("R0", n1, n2, 1e3)
+        Resistor("R1", n2, n0, 1e3)
+        self.assertIsNot(plan, circ.compile())
+        self.assertEqual(2.5, circ.ac_sweep({"frequency": 1e3})["N2"])
+
+    def test_value_changes_without_recompile(self):
+        circ, n0, n1 = two_node_circuit()
+        VoltageSource("V0", n0, n1, 5)
+        resistor = Resistor("R0", n0, n1, 1e3)
+        plan = circ.compile()
+
+        resistor.resistance = 500
+        results = circ.ac_sweep({"frequency": 1e3})
+
+        self.assertIs(plan, circ.compile())
+        self.assertEqual(1e-2, results["R0"])
+
+
+class NameLookup(unittest.TestCase):
+    def test_get_node(self):
+        circ, n0, n1 = two_node_circuit()
+
+        self.assertIs(n1, circ.get_node("N1"))
+        self.assertRaises(CircuitError, circ.get_node, "N2")
+
+    def test_duplicate_component_name(self):
+        circ, n0, n1 = two_node_circuit()
+        Resistor("R0", n0, n1, 1e3)
+
+        self.assertRaises(NameError, Resistor, "R0", n0, n1, 1e3)
+        self.assertRaises(NameError, Resistor, "N1", n0, n1, 1e3)
+
+    def test_rename(self):
+        circ, n0, n1 = two_node_circuit()
+        resistor = Resistor("R0", n0, n1, 1e3)
+        n1.add_component(resistor, True)
+        self.assertRaises(CircuitError, n1.add_component, resistor, False)
+
+        n1.name = "out"
+        resistor.name = "R1"
+        self.assertIs(n1, circ.get_node("out"))
+        self.assertIs(resistor, circ.get_component("R1"))
+        self.assertRaises(CircuitError, circ.get_node, "N1")
+        self.assertRaises(CircuitError, circ.get_component, "R0")
+        self.assertEqual(("N0", "out", "R1"), circ.compile().names)
+
+        self.assertRaises(NameError, setattr, resistor, "name", "out")
+        self.assertRaises(TypeError, setattr, n1, "name", 1)
+
+    def test_add_components(self):
+        circ, n0, n1 = two_node_circuit()
+
+        created = circ.add_components([
+            {"Type": "VoltageSource", "Name": "V0", "Negative": "N0", "Positive": "N1",
+             "Attributes": {"voltage": 5}},
+            {"Type": "Resistor", "Name": "R0", "Negative": "N0", "Positive": "N1",
+             "Attributes": {"resistance": 1e3}}
+        ])
+
+        self.assertEqual(2, len(created))
+        self.assertIs(created[1], circ.get_component("R0"))
+        self.assertEqual(5e-3, circ.ac_sweep({"frequency": 1e3})["R0"])
+
+    def test_add_components_rejects_whole_batch(self):
+        circ, n0, n1 = two_node_circuit()
+
+        for batch in (
+            [{"Type": "Resistor", "Name": "R0", "Negative": "N0", "Positive": "N1", "Attributes": {"resistance": 1}},
+             {"Type": "Resistor", "Name": "R0", "Negative": "N0", "Positive": "N1", "Attributes": {"resistance": 1}}],
+            [{"Type": "Resistor", "Name": "R0", "Negative": "N0", "Positive": "N1", "Attributes": {"resistance": 1}},
+             {"Type": "Resistor", "Name": "R1", "Negative": "N0", "Positive": "N9", "Attributes": {"resistance": 1}}],
+            [{"Type": "Resistor", "Name": "R0", "Negative": "N0", "Positive": "N1", "Attributes": {"resistance": 1}},
+             {"Type": "Circuit", "Name": "R1", "Negative": "N0", "Positive": "N1", "Attributes": {}}],
+            [{"Type": "Resistor", "Name": "R0", "Negative": "N0", "Positive": "N1", "Attributes": {"resistance": 1}},
+             {"Type": "Resistor", "Name": "R1", "Negative": "N0", "Positive": "N1", "Attributes": {"foo": 1}}],
+            [{"Type": "Resistor", "Name": "R0", "Negative": "N0", "Positive": "N1", "Attributes": {"resistance": 1}},
+             {"Type": "Resistor", "Name": "R1", "Negative": "N0", "Positive": "N1", "Attributes": {}}],
+            [{"Type": "Resistor", "Name": "R0", "Negative": "N0", "Positive": "N1", "Attributes": {"resistance": 1}},
+             {"Type": "Resistor", "Name": "R1", "Negative": "N0", "Positive": "N1", "Attributes": {"resistance": "k"}}],
+            [{"Type": "Resistor", "Name": "R0", "Negative": "N0", "Positive": "N1", "Attributes": {"resistance": 1}},
+             {"Type": "Resistor", "Name": "R1", "Negative": "N0", "Positive": "N1", "Attributes": [1]}]
+        ):
+            self.assertRaises((NameError, CircuitError, TypeError), circ.add_components, batch)
+            self.assertEqual(0, len(circ.components))
+            self.assertFalse(circ.has_name("R0"))
+
+    def test_add_components_rolls_back_constructor_errors(self):
+        @register_component_type
+        class Gain(Component):
+            def __init__(self, name, n_neg, n_pos, gain):
+                super(Gain, self).__init__(name, n_neg, n_pos)
+
+                if gain <= 0:
+                    raise ValueError("gain must be positive")
+                self.gain = gain
+
+            def get_params(self, state_dict):
+                return 1, 0, self.gain
+
+            def get_attributes(self):
+                return {"gain": self.gain}
+
+        circ, n0, n1 = two_node_circuit()
+        batch = [
+            {"Type": "Resistor", "Name": "R0", "Negative": "N0", "Positive": "N1", "Attributes": {"resistance": 1}},
+            {"Type": "Gain", "Name": "G0", "Negative": "N0", "Positive": "N1", "Attributes": {"gain": -1}},
+            {"Type": "Resistor", "Name": "R1", "Negative": "N0", "Positive": "N1", "Attributes": {"resistance": 1}}
+        ]
+
+        self.assertRaises(ValueError, circ.add_components, batch)
+        self.assertEqual(0, len(circ.components))
+        self.assertEqual(0, len(circ._cmp_values))
+        self.assertFalse(circ.has_name("G0"))
+
+        batch[1]["Attributes"]["gain"] = 2
+        self.assertEqual(["R0", "G0", "R1"], [cmp.name for cmp in circ.add_components(batch)])
+        self.assertEqual([0, 1, 2], [cmp._index for cmp in circ.components])
+
+
+class NodalFormulation(unittest.TestCase):
+    def assertMatchesMNA(self, circ, state_dict):
+        mna = circ.ac_sweep(state_dict)
+        nodal = circ.ac_sweep(state_dict, formulation="nodal")
+
+        self.assertEqual(list(mna), list(nodal))
+        for name in mna:
+            self.assertTrue(np.allclose(mna[name], nodal[name]), name)
+
+    def test_ladder(self):
+        circ = rc_ladder(10)
+        self.assertMatchesMNA(circ, {"frequency": np.logspace(2, 6, 5)})
+        self.assertLess(circ.compile("nodal").size, circ.compile("mna").size / 2)
+
+    def test_current_source(self):
+        circ, n0, n1 = two_node_circuit()
+
+        CurrentSource("I0", n0, n1, -5e-3)
+        Resistor("R0", n0, n1, 1e3)
+        Inductor("L0", n0, n0, 1e-3)
+        self.assertMatchesMNA(circ, {"frequency": 1e3})
+
+    def test_rlc(self):
+        circ, n0, n1 = two_node_circuit()
+        n2 = Node("N2")
+        circ.add_node(n2)
+
+        VoltageSource("V0", n0, n1, 5)
+        Resistor("R0", n1, n2, 50)
+        Inductor("L0", n2, n0, 1e-3)
+        Capacitor("C0", n0, n2, 1e-6)
+        self.assertMatchesMNA(circ, {"frequency": [1e2, 5e3, 1e5]})
+
+    def test_zero_admittance(self):
+        circ, n0, n1 = two_node_circuit()
+
+        VoltageSource("V0", n0, n1, 5)
+        Inductor("L0", n0, n1, 1e-3)
+        self.assertRaises(ZeroDivisionError, circ.ac_sweep, {"frequency": 0}, formulation="nodal")
+
+    def test_zero_frequency(self):
+        circ, n0, n1 = two_node_circuit()
+
+        VoltageSource("V0", n0, n1, 5)
+        Capacitor("C0", n0, n1, 1e-6)
+        for formulation in ("mna", "nodal"):
+            self.assertRaises(ZeroDivisionError, circ.ac_sweep, {"frequency": 0}, formulation=formulation)
+            self.assertRaises(ZeroDivisionError, circ.ac_sweep, {"frequency": [0, 1e3]}, formulation=formulation)
+
+
+class TopologyAnalysis(unittest.TestCase):
+    def test_floating_nodes(self):
+        circ, n0, n1 = two_node_circuit()
+        n2 = Node("N2")
+        n3 = Node("N3")
+        circ.add_node(n2)
+        circ.add_node(n3)
+
+        Resistor("R0", n0, n1, 1e3)
+        Resistor("R1", n2, n3, 1e3)
+        CurrentSource("I0", n0, n2, 1e-3)
+
+        self.assertEqual(("N2", "N3"), circ.get_topology().floating)
+        try:
+            circ.ac_sweep({"frequency": 1e3})
+        except CircuitError as e:
+            self.assertEqual("nodes N2, N3 have no path to ground", str(e))
+            return
+
+        self.assertTrue(False, "floating nodes were not reported")
+
+    def test_ground_merging(self):
+        circ, n0, n1 = two_node_circuit()
+        g = Node("G", True)
+        circ.add_node(g)
+
+        VoltageSource("V0", n0, n1, 5)
+        Resistor("R0", n1, g, 1e3)
+        Resistor("R1", g, n0, 1e3)
+
+        topology = circ.get_topology()
+        self.assertEqual(2, len(topology.reference))
+        self.assertEqual(1, len(topology.dropped))
+        self.assertEqual(1, len(topology.blocks))
+
+        results = circ.ac_sweep({"frequency": 1e3})
+        self.assertEqual(-5e-3, results["R0"])
+        self.assertEqual(0, results["R1"])
+
+    def test_independent_blocks(self):
+        circ = Circuit()
+        ground = Node("GND", True)
+        circ.add_node(ground)
+        for i in range(4):
+            node = Node("N{}".format(i))
+            circ.add_node(node)
+            VoltageSource("V{}".format(i), ground, node, i + 1)
+            Resistor("R{}".format(i), node, ground, 1e3)
+
+        self.assertEqual(4, len(circ.get_topology().blocks))
+
+        for formulation in ("mna", "nodal"):
+            for workers in (None, 4):
+                results = circ.ac_sweep({"frequency": [1e2, 1e3]}, formulation=formulation, workers=workers)
+                for i in range(4):
+                    self.assertTrue(np.allclose(i + 1, results["N{}".format(i)]))
+                    self.assertTrue(np.allclose(-(i + 1) * 1e-3, results["R{}".format(i)]))
+
+
+class ParameterSweep(unittest.TestCase):
+    def test_matches_ac_sweep(self):
+        circ, n0, n1 = two_node_circuit()
+        n2 = Node("N2")
+        circ.add_node(n2)
+
+        VoltageSource("V0", n0, n1, 5)
+        resistor = Resistor("R0", n1, n2, 1e3)
+        capacitor = Capacitor("C0", n0, n2, 1e-6)
+
+        resistances = np.array([100, 1e3, 1e4])
+        capacitances = np.array([1e-9, 1e-6, 1e-7])
+        frequencies = np.logspace(2, 5, 4)
+
+        for chunk_size in (None, 1, 5):
+            results = Sweep.parameter_sweep(
+                circ, {"R0": resistances, "C0": capacitances}, {"frequency": frequencies}, chunk_size=chunk_size
+            )
+            self.assertEqual((3, 4), results["N2"].shape)
+
+            for i in range(3):
+                resistor.resistance = resistances[i]
+                capacitor.capacitance = capacitances[i]
+                expected = circ.ac_sweep({"frequency": frequencies})
+                for name in expected:
+                    self.assertTrue(np.allclose(expected[name], results[name][i]), name)
+            resistor.resistance = 1e3
+            capacitor.capacitance = 1e-6
+
+    def test_monte_carlo(self):
+        circ, n0, n1 = two_node_circuit()
+        n2 = Node("N2")
+        circ.add_node(n2)
+
+        VoltageSource("V0", n0, n1, 2)
+        Resistor("R0", n1, n2, 1e3)
+        Resistor("R1", n2, n0, 1e3)
+
+        distributions = {"R0": Sweep.Uniform.tolerance(1e3, 0.05), "R1": Sweep.Normal(1e3, 10)}
+        values, results = Sweep.monte_carlo(
+            circ, distributions, 100, {"frequency": 1e3}, seed=1, outputs=["N2"]
+        )
+
+        self.assertEqual(["N2"], list(results))
+        self.assertEqual((100,), results["N2"].shape)
+        self.assertTrue(np.allclose(2 * values["R1"] / (values["R0"] + values["R1"]), results["N2"]))
+
+        again = Sweep.monte_carlo(circ, distributions, 100, {"frequency": 1e3}, seed=1, outputs=["N2"])[1]
+        self.assertTrue(np.array_equal(results["N2"], again["N2"]))
+
+    def test_process_pool(self):
+        circ = rc_ladder(5)
+        values = {"R1": np.linspace(100, 1e3, 7), "C5": np.linspace(1e-9, 1e-8, 7)}
+        state_dict = {"frequency": np.logspace(2, 6, 9)}
+
+        serial = Sweep.parameter_sweep(circ, values, state_dict)
+        parallel = Sweep.parameter_sweep(circ, values, state_dict, chunk_size=20, workers=2)
+
+        for name in serial:
+            self.assertTrue(np.allclose(serial[name], parallel[name]), name)
+
+        frequencies = Sweep.parameter_sweep(circ, {}, state_dict, outputs=["N5"], workers=3)
+        self.assertTrue(np.allclose(circ.ac_sweep(state_dict)["N5"], frequencies["N5"][0]))
+
+        chunked = Sweep.parameter_sweep(circ, values, state_dict, chunk_size=4, workers=2)
+        for name in serial:
+            self.assertTrue(np.allclose(serial[name], chunked[name]), name)
+
+    def test_frequency_chunks(self):
+        plan = rc_ladder(40).compile()
+        budget = Sweep.DENSE_CHUNK_BYTES // (16 * plan.size ** 2)
+
+        samples, points = Sweep._get_chunks(plan, 3, 10 * budget, "dense", None)
+        self.assertEqual((1, budget), (samples, points))
+        self.assertEqual((2, 3), Sweep._get_chunks(plan, 5, 3, "dense", 7))
+
+        circ = rc_ladder(5)
+        values = {"R1": np.linspace(100, 1e3, 3)}
+        state_dict = {"frequency": np.logspace(2, 6, 7)}
+        whole = Sweep.parameter_sweep(circ, values, state_dict)
+        plan = circ.compile()
+        with unittest.mock.patch.object(plan, "get_params", wraps=plan.get_params) as get_params:
+            chunked = Sweep.parameter_sweep(circ, values, state_dict, chunk_size=3)
+        # no parameters are evaluated for more frequencies than one chunk holds
+        self.assertLessEqual(max(call.args[1] for call in get_params.call_args_list), 3)
+        for name in whole:
+            self.assertTrue(np.allclose(whole[name], chunked[name]), name)
+
+
+class SourceSweep(unittest.TestCase):
+    def setUp(self):
+        self.circ = rc_step_circuit()
+        CurrentSource("I1", self.circ.get_node("N0"), self.circ.get_node("N2"), 1e-3)
+        self.frequencies = np.logspace(1, 4, 5)
+
+    def test_matches_ac_sweep(self):
+        voltages = np.array([0, 1, 2, 3])
+        currents = np.array([1e-3, 0, 2e-3, 0])
+
+        for formulation in ("mna", "nodal"):
+            for solver in ("dense", "sparse"):
+                results = Sweep.source_sweep(self.circ, {"V1": voltages, "I1": currents},
+                                             {"frequency": self.frequencies}, solver=solver, formulation=formulation)
+                self.assertEqual((4, 5), results["N2"].shape)
+
+                for k in range(4):
+                    self.circ.get_component("V1").voltage = voltages[k]
+                    self.circ.get_component("I1").current = currents[k]
+                    expected = self.circ.ac_sweep({"frequency": self.frequencies})
+                    for name in expected:
+                        self.assertTrue(np.allclose(expected[name], results[name][k]))
+
+    def test_transfer_functions(self):
+        sources, transfer = Sweep.transfer_functions(self.circ, {"frequency": 100.0}, outputs=["N2"])
+        self.assertEqual(["V1", "I1"], sources)
+        self.assertEqual((2,), transfer["N2"].shape)
+
+        self.circ.get_component("I1").current = 0
+        self.assertAlmostEqual(self.circ.ac_sweep({"frequency": 100.0})["N2"], transfer["N2"][0])
+
+    def test_not_a_source(self):
+        self.assertRaises(CircuitError, Sweep.source_sweep, self.circ, {"R1": [1, 2]}, {"frequency": 100.0})
+        self.assertRaises(CircuitError, TransferFunction.transfer_function, self.circ, ["R1"])
+        self.assertRaises(CircuitError, Transient.transient, self.circ, 1e-6, 1e-5, waveforms={"R1": np.ones(11)})
+
+    def test_source_flag(self):
+        self.assertEqual(
+            ["V1", "I1"], [cmp.name for cmp in self.circ.components if cmp.is_source]
+        )
+        self.assertFalse(Component.is_source)
+
+
+class AdaptiveSweep(unittest.TestCase):
+    def resonator(self):
+        circ, n0, n1 = two_node_circuit()
+        n2 = Node("N2")
+        n3 = Node("N3")
+        circ.add_node(n2)
+        circ.add_node(n3)
+        VoltageSource("V1", n0, n1, 1)
+        Resistor("R1", n1, n2, 0.1)
+        Inductor("L1", n2, n3, 1e-3)
+        Capacitor("C1", n0, n3, 1e-6)
+
+        return circ
+
+    def test_refines_resonance(self):
+        circ = self.resonator()
+        resonance = 1 / (2 * pi * np.sqrt(1e-9))
+        peak = abs(circ.ac_sweep({"frequency": resonance})["N3"])
+
+        frequencies, results = Sweep.adaptive_sweep(circ, 10, 1e6, outputs=["N3"], tolerance=1e-3)
+        self.assertTrue(np.all(np.diff(frequencies) > 0))
+        self.assertEqual((len(frequencies),), results["R1"].shape)
+        self.assertAlmostEqual(10, frequencies[0])
+        self.assertAlmostEqual(1e6, frequencies[-1])
+        self.assertAlmostEqual(1, np.max(np.abs(results["N3"])) / peak, 4)
+
+        uniform = np.logspace(1, 6, len(frequencies))
+        self.assertLess(np.max(np.abs(circ.ac_sweep({"frequency": uniform})["N3"])) / peak, 0.9)
+
+    def test_point_budget(self):
+        circ = self.resonator()
+
+        frequencies, results = Sweep.adaptive_sweep(circ, 10, 1e6, tolerance=1e-6, max_points=100)
+        self.assertEqual(100, len(frequencies))
+        expected = circ.ac_sweep({"frequency": frequencies})
+        self.assertTrue(np.allclose(expected["N3"], results["N3"]))
+
+
+class StreamingSweep(unittest.TestCase):
+    def test_iter_sweep(self):
+        circ = rc_ladder(5)
+        frequencies = np.logspace(2, 6, 11)
+        expected = circ.ac_sweep({"frequency": frequencies})
+
+        blocks = list(Sweep.iter_sweep(circ, {"frequency": frequencies}, ["N5", "R1"], chunk_size=4))
+
+        self.assertEqual([4, 4, 3], [len(f) for f, block in blocks])
+        block = np.concatenate([block for f, block in blocks])
+        self.assertTrue(np.allclose(expected["N5"], block[:, 0]))
+        self.assertTrue(np.allclose(expected["R1"], block[:, 1]))
+
+    def test_write_sweep(self):
+        circ = rc_ladder(5)
+        frequencies = np.logspace(2, 6, 11)
+        expected = circ.ac_sweep({"frequency": frequencies})
+
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "sweep.npy")
+            Sweep.write_sweep(circ, path, {"frequency": frequencies}, chunk_size=3)
+
+            frequency, signals = Sweep.load_sweep(path, ["N3", "C2"])
+            self.assertTrue(np.array_equal(frequencies, frequency))
+            self.assertEqual(["N3", "C2"], list(signals))
+            self.assertTrue(np.allclose(expected["N3"], signals["N3"]))
+            self.assertTrue(np.allclose(expected["C2"], signals["C2"]))
+            del frequency, signals
+
+    def test_write_sweep_errors(self):
+        circ = rc_ladder(5)
+
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "sweep.npy")
+            self.assertRaises(ValueError, Sweep.write_sweep, circ, path, {"frequency": 1e3})
+
+            # the second chunk fails after the first one was written
+            self.assertRaises(
+                ZeroDivisionError, Sweep.write_sweep, circ, path, {"frequency": [1e3, 0]}, chunk_size=1
+            )
+            self.assertEqual([], os.listdir(directory))
+
+
+class SweepResults(unittest.TestCase):
+    def test_views(self):
+        circ = rc_ladder(3)
+        results = circ.ac_sweep({"frequency": np.logspace(2, 5, 4)})
+
+        self.assertIsInstance(results, SweepResult)
+        self.assertTrue(np.shares_memory(results.solutions, results["N2"]))
+        self.assertTrue(np.shares_memory(results.solutions, results[["N0", "N1", "N2"]]))
+        self.assertEqual((2, 4), results[["N3", "R1"]].shape)
+        self.assertIs(results.index, circ.ac_sweep({"frequency": 1e3}).index)
+
+    def test_helpers(self):
+        circ, n0, n1 = two_node_circuit()
+        VoltageSource("V0", n0, n1, 5)
+        Capacitor("C0", n0, n1, 1e-6)
+        results = circ.ac_sweep({"frequency": [1e3, 2e3]})
+
+        self.assertTrue(np.allclose(5, results.magnitude("N1")))
+        self.assertTrue(np.allclose(20 * np.log10(5), results.db(["N1"])))
+        self.assertTrue(np.allclose(-90, results.phase("V0", degrees=True)))
+
+    def test_to_dict(self):
+        circ, n0, n1 = two_node_circuit()
+        VoltageSource("V0", n0, n1, 5)
+        Resistor("R0", n0, n1, 1e3)
+        results = circ.ac_sweep({"frequency": 1e3}).to_dict()
+
+        self.assertIs(dict, type(results))
+        self.assertEqual({"N0": 0, "N1": 5, "V0": -5e-3, "R0": 5e-3}, results)
+
+
+class NetlistFormats(unittest.TestCase):
+    def assertSameCircuit(self, expected, actual):
+        self.assertEqual(expected.serialize(), actual.serialize())
+
+    def test_binary_round_trip(self):
+        circ = rc_ladder(10)
+        circ.name = "Ladder"
+        CurrentSource("I0", circ.get_node("GND"), circ.get_node("N3"), 1e-3)
+        Inductor("L0", circ.get_node("N4"), circ.get_node("N9"), 1e-3)
+
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "ladder")
+            Netlist.save_binary(circ, path)
+            self.assertRaises(FileExistsError, Netlist.save_binary, circ, path)
+
+            loaded = Circuit()
+            Netlist.load_binary(loaded, path)
+
+        self.assertSameCircuit(circ, loaded)
+
+    def test_binary_custom_component(self):
+        @register_component_type
+        class Conductance(Component):
+            has_admittance = True
+
+            def __init__(self, name, n_neg, n_pos, conductance):
+                super(Conductance, self).__init__(name, n_neg, n_pos)
+
+                self.conductance = conductance
+
+            def get_params(self, state_dict):
+                return self.conductance, -1, 0
+
+            def get_attributes(self):
+                return {"conductance": self.conductance}
+
+        circ = rc_ladder(4)
+        Conductance("G0", circ.get_node("GND"), circ.get_node("N2"), 1e-3)
+        Inductor("L0", circ.get_node("N1"), circ.get_node("N4"), 1e-3 + 1j)
+
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "ladder")
+            Netlist.save_binary(circ, path)
+            loaded = Circuit()
+            Netlist.load_binary(loaded, path)
+
+        self.assertSameCircuit(circ, loaded)
+        self.assertIs(Conductance, type(loaded.get_component("G0")))
+        self.assertEqual(1e-3 + 1j, loaded.get_component("L0").inductance)
+
+    def test_component_arrays(self):
+        circ, n0, n1 = two_node_circuit()
+        arrays = ([Resistor, Capacitor], ["R0", "C0"], [0, 1], [0, 0], [1, 1], [1e3, 1e-9])
+
+        self.assertRaises(CircuitError, circ.add_component_arrays, *arrays[:3], [0, 2], *arrays[4:])
+        self.assertRaises(NameError, circ.add_component_arrays, arrays[0], ["R0", "N1"], *arrays[2:])
+        self.assertRaises(TypeError, circ.add_component_arrays, arrays[0], arrays[1], [0.0, 1.0], *arrays[3:])
+        self.assertEqual(0, len(circ.components))
+
+        resistor, capacitor = circ.add_component_arrays(*arrays)
+        self.assertEqual(1e-9, capacitor.capacitance)
+        self.assertIs(n1, resistor.n_pos)
+
+    def test_stream_load(self):
+        circ = rc_ladder(50)
+
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "ladder.circ")
+            for pretty_printing in (True, False):
+                circ.save(path, overwrite=True, pretty_printing=pretty_printing)
+
+                loaded = Circuit()
+                read_size = Netlist.READ_SIZE
+                Netlist.READ_SIZE = 7
+                try:
+                    Netlist.stream_load(loaded, path, batch_size=16)
+                finally:
+                    Netlist.READ_SIZE = read_size
+
+                self.assertSameCircuit(circ, loaded)
+
+    def test_registry(self):
+        self.assertIs(Resistor, get_component_type("Resistor"))
+        self.assertRaises(CircuitError, get_component_type, "Circuit")
+        self.assertRaises(TypeError, register_component_type, Circuit)
+
+
+class ComponentStore(unittest.TestCase):
+    def test_views(self):
+        circ, n0, n1 = two_node_circuit()
+        resistor, source = circ.add_components([
+            {"Type": "Resistor", "Name": "R1", "Negative": "N0", "Positive": "N1", "Attributes": {"resistance": 1e3}},
+            {"Type": "VoltageSource", "Name": "V1", "Negative": "N0", "Positive": "N1", "Attributes": {"voltage": 5}}
+        ])
+
+        self.assertFalse(hasattr(resistor, "__dict__"))
+        self.assertIs(n1, resistor.n_pos)
+        self.assertEqual(["R1", "V1"], [cmp.name for cmp in n0.neg_cons])
+        self.assertEqual(1e3, circ._cmp_values[0])
+
+        resistor.resistance = 500
+        self.assertEqual(500, resistor.resistance)
+        source.voltage = 5j
+        self.assertEqual(5j, source.voltage)
+        self.assertEqual(500.0, resistor.resistance)
+        self.assertRaises(TypeError, setattr, resistor, "resistance", "1k")
+
+    def test_invalid_value(self):
+        circ, n0, n1 = two_node_circuit()
+        Resistor("R1", n0, n1, 1e3)
+
+        self.assertRaises(TypeError, Resistor, "R2", n0, n1, "1k")
+        self.assertEqual(["R1"], [cmp.name for cmp in circ.components])
+        self.assertFalse(circ.has_name("R2"))
+        self.assertEqual(1, len(circ._cmp_values))
+
+        Capacitor("C1", n0, n1, 1e-9 + 1j)
+        self.assertEqual(1e-9 + 1j, circ.get_component("C1").capacitance)
+        self.assertEqual(1e3, circ.get_component("R1").resistance)
+
+    def test_custom_component(self):
+        class Conductance(Component):
+            has_admittance = True
+
+            def __init__(self, name, n_neg, n_pos, conductance):
+                super(Conductance, self).__init__(name, n_neg, n_pos)
+
+                self.conductance = conductance
+
+            def get_params(self, state_dict):
+                return self.conductance, -1, 0
+
+            def get_attributes(self):
+                return {"conductance": self.conductance}
+
+        circ, n0, n1 = two_node_circuit()
+        VoltageSource("V1", n0, n1, 5)
+        Conductance("G1", n0, n1, 1e-3)
+
+        for formulation in ("mna", "nodal"):
+            results = circ.ac_sweep({"frequency": [1, 10]}, formulation=formulation)
+            self.assertTrue(np.allclose(5e-3, results["G1"]))
+
+
+class TransientAnalysis(unittest.TestCase):
+    def test_rc_step(self):
+        circ = rc_step_circuit()
+
+        for method, tolerance in (("backward_euler", 1e-3), ("trapezoidal", 1e-3)):
+            for formulation in ("mna", "nodal"):
+                times, results = Transient.transient(circ, 1e-6, 5e-3, method, formulation=formulation)
+                self.assertEqual(5001, len(times))
+                self.assertEqual(0, results["N2"][0])
+                self.assertTrue(np.allclose(1 - np.exp(-times[1:] / 1e-3), results["N2"][1:], atol=tolerance))
+                self.assertTrue(np.allclose(results["R1"], -results["C1"]))
+
+    def test_rl_step(self):
+        circ, n0, n1 = two_node_circuit()
+        n2 = Node("N2")
+        circ.add_node(n2)
+        VoltageSource("V1", n0, n1, 1)
+        Resistor("R1", n1, n2, 10)
+        Inductor("L1", n0, n2, 1e-3)
+
+        times, results = Transient.transient(circ, 1e-7, 5e-4, solver="sparse")
+        self.assertTrue(np.allclose(0.1 * (1 - np.exp(-times[1:] * 1e4)), results["L1"][1:], atol=1e-4))
+
+    def test_waveforms(self):
+        circ = rc_step_circuit()
+        times = np.arange(2001) * 1e-5
+
+        def sine(t):
+            return np.sin(2 * pi * 50 * t)
+
+        expected = Transient.transient(circ, 1e-5, 2e-2, waveforms={"V1": sine})[1]
+        sampled = Transient.transient(circ, 1e-5, 2e-2, waveforms={"V1": sine(times)})[1]
+        self.assertTrue(np.allclose(expected["N2"], sampled["N2"]))
+        self.assertTrue(np.allclose(sine(times[1:]), expected["N1"][1:]))
+
+        self.assertRaises(CircuitError, Transient.transient, circ, 1e-5, 2e-2, waveforms={"R1": sine})
+
+    def test_matches_ac_sweep(self):
+        circ = rc_step_circuit()
+        frequency = 1 / (2 * pi * 1e-3)
+        expected = circ.ac_sweep({"frequency": frequency})
+
+        def cosine(t):
+            return np.cos(2 * pi * frequency * t)
+
+        times, results = Transient.transient(circ, 1e-6, 2e-2, waveforms={"V1": cosine})
+        steady = times > 1.5e-2
+        for name in ("N2", "C1"):
+            phasor = complex(expected[name])
+            self.assertTrue(np.allclose(
+                (phasor * np.exp(2j * pi * frequency * times[steady])).real, results[name][steady],
+                atol=1e-4 * abs(phasor)
+            ), name)
+        self.assertAlmostEqual(-45, np.degrees(np.angle(complex(expected["N2"]))))
+
+    def test_write_transient(self):
+        circ = rc_step_circuit()
+        expected = Transient.transient(circ, 1e-6, 1e-3)[1]
+
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "step.npy")
+            self.assertEqual(1001, Transient.write_transient(circ, path, 1e-6, 1e-3, outputs=["N2"], chunk_size=64))
+
+            times, signals = Transient.load_transient(path)
+            self.assertEqual(["N2"], list(signals))
+            self.assertTrue(np.allclose(np.arange(1001) * 1e-6, times))
+            self.assertTrue(np.allclose(expected["N2"], signals["N2"]))
+            del signals
+
+
+class RationalTransferFunction(unittest.TestCase):
+    def test_matches_ac_sweep(self):
+        circ = rc_ladder(4)
+        Inductor("L0", circ.get_node("N4"), circ.get_node("N1"), 1e-3)
+        CurrentSource("I0", circ.get_node("GND"), circ.get_node("N2"), 1e-3)
+        frequencies = np.logspace(0, 6, 40)
+
+        transfer = TransferFunction.transfer_function(circ, outputs=["N4", "L0"])
+        self.assertEqual(("V0", "I0"), transfer.sources)
+        self.assertEqual(5, len(transfer.poles))
+
+        sources, expected = Sweep.transfer_functions(circ, {"frequency": frequencies}, outputs=["N4", "L0"])
+        results = transfer.evaluate(frequencies)
+        for name in ("N4", "L0"):
+            self.assertTrue(np.allclose(expected[name], results[name]))
+
+        self.assertEqual((2,), transfer.evaluate(1e3)["N4"].shape)
+
+    def test_resistive(self):
+        circ, n0, n1 = two_node_circuit()
+        VoltageSource("V0", n0, n1, 5)
+        Resistor("R0", n0, n1, 1e3)
+
+        transfer = TransferFunction.transfer_function(circ, ["V0"])
+        self.assertEqual(0, len(transfer.poles))
+        self.assertAlmostEqual(1e-3, transfer.evaluate(50)["R0"][0], 9)
+
+        self.assertRaises(CircuitError, TransferFunction.transfer_function, circ, ["R0"])
+
+
+class IncrementalSession(unittest.TestCase):
+    def assertMatchesSweep(self, circ, results, state_dict, formulation):
+        expected = circ.ac_sweep(state_dict, formulation=formulation)
+        for name in expected:
+            self.assertTrue(np.allclose(expected[name], results[name], rtol=1e-8, atol=1e-12))
+
+    def test_updates(self):
+        state_dict = {"frequency": np.array([10, 1e3, 1e5])}
+
+        for formulation in ("mna", "nodal"):
+            circ = rc_ladder(10)
+            session = Session(circ, state_dict, formulation=formulation, max_updates=4)
+            session.solve()
+
+            session.update("R3", 2e3)
+            session.update("C7", 4.7e-9)
+            self.assertMatchesSweep(circ, session.solve(), state_dict, formulation)
+            self.assertEqual(1, session.refactorizations)
+            self.assertLess(0, session.rank)
+
+            # editing a component again does not raise the rank of the update
+            circ.get_component("R3").resistance = 500
+            rank = session.rank
+            self.assertMatchesSweep(circ, session.solve(), state_dict, formulation)
+            self.assertEqual(rank, session.rank)
+
+            for i in range(1, 7):
+                session.update("R{}".format(i), 1.5e3)
+            self.assertMatchesSweep(circ, session.solve(), state_dict, formulation)
+            self.assertEqual(2, session.refactorizations)
+            self.assertEqual(0, session.rank)
+
+    def test_topology_change(self):
+        circ = rc_ladder(5)
+        session = Session(circ, {"frequency": 1e3})
+        session.solve()
+
+        Resistor("R0", circ.get_node("GND"), circ.get_node("N5"), 1e3)
+        self.assertMatchesSweep(circ, session.solve(), {"frequency": 1e3}, "mna")
+        self.assertEqual(2, session.refactorizations)
+
+        self.assertRaises(CircuitError, session.update, "N1", 1)
+
+
+class AdjointSensitivity(unittest.TestCase):
+    def assertMatchesDifferences(self, circ, results, state_dict, outputs):
+        for cmp in circ.components:
+            attr = type(cmp).value_name
+            value = getattr(cmp, attr)
+            step = value * 1e-6
+
+            setattr(cmp, attr, value + step)
+            high = circ.ac_sweep(state_dict)
+            setattr(cmp, attr, value - step)
+            low = circ.ac_sweep(state_dict)
+            setattr(cmp, attr, value)
+
+            for name in outputs:
+                expected = (high[name] - low[name]) / (2 * step)
+                scale = np.max(np.abs(high[name])) / value
+                self.assertTrue(np.allclose(expected, results[name][cmp.name], rtol=1e-4, atol=1e-6 * scale))
+
+    def test_finite_differences(self):
+        circ = rc_ladder(5)
+        Inductor("L0", circ.get_node("N2"), circ.get_node("N4"), 1e-3)
+        CurrentSource("I0", circ.get_node("GND"), circ.get_node("N3"), 1e-4)
+        state_dict = {"frequency": np.array([10, 1e3, 1e5])}
+
+        for solver in ("dense", "sparse"):
+            results = Sensitivity.sensitivities(circ, state_dict, ["N5", "L0"], solver=solver)
+            self.assertEqual((3,), results["N5"]["R1"].shape)
+            self.assertMatchesDifferences(circ, results, state_dict, ["N5", "L0"])
+
+    def test_scalar_frequency(self):
+        circ = rc_ladder(3)
+        results = Sensitivity.sensitivities(circ, {"frequency": 1e3}, ["N3"])
+
+        self.assertEqual(["V0", "R1", "C1", "R2", "C2", "R3", "C3"], list(results["N3"]))
+        self.assertEqual((), np.shape(results["N3"]["C2"]))
+        self.assertMatchesDifferences(circ, results, {"frequency": 1e3}, ["N3"])
+
+        # the response of a linear circuit is proportional to its only source
+        self.assertAlmostEqual(circ.ac_sweep({"frequency": 1e3})["N3"], results["N3"]["V0"])
+
+
+def filter_block():
+    circ = Circuit("filter")
+    for node in (Node("GND", True), Node("in"), Node("mid"), Node("out")):
+        circ.add_node(node)
+
+    Resistor("R1", circ.get_node("in"), circ.get_node("mid"), 100)
+    Capacitor("C1", circ.get_node("GND"), circ.get_node("mid"), 1e-7)
+    Inductor("L1", circ.get_node("mid"), circ.get_node("out"), 1e-3)
+    Resistor("R2", circ.get_node("GND"), circ.get_node("out"), 1e4)
+    CurrentSource("I1", circ.get_node("GND"), circ.get_node("mid"), 1e-4)
+
+    return circ
+
+
+class HierarchicalSubcircuits(unittest.TestCase):
+    def build(self, instances):
+        """
+        :return: a Hierarchy of a chain of filter blocks and the same circuit with the blocks flattened into it
+        """
+
+        subcircuit = Subcircuit(filter_block(), ["in", "out"])
+        top = Circuit()
+        flat = Circuit()
+        for circ in (top, flat):
+            circ.add_node(Node("GND", True))
+            for i in range(instances + 1):
+                circ.add_node(Node("N{}".format(i)))
+            VoltageSource("V0", circ.get_node("GND"), circ.get_node("N0"), 1)
+            Resistor("RL", circ.get_node("GND"), circ.get_node("N{}".format(instances)), 50)
+
+        hierarchy = Hierarchy(top)
+        for i in range(instances):
+            hierarchy.instantiate(
+                "X{}".format(i), subcircuit, [top.get_node("N{}".format(i)), top.get_node("N{}".format(i + 1))],
+                top.get_node("GND")
+            )
+
+            mapping = {"GND": "GND", "in": "N{}".format(i), "out": "N{}".format(i + 1)}
+            flat.add_node(Node("X{}.mid".format(i)))
+            mapping["mid"] = "X{}.mid".format(i)
+            for cmp in subcircuit.definition.components:
+                type(cmp)(
+                    "X{}.{}".format(i, cmp.name), flat.get_node(mapping[cmp.n_neg.name]),
+                    flat.get_node(mapping[cmp.n_pos.name]), **cmp.get_attributes()
+                )
+
+        return subcircuit, hierarchy, flat
+
+    def test_matches_flat(self):
+        subcircuit, hierarchy, flat = self.build(3)
+        state_dict = {"frequency": np.array([10, 1e3, 1e5])}
+
+        for solver in ("dense", "sparse"):
+            results = hierarchy.ac_sweep(state_dict, solver=solver)
+            expected = flat.ac_sweep(state_dict)
+            self.assertEqual(("GND", "N0", "N1", "N2", "N3", "V0", "RL"), results.names)
+            for name in results:
+                self.assertTrue(np.allclose(expected[name], results[name]))
+
+        # the reduction is shared by every instance and cached by frequency
+        self.assertEqual(3, subcircuit.reductions)
+        hierarchy.ac_sweep({"frequency": 1e3})
+        self.assertEqual(3, subcircuit.reductions)
+
+        subcircuit.definition.get_component("R1").resistance = 200
+        for i in range(3):
+            flat.get_component("X{}.R1".format(i)).resistance = 200
+        self.assertAlmostEqual(flat.ac_sweep({"frequency": 1e3})["N3"], hierarchy.ac_sweep({"frequency": 1e3})["N3"])
+        self.assertEqual(4, subcircuit.reductions)
+
+    def test_reduction_cache(self):
+        class Conductance(Component):
+            has_admittance = True
+
+            def __init__(self, name, n_neg, n_pos, conductance):
+                super(Conductance, self).__init__(name, n_neg, n_pos)
+
+                self.conductance = conductance
+
+            def get_params(self, state_dict):
+                return self.conductance, -1, 0
+
+            def get_attributes(self):
+                return {"conductance": self.conductance}
+
+        definition = filter_block()
+        conductance = Conductance("G1", definition.get_node("GND"), definition.get_node("out"), 1e-3)
+        subcircuit = Subcircuit(definition, ["in", "out"], max_reductions=2)
+
+        before = subcircuit.reduce({"frequency": 1e3})[0]
+        conductance.conductance = 2e-3
+        after = subcircuit.reduce({"frequency": 1e3})[0]
+        self.assertEqual(2, subcircuit.reductions)
+        self.assertAlmostEqual(1e-3, abs(after[1, 1] - before[1, 1]))
+
+        subcircuit.reduce({"frequency": np.array([1.0, 2.0, 3.0])})
+        self.assertEqual(2, len(subcircuit._cache))
+        subcircuit.reduce({"frequency": 3.0})
+        self.assertEqual(5, subcircuit.reductions)
+        subcircuit.reduce({"frequency": 1.0})
+        self.assertEqual(6, subcircuit.reductions)
+
+    def test_internal(self):
+        subcircuit, hierarchy, flat = self.build(2)
+        state_dict = {"frequency": np.array([10, 1e3, 1e5])}
+        expected = flat.ac_sweep(state_dict)
+
+        results = hierarchy.ac_sweep(state_dict)
+        internal = results.internal("X1")
+        self.assertIs(internal, results.internal("X1"))
+        self.assertTrue(np.allclose(expected["X1.mid"], internal["mid"]))
+        self.assertTrue(np.allclose(expected["N2"], internal["out"]))
+        self.assertTrue(np.allclose(expected["X1.L1"], internal["L1"]))
+
+        results = hierarchy.ac_sweep({"frequency": 1e3})
+        self.assertAlmostEqual(flat.ac_sweep({"frequency": 1e3})["X0.R1"], results.internal("X0")["R1"])
+        self.assertRaises(CircuitError, results.internal, "X2")
+
+    def test_floating_reference(self):
+        # a block between two nodes, none of them ground, with its reference on the output of the first block
+        subcircuit, hierarchy, flat = self.build(1)
+        hierarchy.instantiate("X1", subcircuit, [hierarchy.circuit.get_node("N0"), hierarchy.circuit.get_node("GND")],
+                              hierarchy.circuit.get_node("N1"))
+
+        flat.add_node(Node("X1.mid"))
+        mapping = {"GND": "N1", "in": "N0", "out": "GND", "mid": "X1.mid"}
+        for cmp in subcircuit.definition.components:
+            type(cmp)(
+                "X1.{}".format(cmp.name), flat.get_node(mapping[cmp.n_neg.name]),
+                flat.get_node(mapping[cmp.n_pos.name]), **cmp.get_attributes()
+            )
+
+        results = hierarchy.ac_sweep({"frequency": 1e3})
+        expected = flat.ac_sweep({"frequency": 1e3})
+        self.assertAlmostEqual(expected["N1"], results["N1"])
+        self.assertAlmostEqual(expected["X1.mid"], results.internal("X1")["mid"])
+
+    def test_validation(self):
+        subcircuit, hierarchy, flat = self.build(1)
+        top = hierarchy.circuit
+
+        self.assertRaises(CircuitError, Subcircuit, filter_block(), ["GND"])
+        self.assertRaises(CircuitError, Subcircuit, filter_block(), ["in", "in"])
+        self.assertRaises(NameError, hierarchy.instantiate, "X0", subcircuit, [top.get_node("N0")] * 2,
+                          top.get_node("GND"))
+        self.assertRaises(CircuitError, hierarchy.instantiate, "X1", subcircuit, [top.get_node("N0")],
+                          top.get_node("GND"))
+
+        # nodes which only connect to instances are not floating
+        top.add_node(Node("N2"))
+        self.assertRaises(CircuitError, hierarchy.ac_sweep, {"frequency": 1e3})
+        hierarchy.instantiate("X1", subcircuit, [top.get_node("N1"), top.get_node("N2")], top.get_node("GND"))
+        hierarchy.ac_sweep({"frequency": 1e3})
+
+
+class ResultCaching(unittest.TestCase):
+    def test_memory(self):
+        circ = rc_ladder(5)
+        cache = ResultCache(max_entries=2)
+
+        results = cache.ac_sweep(circ, {"frequency": np.array([1e3, 1e4])})
+        self.assertIs(results, cache.ac_sweep(circ, {"frequency": [1000, 10000]}))
+        self.assertEqual((1, 1), (cache.hits, cache.misses))
+        self.assertFalse(results.solutions.flags.writeable)
+        self.assertTrue(np.allclose(circ.ac_sweep({"frequency": np.array([1e3, 1e4])})["N5"], results["N5"]))
+
+        # equal circuits share their results, whatever their name
+        other = rc_ladder(5)
+        other.name = "other"
+        self.assertIs(results, cache.ac_sweep(other, {"frequency": np.array([1e3, 1e4])}))
+
+        cache.ac_sweep(circ, {"frequency": 1e3})
+        cache.ac_sweep(circ, {"frequency": 1e4})
+        self.assertEqual(2, len(cache))
+        cache.ac_sweep(circ, {"frequency": np.array([1e3, 1e4])})
+        self.assertEqual(4, cache.misses)
+
+    def test_invalidation(self):
+        circ = rc_ladder(5)
+        cache = ResultCache()
+        state_dict = {"frequency": 1e3}
+        fingerprints = {circ.fingerprint()}
+
+        def assertMiss():
+            misses = cache.misses
+            self.assertAlmostEqual(circ.ac_sweep(state_dict)["N5"], cache.ac_sweep(circ, state_dict)["N5"])
+            self.assertEqual(misses + 1, cache.misses)
+            self.assertNotIn(circ.fingerprint(), fingerprints)
+            fingerprints.add(circ.fingerprint())
+
+        cache.ac_sweep(circ, state_dict)
+        circ.get_component("R3").resistance = 2e3
+        assertMiss()
+        circ.get_component("C2").capacitance = 1e-6 + 0j
+        assertMiss()
+        circ.get_node("N1").ground = True
+        assertMiss()
+        Resistor("R0", circ.get_node("GND"), circ.get_node("N5"), 1e3)
+        assertMiss()
+        self.assertNotEqual(cache.key(circ, state_dict), cache.key(circ, state_dict, "nodal"))
+
+    def test_component_attributes(self):
+        class Conductance(Component):
+            has_admittance = True
+
+            def __init__(self, name, n_neg, n_pos, conductance):
+                super(Conductance, self).__init__(name, n_neg, n_pos)
+
+                self.conductance = conductance
+
+            def get_params(self, state_dict):
+                return self.conductance, -1, 0
+
+            def get_attributes(self):
+                return {"conductance": self.conductance}
+
+        circ = rc_ladder(3)
+        conductance = Conductance("G0", circ.get_node("GND"), circ.get_node("N3"), 1e-3)
+        cache = ResultCache()
+        cache.ac_sweep(circ, {"frequency": 1e3})
+
+        conductance.conductance = 2e-3
+        results = cache.ac_sweep(circ, {"frequency": 1e3})
+        self.assertEqual(2, cache.misses)
+        self.assertAlmostEqual(circ.ac_sweep({"frequency": 1e3})["G0"], results["G0"])
+
+    def test_directory(self):
+        circ = rc_ladder(5)
+        state_dict = {"frequency": np.logspace(2, 5, 50)}
+
+        with tempfile.TemporaryDirectory() as directory:
+            results = ResultCache(directory=directory).ac_sweep(circ, state_dict)
+
+            cache = ResultCache(directory=directory)
+            loaded = cache.ac_sweep(circ, state_dict)
+            self.assertEqual(1, cache.hits)
+            self.assertEqual(results.names, loaded.names)
+            self.assertTrue(np.array_equal(results["N3"], loaded["N3"]))
+            self.assertFalse(loaded.solutions.flags.writeable)
+
+            # every file takes more than half of max_bytes, so only the latest one is kept
+            [name] = os.listdir(directory)
+            size = os.path.getsize(os.path.join(directory, name))
+            cache = ResultCache(directory=directory, max_bytes=size * 3 // 2)
+            circ.get_component("R1").resistance = 2e3
+            cache.ac_sweep(circ, state_dict)
+            self.assertEqual(1, len([name for name in os.listdir(directory) if name.endswith(".npz")]))
+
+            # files the cache did not write are neither evicted nor cleared
+            np.savez(os.path.join(directory, "other.npz"), data=np.zeros(1 << 16))
+            cache.ac_sweep(circ, {"frequency": 1e3})
+            cache.clear()
+            self.assertEqual(0, len(cache))
+            self.assertEqual(["other.npz"], os.listdir(directory))
+
+
+class BenchmarkSuite(unittest.TestCase):
+    def test_generators(self):
+        for name, generator in Benchmarks.GENERATORS.items():
+            circ = generator(200)
+            self.assertLess(100, len(circ.components), name)
+            self.assertGreater(400, len(circ.components), name)
+            results = circ.ac_sweep({"frequency": 1e3})
+            self.assertTrue(np.all(np.isfinite(results.solutions)), name)
+
+    def test_run(self):
+        stream = io.StringIO()
+        records = Benchmarks.run(sizes=[10, 40], repeat=1, stream=stream)
+
+        lines = [json.loads(line) for line in stream.getvalue().splitlines()]
+        self.assertEqual(records, lines)
+        self.assertEqual(2 * len(Benchmarks.GENERATORS), len(lines))
+        for record in lines:
+            self.assertEqual(set(Benchmarks.STAGES), set(record["seconds"]))
+            self.assertLessEqual(0, min(record["seconds"].values()))
+
+        with tempfile.TemporaryDirectory() as directory:
+            paths = [os.path.join(directory, name) for name in ("old.jsonl", "new.jsonl")]
+            for path, scale in zip(paths, (1, 2)):
+                with open(path, "w") as f:
+                    for record in lines:
+                        record = dict(record, seconds=dict(record["seconds"], solve=scale * 1e-3))
+                        f.write(json.dumps(record) + "\n")
+
+            slower = Benchmarks.compare(paths[0], paths[1])
+            self.assertEqual(len(lines), len(slower))
+            self.assertEqual({"solve"}, {entry[2] for entry in slower})
+            self.assertEqual([], Benchmarks.compare(paths[1], paths[0]))
+
+    def test_compare_requires_output(self):
+        with unittest.mock.patch("sys.argv", ["Benchmarks.py", "--compare", "old.jsonl"]), \
+                unittest.mock.patch("sys.stderr", io.StringIO()) as stderr:
+            self.assertRaises(SystemExit, Benchmarks.main)
+        self.assertIn("--compare requires --output", stderr.getvalue())
+
+
+class ProfilingHooks(unittest.TestCase):
+    def test_profile(self):
+        circ = rc_ladder(10)
+        frequencies = np.array([1e2, 1e3, 1e4])
+
+        with Profiling.Profile(circ) as profile:
+            circ.ac_sweep({"frequency": frequencies})
+            circ.ac_sweep({"frequency": frequencies})
+        circ.ac_sweep({"frequency": frequencies})
+
+        self.assertEqual([], circ._hooks)
+        self.assertEqual(
+            {"compile", "topology", "params", "assemble", "solve", "expand", "results"}, set(profile.stats)
+        )
+        self.assertEqual(1, profile.stats["compile"]["calls"])
+        solve = profile.stats["solve"]
+        self.assertEqual(2, solve["calls"])
+        self.assertEqual(6, solve["systems"])
+        self.assertEqual(circ.compile().size, solve["max_size"])
+        self.assertEqual(circ.compile().nnz, solve["max_nnz"])
+        self.assertLess(0, solve["seconds"])
+        self.assertIn("solve", profile.report())
+
+    def test_blocks(self):
+        circ = rc_ladder(3)
+        n4 = Node("N4")
+        circ.add_node(n4)
+        Resistor("R4", circ.get_node("GND"), n4, 1e3)
+        CurrentSource("I4", circ.get_node("GND"), n4, 1e-3)
+
+        with Profiling.Profile(circ) as profile:
+            circ.ac_sweep({"frequency": 1e3}, workers=2)
+
+        self.assertEqual(2, profile.stats["solve"]["calls"])
+        self.assertEqual(1, profile.stats["results"]["calls"])
+
+    def test_condition(self):
+        circ = rc_ladder(5)
+        plan = circ.compile()
+        a, b, c = plan.get_params({"frequency": 1e3}, 1)
+        mrx = np.zeros([plan.size, plan.size], dtype=np.complex128)
+        mrx[plan.rows, plan.cols] = plan.scatter(a, b, c)[0][0]
+
+        with Profiling.Profile(circ, condition=True) as profile:
+            circ.ac_sweep({"frequency": 1e3})
+
+        estimate = profile.stats["condition"]["max_condition"]
+        exact = np.linalg.cond(mrx, 1)
+        self.assertLessEqual(estimate, exact * (1 + 1e-9))
+        self.assertLess(exact / 3, estimate)
+
+    def test_hooks(self):
+        circ = rc_ladder(2)
+        events = list()
+        circ.add_hook(events.append)
+        circ.ac_sweep({"frequency": 1e3})
+        circ.remove_hook(events.append)
+        circ.ac_sweep({"frequency": 1e3})
+
+        self.assertEqual(["topology", "compile", "params", "assemble", "solve", "expand", "results"],
+                         [event["phase"] for event in events])
+        self.assertRaises(TypeError, circ.add_hook, "hook")
+
+
+class JobServer(unittest.TestCase):
+    def setUp(self):
+        self.jobs = list()
+        for i in range(12):
+            circ = rc_ladder(4)
+            circ.get_component("R1").resistance = 1e3 * (i + 1)
+            circ.get_component("C4").capacitance = 1e-9 / (i + 1)
+            frequency = np.logspace(2, 6, 3 + i % 4)
+            expected = circ.ac_sweep({"frequency": frequency})
+            self.jobs.append(({"Id": i, "Circuit": circ.serialize(), "Frequency": frequency.tolist()}, expected))
+
+    def check(self, response, expected):
+        self.assertNotIn("Error", response)
+        self.assertEqual(set(expected.names), set(response["Results"]))
+        for name, result in response["Results"].items():
+            np.testing.assert_allclose(
+                np.array(result["Real"]) + 1j * np.array(result["Imag"]), expected[name], rtol=1e-9, atol=1e-15
+            )
+
+    def test_coalesce(self):
+        server = Server.JobServer()
+
+        async def run():
+            responses = await asyncio.gather(*[server.submit(request) for request, expected in self.jobs])
+            await server.close()
+            return responses
+
+        responses = asyncio.run(run())
+        for response, (request, expected) in zip(responses, self.jobs):
+            self.assertEqual(request["Id"], response["Id"])
+            self.check(response, expected)
+
+        self.assertEqual(len(self.jobs), server.jobs)
+        self.assertLess(server.batches, server.jobs)
+        self.assertEqual(1, len(server._templates))
+
+    def test_template_reuse(self):
+        server = Server.JobServer()
+
+        async def run():
+            responses = list()
+            templates = list()
+            for request, expected in self.jobs[:3]:
+                responses.append(await server.submit(request))
+                templates.append(list(server._templates.values()))
+            await server.close()
+            return responses, templates
+
+        responses, templates = asyncio.run(run())
+        for response, (request, expected) in zip(responses, self.jobs):
+            self.check(response, expected)
+
+        self.assertEqual(3, server.batches)
+        self.assertEqual(1, len(templates[0]))
+        self.assertEqual(templates[0], templates[1])
+        self.assertEqual(templates[0], templates[2])
+
+    def test_worker_errors(self):
+        server = Server.JobServer()
+        request, expected = self.jobs[0]
+
+        def fail(jobs):
+            raise IndexError("broken batch")
+
+        async def run():
+            server._solve_jobs = fail
+            failed = await server.submit(request)
+            del server._solve_jobs
+            solved = await server.submit(request)
+            await server.close()
+            return failed, solved
+
+        failed, solved = asyncio.run(run())
+        self.assertEqual(request["Id"], failed["Id"])
+        self.assertIn("broken batch", failed["Error"])
+        self.check(solved, expected)
+
+    def test_errors(self):
+        floating = rc_ladder(4).serialize()
+        floating["Nodes"].append({"Name": "N9", "Ground": False})
+        request, expected = self.jobs[0]
+        server = Server.JobServer()
+
+        async def run():
+            responses = await asyncio.gather(
+                server.submit(dict(request, Id="good")),
+                server.submit(dict(request, Id="bad", Circuit=floating)),
+                server.submit(dict(request, Id="outputs", Outputs=["N1", "missing"])),
+                server.submit({"Id": "malformed", "Frequency": 1})
+            )
+            await server.close()
+            return responses
+
+        good, bad, outputs, malformed = asyncio.run(run())
+        self.check(good, expected)
+        self.assertIn("Error", bad)
+        self.assertIn("missing", outputs["Error"])
+        self.assertEqual("malformed", malformed["Id"])
+        self.assertIn("Error", malformed)
+
+    def test_socket(self):
+        server = Server.JobServer()
+
+        async def run(path):
+            listener = await server.serve_unix(path)
+            reader, writer = await asyncio.open_unix_connection(path, limit=Server.MAX_LINE_BYTES)
+            for request, expected in self.jobs:
+                writer.write((json.dumps(request) + "\n").encode())
+            writer.write(b"not json\n[1, 2]\n3\n")
+            writer.write_eof()
+
+            responses = [json.loads(await reader.readline()) for _ in range(len(self.jobs) + 3)]
+            writer.close()
+            listener.close()
+            await listener.wait_closed()
+            await server.close()
+            return responses
+
+        with tempfile.TemporaryDirectory() as directory:
+            responses = asyncio.run(run(os.path.join(directory, "server.sock")))
+
+        errors = [response for response in responses if "Error" in response]
+        self.assertEqual(3, len(errors))
+        self.assertEqual([None] * 3, [error["Id"] for error in errors])
+        results = {response["Id"]: response for response in responses if "Error" not in response}
+        for request, expected in self.jobs:
+            self.check(results[request["Id"]], expected)
+
+
+class SpiceNetlists(unittest.TestCase):
+    deck = """RC low pass
+* a comment
+V1 in 0 DC 0 AC 1
+R1 in out 1k ; inline comment
+C1 out 0
++ 159.15nF
+L1 out mid 10uH
+R2 mid 0 1MEG
+I1 0 mid 2m
+.ac dec 10 1 1meg
+.end
+R9 in 0 1
+"""
+
+    def test_parse_values(self):
+        self.assertAlmostEqual(1e3, Spice.parse_value("1k"))
+        self.assertAlmostEqual(1e6, Spice.parse_value("1MEG"))
+        self.assertAlmostEqual(1e-5, Spice.parse_value("10uH"))
+        self.assertAlmostEqual(2.54e-5, Spice.parse_value("1mil"))
+        self.assertAlmostEqual(-1.5e-12, Spice.parse_value("-1.5p"))
+        self.assertRaises(ValueError, Spice.parse_value, "k")
+
+    def test_parse_deck(self):
+        circ = Circuit()
+        Spice.parse_spice(circ, self.deck)
+
+        self.assertEqual("RC low pass", circ.name)
+        self.assertEqual(["in", "0", "out", "mid"], [node.name for node in circ.nodes])
+        self.assertTrue(circ.get_node("0").ground)
+        self.assertEqual(["V1", "R1", "C1", "L1", "R2", "I1"], [cmp.name for cmp in circ.components])
+        self.assertAlmostEqual(159.15e-9, circ.get_component("C1").capacitance)
+        self.assertEqual(1, circ.get_component("V1").voltage)
+        self.assertEqual(2e-3, circ.get_component("I1").current)
+
+        capacitor = circ.get_component("C1")
+        self.assertEqual("0", capacitor.n_neg.name)
+        self.assertEqual("out", capacitor.n_pos.name)
+
+    def test_continuation(self):
+        single = "title\nV1 in 0 PULSE(0, 1, 0, 1n) AC(2)\nR1 in 0 1k\n"
+        continued = "title\nV1 in 0 PULSE(0, 1,\n+ 0, 1n) AC(2)\nR1 in 0 1k\n"
+        self.assertEqual([card[1] for card in Spice._cards(single)], [card[1] for card in Spice._cards(continued)])
+
+        for deck in (single, continued):
+            circ = Circuit()
+            Spice.parse_spice(circ, deck)
+            self.assertEqual(2, circ.get_component("V1").voltage)
+
+    def test_round_trip(self):
+        circ = Circuit()
+        Spice.parse_spice(circ, self.deck)
+
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "deck.cir")
+            Spice.save_spice(circ, path)
+
+            loaded = Circuit()
+            Spice.load_spice(loaded, path)
+
+        self.assertEqual(circ.serialize(), loaded.serialize())
+
+    def test_unsupported_card(self):
+        self.assertRaises(CircuitError, Spice.parse_spice, Circuit(), "title\nQ1 c b e model\n")
+
+
 if __name__ == '__main__':
     unittest.main()
@@ -1,8 +1,34 @@
 from Circuit import *
+from Sweep import load_sweep
 import numpy as np
 import matplotlib.pyplot as plt
 
 
+def plot_bode(path, names):
+    """
+    plots the magnitude and phase of signals from a sweep written by Sweep.write_sweep
+    only the requested signals are read from disk
+    :type path: str
+    :type names: list
+    :param path: the .npy file the sweep was written to
+    :param names: the node and component names to plot
+    """
+
+    frequency, signals = load_sweep(path, names)
+
+    fig, (magnitude, phase) = plt.subplots(2, 1, sharex=True)
+    for name in names:
+        magnitude.semilogx(frequency, 20 * np.log10(np.abs(signals[name])), label=name)
+        phase.semilogx(frequency, np.degrees(np.angle(signals[name])), label=name)
+
+    magnitude.set_ylabel("magnitude (dB)")
+    phase.set_ylabel("phase (deg)")
+    phase.set_xlabel("frequency (Hz)")
+    magnitude.legend()
+
+    return fig
+
+
 def main():
     return
 
@@ -11,11 +11,13 @@ def check_type(func):
 
 
 class Comparable(ABC):
+    __slots__ = ("id",)
+
     ID = 0
 
     def __init__(self):
-        self.id = self.ID
-        self.ID += 1
+        self.id = Comparable.ID
+        Comparable.ID += 1
 
     @check_type
     def __eq__(self, other):
@@ -0,0 +1,28 @@
+class ComponentValue(object):
+    """
+    descriptor storing the value attribute of a component, e.g. a resistance, in the value array of its circuit
+    """
+
+    def __set_name__(self, owner, name):
+        self.name = name
+
+    def __get__(self, cmp, owner=None):
+        if cmp is None:
+            return self
+
+        return cmp._circuit.get_value(cmp._index)
+
+    def __set__(self, cmp, value):
+        cmp._circuit.set_value(cmp._index, value)
+
+
+def is_array_backed(cls):
+    """
+    :type cls: type
+    :param cls: a Component subclass
+    :return: whether the components of cls are fully described by their row of the circuit's arrays, i.e. cls
+             keeps its value in a ComponentValue and has no per-instance __dict__
+    """
+
+    return cls.value_name is not None and cls.__dictoffset__ == 0 and \
+        isinstance(getattr(cls, cls.value_name, None), ComponentValue)
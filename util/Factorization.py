@@ -0,0 +1,167 @@
+import warnings
+import numpy as np
+from util import Solvers
+from util.Solvers import linalg, sparse, sparse_linalg
+
+
+class DenseFactorization(object):
+    """
+    an LU factorization of a dense matrix, falling back to an explicit inverse without scipy
+    """
+
+    def __init__(self, mrx):
+        """
+        :type mrx: np.ndarray
+        :param mrx: (N, N) matrix to be factorized
+        """
+
+        self.size = mrx.shape[0]
+        self.dtype = mrx.dtype
+
+        if linalg is None:
+            self.lu = None
+            self.inverse = np.linalg.inv(mrx)
+            return
+
+        with warnings.catch_warnings():
+            # an exactly singular matrix only warns, it is reported below
+            warnings.simplefilter("ignore")
+            self.lu = linalg.lu_factor(mrx)
+        if np.any(np.diagonal(self.lu[0]) == 0):
+            raise np.linalg.LinAlgError("Singular matrix")
+
+        # calling LAPACK directly skips the input checks of lu_solve, which dominate small solves
+        self.getrs, = linalg.get_lapack_funcs(("getrs",), (self.lu[0],))
+
+    def solve(self, rhs, trans=False):
+        """
+        :type trans: bool
+        :param rhs: (N,) right hand side or (N, K) right hand sides, one per column
+        :param trans: solve with the transposed matrix instead
+        :return: the solutions, shaped like rhs
+        """
+
+        if self.lu is None:
+            return (self.inverse.T if trans else self.inverse) @ rhs
+
+        solution, info = self.getrs(self.lu[0], self.lu[1], np.asarray(rhs, dtype=self.dtype), trans=1 if trans else 0)
+        if info != 0:
+            raise np.linalg.LinAlgError("illegal argument {} to getrs".format(-info))
+
+        return solution
+
+
+class SparseFactorization(object):
+    """
+    a sparse LU factorization of a matrix given in CSC order
+    """
+
+    def __init__(self, size, rows, cols, vals):
+        """
+        :type size: int
+        :param size: number of unknowns
+        :param rows: row index of each entry
+        :param cols: column index of each entry, sorted
+        :param vals: value of each entry
+        """
+
+        self.size = size
+        self.dtype = vals.dtype
+
+        indptr = np.searchsorted(cols, np.arange(size + 1))
+        mrx = sparse.csc_matrix((vals, rows, indptr), shape=(size, size))
+        try:
+            self.lu = sparse_linalg.splu(mrx)
+        except RuntimeError as e:
+            raise np.linalg.LinAlgError(str(e))
+
+    def solve(self, rhs, trans=False):
+        """
+        :type trans: bool
+        :param rhs: (N,) right hand side or (N, K) right hand sides, one per column
+        :param trans: solve with the transposed matrix instead
+        :return: the solutions, shaped like rhs
+        """
+
+        return self.lu.solve(np.asarray(rhs, dtype=np.result_type(self.dtype, rhs)), trans="T" if trans else "N")
+
+
+class BandedFactorization(object):
+    """
+    an LU factorization of a matrix whose reordered entries lie in a narrow band around the diagonal
+    """
+
+    def __init__(self, size, rows, cols, vals, ordering):
+        """
+        :type size: int
+        :type ordering: tuple
+        :param size: number of unknowns
+        :param rows: row index of each entry
+        :param cols: column index of each entry
+        :param vals: value of each entry
+        :param ordering: (order, lower, upper) from Solvers.reverse_cuthill_mckee
+        """
+
+        self.size = size
+        self.dtype = vals.dtype
+        self.order, self.lower, self.upper = ordering
+
+        # the factorization fills in lower additional superdiagonals, stored above the band
+        band = np.zeros([2 * self.lower + self.upper + 1, size], dtype=vals.dtype, order="F")
+        band[Solvers.band_positions(size, rows, cols, ordering, self.lower)] = vals
+
+        gbtrf, self.gbtrs = linalg.get_lapack_funcs(("gbtrf", "gbtrs"), (band,))
+        self.lu, self.pivots, info = gbtrf(band, self.lower, self.upper, overwrite_ab=True)
+        if info > 0:
+            raise np.linalg.LinAlgError("Singular matrix")
+
+    def solve(self, rhs, trans=False):
+        """
+        :type trans: bool
+        :param rhs: (N,) right hand side or (N, K) right hand sides, one per column
+        :param trans: solve with the transposed matrix instead
+        :return: the solutions, shaped like rhs
+        """
+
+        rhs = np.asarray(rhs, dtype=np.result_type(self.dtype, rhs))
+        solution, info = self.gbtrs(
+            self.lu, self.lower, self.upper, rhs[self.order], self.pivots, trans=1 if trans else 0
+        )
+        if info != 0:
+            raise np.linalg.LinAlgError("illegal argument {} to gbtrs".format(-info))
+
+        result = np.empty(solution.shape, dtype=solution.dtype)
+        result[self.order] = solution
+
+        return result
+
+
+def factorize(size, rows, cols, vals, solver="auto", ordering=None):
+    """
+    factorizes a single system given in COO form, so that it can be solved for many right hand sides
+    :type size: int
+    :type solver: str
+    :type ordering: tuple
+    :param size: number of unknowns
+    :param rows: row index of each entry
+    :param cols: column index of each entry, entries unique and sorted in CSC order
+    :param vals: value of each entry
+    :param solver: "dense", "sparse", "banded" or "auto", see Solvers.choose_solver
+    :param ordering: the (order, lower, upper) of the system from Solvers.reverse_cuthill_mckee, computed here when
+                     it is needed and not given
+    :return: a DenseFactorization, SparseFactorization or BandedFactorization
+    """
+
+    if ordering is None and Solvers.wants_ordering(size, solver):
+        ordering = Solvers.reverse_cuthill_mckee(size, rows, cols)
+
+    solver = Solvers.choose_solver(size, solver, ordering)
+    if solver == "banded":
+        return BandedFactorization(size, rows, cols, vals, ordering)
+    if solver == "sparse":
+        return SparseFactorization(size, rows, cols, vals)
+
+    mrx = np.zeros([size, size], dtype=vals.dtype)
+    mrx[rows, cols] = vals
+
+    return DenseFactorization(mrx)
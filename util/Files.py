@@ -0,0 +1,13 @@
+import os
+
+
+def sidecar_path(path, suffix=".json"):
+    """
+    :type path: str
+    :type suffix: str
+    :param path: the .npy file holding the results of an analysis
+    :param suffix: ending of the file stored next to it
+    :return: the path of the file stored next to path, e.g. <name>.json for <name>.npy
+    """
+
+    return os.path.splitext(path)[0] + suffix
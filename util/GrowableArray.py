@@ -0,0 +1,65 @@
+import numpy as np
+
+
+class GrowableArray(object):
+    """
+    a 1-D NumPy array with amortized O(1) appends, used as a column of the circuit's struct-of-arrays store
+    """
+
+    def __init__(self, dtype, capacity=16):
+        """
+        :param dtype: NumPy dtype of the elements
+        :type capacity: int
+        :param capacity: number of elements allocated up front
+        """
+
+        self.data = np.zeros(capacity, dtype=dtype)
+        self.size = 0
+
+    def __len__(self):
+        return self.size
+
+    def __getitem__(self, item):
+        return self.array[item]
+
+    def __setitem__(self, item, value):
+        self.array[item] = value
+
+    @property
+    def array(self):
+        """
+        :return: a view of the used part of the storage
+        """
+
+        return self.data[:self.size]
+
+    def reserve(self, capacity):
+        if capacity > len(self.data):
+            data = np.zeros(max(capacity, 2 * len(self.data)), dtype=self.data.dtype)
+            data[:self.size] = self.array
+            self.data = data
+
+    def append(self, value):
+        self.reserve(self.size + 1)
+        self.data[self.size] = value
+        self.size += 1
+
+    def extend(self, values):
+        values = np.asarray(values)
+        self.reserve(self.size + len(values))
+        self.data[self.size:self.size + len(values)] = values
+        self.size += len(values)
+
+    def truncate(self, size):
+        """
+        drops every element after the first size
+        """
+
+        self.size = min(self.size, size)
+
+    def astype(self, dtype):
+        """
+        changes the dtype of the storage in place, e.g. to hold complex values
+        """
+
+        self.data = self.data.astype(dtype)
@@ -0,0 +1,192 @@
+import time
+import threading
+import numpy as np
+from util.Solvers import sparse, sparse_linalg
+
+
+class Phase(object):
+    """
+    times one phase of an analysis and reports it to every hook as an event, a dictionary holding the name of the
+    phase under "phase", its wall-clock time under "seconds" and the counters of the phase
+    """
+
+    __slots__ = ("hooks", "name", "counters", "start")
+
+    def __init__(self, hooks, name, counters):
+        """
+        :type hooks: list
+        :type name: str
+        :type counters: dict
+        :param hooks: the callables receiving the event
+        :param name: name of the phase
+        :param counters: numbers describing the work of the phase, e.g. the size of the system
+        """
+
+        self.hooks = hooks
+        self.name = name
+        self.counters = counters
+        self.start = None
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        if exc_type is not None:
+            return
+
+        event = dict(self.counters, phase=self.name, seconds=time.perf_counter() - self.start)
+        for hook in list(self.hooks):
+            hook(event)
+
+    def set(self, **counters):
+        """
+        adds counters which are only known once the phase ran
+        """
+
+        self.counters.update(counters)
+
+
+class _Disabled(object):
+    """
+    the phase of analyses without hooks, which does nothing
+    """
+
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        return
+
+    def set(self, **counters):
+        return
+
+
+DISABLED = _Disabled()
+
+
+def phase(hooks, name, **counters):
+    """
+    :type hooks: list
+    :type name: str
+    :param hooks: the hooks of a circuit, see Circuit.add_hook
+    :param name: name of the phase
+    :param counters: numbers describing the work of the phase
+    :return: a context manager timing the phase, which costs one call when there are no hooks
+    """
+
+    if not hooks:
+        return DISABLED
+
+    return Phase(hooks, name, counters)
+
+
+def wants_condition(hooks):
+    """
+    :return: whether any of hooks asks for the condition numbers of the solved systems, which are expensive
+    """
+
+    return any(getattr(hook, "condition", False) for hook in hooks)
+
+
+def estimate_condition(size, rows, cols, vals):
+    """
+    estimates the 1-norm condition number of every stacked system, from a sparse factorization and the estimator of
+    Higham and Tisseur with scipy, or exactly from a dense matrix without it
+    :type size: int
+    :param size: number of unknowns of each system
+    :param rows: row index of each entry
+    :param cols: column index of each entry, sorted in CSC order
+    :param vals: (F, K) values of each entry for each system
+    :return: (F,) array of condition numbers, inf for singular systems
+    """
+
+    conditions = np.empty(vals.shape[0])
+    indptr = np.searchsorted(cols, np.arange(size + 1))
+
+    for i in range(vals.shape[0]):
+        if size == 0:
+            conditions[i] = 1
+            continue
+
+        if sparse is None:
+            mrx = np.zeros([size, size], dtype=vals.dtype)
+            mrx[rows, cols] = vals[i]
+            conditions[i] = np.linalg.cond(mrx, 1)
+            continue
+
+        mrx = sparse.csc_matrix((vals[i], rows, indptr), shape=(size, size))
+        try:
+            lu = sparse_linalg.splu(mrx)
+        except RuntimeError:
+            conditions[i] = np.inf
+            continue
+
+        inverse = sparse_linalg.LinearOperator(
+            (size, size), matvec=lu.solve, rmatvec=lambda x, lu=lu: lu.solve(x, trans="H"), dtype=mrx.dtype
+        )
+        conditions[i] = sparse_linalg.onenormest(mrx) * sparse_linalg.onenormest(inverse)
+
+    return conditions
+
+
+class Profile(object):
+    """
+    aggregates the events of the analyses of circuits
+
+    Used as a context manager, the profile is registered as a hook of the given circuits and removed on exit. For
+    every phase, stats holds the number of calls, the total seconds and for every counter its sum and, under
+    "max_" + name, its largest value, e.g. the number of systems solved and the largest system size.
+    """
+
+    def __init__(self, *circuits, condition=False):
+        """
+        :type condition: bool
+        :param circuits: the circuits to be profiled while the profile is entered
+        :param condition: estimate the condition number of every solved system, which is about as expensive as the
+                          solve itself
+        """
+
+        self.circuits = circuits
+        self.condition = condition
+        self.stats = dict()
+
+        # blocks of a circuit may be solved by several threads at once
+        self._lock = threading.Lock()
+
+    def __enter__(self):
+        for circuit in self.circuits:
+            circuit.add_hook(self)
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        for circuit in self.circuits:
+            circuit.remove_hook(self)
+
+    def __call__(self, event):
+        with self._lock:
+            stats = self.stats.setdefault(event["phase"], {"calls": 0, "seconds": 0.0})
+            stats["calls"] += 1
+            stats["seconds"] += event["seconds"]
+
+            for name, value in event.items():
+                if name in ("phase", "seconds"):
+                    continue
+                stats[name] = stats.get(name, 0) + value
+                stats["max_" + name] = max(stats.get("max_" + name, value), value)
+
+    def clear(self):
+        self.stats = dict()
+
+    def report(self):
+        """
+        :return: a table of the phases, slowest first
+        """
+
+        lines = ["{:<12}{:>8}{:>12}".format("phase", "calls", "seconds")]
+        for name, stats in sorted(self.stats.items(), key=lambda item: -item[1]["seconds"]):
+            lines.append("{:<12}{:>8}{:>12.6f}".format(name, stats["calls"], stats["seconds"]))
+
+        return "\n".join(lines)
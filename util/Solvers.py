@@ -0,0 +1,195 @@
+import numpy as np
+
+try:
+    import scipy.linalg as linalg
+    import scipy.sparse as sparse
+    import scipy.sparse.linalg as sparse_linalg
+    import scipy.sparse.csgraph as csgraph
+except ImportError:
+    linalg = None
+    sparse = None
+    sparse_linalg = None
+    csgraph = None
+
+
+# systems with more unknowns than this are solved with the sparse backend when solver="auto"
+SPARSE_THRESHOLD = 256
+
+# large systems whose reordered entries lie at most this far from the diagonal use the banded backend with "auto"
+BANDED_THRESHOLD = 16
+
+SOLVERS = ("auto", "dense", "sparse", "banded")
+
+
+def has_sparse():
+    return sparse is not None
+
+
+def choose_solver(size, solver="auto", ordering=None):
+    """
+    resolves the solver name used for a system of the given size
+    :type size: int
+    :type solver: str
+    :type ordering: tuple
+    :param size: number of unknowns in the system
+    :param solver: one of "auto", "dense", "sparse" or "banded"
+    :param ordering: the (order, lower, upper) of the system from reverse_cuthill_mckee, if known; "auto" only
+                     picks the banded solver when it is given
+    :return: "dense", "sparse" or "banded"
+    """
+
+    if solver not in SOLVERS:
+        raise ValueError("unknown solver {}, expected one of {}".format(solver, SOLVERS))
+
+    if solver in ("sparse", "banded") and not has_sparse():
+        raise ImportError("the {} solver requires scipy".format(solver))
+
+    if solver == "auto":
+        if not has_sparse() or size <= SPARSE_THRESHOLD:
+            return "dense"
+        if ordering is not None and max(ordering[1], ordering[2]) <= BANDED_THRESHOLD:
+            return "banded"
+        return "sparse"
+
+    return solver
+
+
+def wants_ordering(size, solver="auto"):
+    """
+    :return: whether choose_solver may pick the banded solver, i.e. whether the ordering is worth computing
+    """
+
+    return has_sparse() and (solver == "banded" or (solver == "auto" and size > SPARSE_THRESHOLD))
+
+
+def reverse_cuthill_mckee(size, rows, cols):
+    """
+    orders the unknowns of a system with the reverse Cuthill-McKee algorithm over the graph of its entries, which
+    gathers the entries of chain-like circuits, e.g. ladders, into a narrow band around the diagonal
+    :type size: int
+    :param size: number of unknowns
+    :param rows: row index of each entry
+    :param cols: column index of each entry
+    :return: (order, lower, upper) where order[k] is the unknown placed k-th, and lower and upper are the number of
+             sub- and superdiagonals holding entries once reordered
+    """
+
+    if size == 0:
+        # csgraph cannot order an empty graph
+        return np.zeros(0, dtype=np.int64), 0, 0
+
+    graph = sparse.csr_matrix((np.ones(len(rows)), (rows, cols)), shape=(size, size))
+    order = csgraph.reverse_cuthill_mckee((graph + graph.T).tocsr(), symmetric_mode=True).astype(np.int64)
+
+    position = np.empty(size, dtype=np.int64)
+    position[order] = np.arange(size)
+    offset = position[rows] - position[cols]
+
+    return order, int(max(np.max(offset, initial=0), 0)), int(max(-np.min(offset, initial=0), 0))
+
+
+def band_positions(size, rows, cols, ordering, extra=0):
+    """
+    :param ordering: (order, lower, upper) from reverse_cuthill_mckee
+    :param extra: number of additional rows above the band, LAPACK factorizations need lower of them
+    :return: (band row, band column) of each entry in the LAPACK band storage of the reordered system
+    """
+
+    order, lower, upper = ordering
+    position = np.empty(size, dtype=np.int64)
+    position[order] = np.arange(size)
+
+    return extra + upper + position[rows] - position[cols], position[cols]
+
+
+def solve_dense(size, rows, cols, vals, rhs):
+    """
+    solves the stacked systems with a single batched dense LU
+    :return: (F, N) or (F, N, R) array of solutions, shaped like rhs
+    """
+
+    mrx = np.zeros([rhs.shape[0], size, size], dtype=np.result_type(vals, rhs))
+    mrx[:, rows, cols] = vals
+
+    if rhs.ndim == 3:
+        return np.linalg.solve(mrx, rhs)
+
+    return np.linalg.solve(mrx, rhs[..., np.newaxis])[..., 0]
+
+
+def solve_sparse(size, rows, cols, vals, rhs):
+    """
+    solves each of the stacked systems with a sparse LU factorization
+    :return: (F, N) or (F, N, R) array of solutions, shaped like rhs
+    """
+
+    indptr = np.searchsorted(cols, np.arange(size + 1))
+    solutions = np.empty(rhs.shape, dtype=np.result_type(vals, rhs))
+
+    for i in range(rhs.shape[0]):
+        mrx = sparse.csc_matrix((vals[i], rows, indptr), shape=(size, size))
+        try:
+            solutions[i] = sparse_linalg.splu(mrx).solve(rhs[i])
+        except RuntimeError as e:
+            raise np.linalg.LinAlgError(str(e))
+
+    return solutions
+
+
+def solve_banded(size, rows, cols, vals, rhs, ordering):
+    """
+    solves each of the stacked systems as a banded system, after reordering its unknowns
+    the cost of every solve is linear in size for a fixed bandwidth
+    :param ordering: (order, lower, upper) from reverse_cuthill_mckee
+    :return: (F, N) or (F, N, R) array of solutions, shaped like rhs
+    """
+
+    order, lower, upper = ordering
+    dtype = np.result_type(vals, rhs)
+    band_rows, band_cols = band_positions(size, rows, cols, ordering, lower)
+    gbsv, = linalg.get_lapack_funcs(("gbsv",), (np.zeros(0, dtype=dtype),))
+    solutions = np.empty(rhs.shape, dtype=dtype)
+
+    for i in range(rhs.shape[0]):
+        # LAPACK works on Fortran ordered storage in place, with room for the fill-in of the pivoting
+        band = np.zeros([2 * lower + upper + 1, size], dtype=dtype, order="F")
+        band[band_rows, band_cols] = vals[i]
+        solution, info = gbsv(lower, upper, band, rhs[i, order].astype(dtype), overwrite_ab=True, overwrite_b=True)[2:]
+        if info > 0:
+            raise np.linalg.LinAlgError("Singular matrix")
+        solutions[i, order] = solution
+
+    return solutions
+
+
+def solve(size, rows, cols, vals, rhs, solver="auto", ordering=None):
+    """
+    solves F stacked linear systems given in COO form
+    :type size: int
+    :type solver: str
+    :type ordering: tuple
+    :param size: number of unknowns in each system
+    :param rows: row index of each entry
+    :param cols: column index of each entry, entries must be unique and sorted in column-major (CSC) order
+    :param vals: (F, K) values of each entry for each system
+    :param rhs: (F, N) right hand side of each system, or (F, N, R) to solve R right hand sides with a single
+                factorization of each system
+    :param solver: one of "auto", "dense", "sparse" or "banded"
+    :param ordering: the (order, lower, upper) of the system from reverse_cuthill_mckee, computed here when it is
+                     needed and not given
+    :return: (F, N) or (F, N, R) array of solutions, shaped like rhs
+    """
+
+    if size == 0:
+        return np.zeros(rhs.shape, dtype=np.result_type(vals, rhs))
+
+    if ordering is None and wants_ordering(size, solver):
+        ordering = reverse_cuthill_mckee(size, rows, cols)
+
+    solver = choose_solver(size, solver, ordering)
+    if solver == "banded":
+        return solve_banded(size, rows, cols, vals, rhs, ordering)
+    if solver == "sparse":
+        return solve_sparse(size, rows, cols, vals, rhs)
+
+    return solve_dense(size, rows, cols, vals, rhs)
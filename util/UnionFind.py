@@ -0,0 +1,46 @@
+class UnionFind(object):
+    """
+    disjoint sets over the integers [0, size) with path halving and union by size
+    """
+
+    def __init__(self, size):
+        """
+        :type size: int
+        :param size: number of elements
+        """
+
+        self.parent = list(range(size))
+        self.count = [1] * size
+
+    def find(self, i):
+        """
+        :type i: int
+        :return: the representative of the set containing i
+        """
+
+        parent = self.parent
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+
+        return i
+
+    def union(self, i, j):
+        """
+        merges the sets containing i and j
+        :type i: int
+        :type j: int
+        :return: the representative of the merged set
+        """
+
+        i = self.find(i)
+        j = self.find(j)
+        if i == j:
+            return i
+
+        if self.count[i] < self.count[j]:
+            i, j = j, i
+        self.parent[j] = i
+        self.count[i] += self.count[j]
+
+        return i